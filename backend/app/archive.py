@@ -0,0 +1,456 @@
+from collections import defaultdict
+from datetime import date, time, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+import csv
+import io
+import json
+from sqlalchemy import insert, or_, select
+from sqlalchemy.orm import Session
+from . import changes, models, templates
+from .holidays import merge_holidays
+
+# Tunniplaanide eksport ja import. Eksport on generaatorite ahel, mis loeb
+# andmebaasist partiidena (yield_per) ja kirjutab väljundisse tükkhaaval,
+# seega mälukasutus ei sõltu arhiivi suurusest. Import loeb NDJSON faili
+# rida realt ja lisab read partiidena. Kooliülesed andmed (helinad, pühad,
+# mallid) eksporditakse ja imporditakse ainult kasutaja kooli piires.
+
+ARCHIVE_VERSION = 1
+BATCH_SIZE = 500
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    "json": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ics": ("text/calendar; charset=utf-8", "ics"),
+}
+
+class ArchiveImportError(ValueError):
+    pass
+
+def _chunked(pieces: Iterable[str]) -> Iterator[bytes]:
+    # Väikesed read koondatakse suuremateks tükkideks
+    buffer: List[str] = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= OUTPUT_CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+def _rows(db: Session, statement):
+    return db.execute(statement.execution_options(yield_per=BATCH_SIZE))
+
+def _events_statement(user_id: int):
+    return select(
+        models.TimetableEvent.id,
+        models.TimetableEvent.timetable_id,
+        models.TimetableEvent.event_name,
+        models.TimetableEvent.event_time,
+        models.TimetableEvent.sound_id,
+        models.TimetableEvent.template_instance_id,
+        models.TimetableEvent.is_template_base,
+    ).join(models.Timetable).where(
+        models.Timetable.user_id == user_id
+    ).order_by(models.TimetableEvent.timetable_id, models.TimetableEvent.event_time)
+
+def _timetables_statement(user_id: int):
+    return select(
+        models.Timetable.id,
+        models.Timetable.name,
+        models.Timetable.valid_from,
+        models.Timetable.valid_until,
+        models.Timetable.weekdays,
+    ).where(models.Timetable.user_id == user_id).order_by(models.Timetable.id)
+
+# JSON (NDJSON): üks kirje rea kohta, vanemad enne lapsi
+
+def _json_line(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+def export_json(db: Session, tenant_id: int, user_id: int) -> Iterator[str]:
+    yield _json_line({"type": "lible-export", "version": ARCHIVE_VERSION})
+    for row in _rows(db, select(models.Sound.id, models.Sound.name, models.Sound.content_hash).where(
+        models.Sound.tenant_id == tenant_id
+    ).order_by(models.Sound.id)):
+        yield _json_line({"type": "sound", **row._asdict()})
+    for row in _rows(db, select(models.Holiday.valid_from, models.Holiday.valid_until).where(
+        models.Holiday.tenant_id == tenant_id
+    ).order_by(models.Holiday.valid_from)):
+        yield _json_line({"type": "holiday", **row._asdict()})
+    for row in _rows(db, select(
+        models.EventTemplate.id, models.EventTemplate.name, models.EventTemplate.description
+    ).where(models.EventTemplate.tenant_id == tenant_id).order_by(models.EventTemplate.id)):
+        yield _json_line({"type": "template", **row._asdict()})
+    for row in _rows(db, select(
+        models.EventTemplateItem.template_id,
+        models.EventTemplateItem.offset_minutes,
+        models.EventTemplateItem.event_name,
+        models.EventTemplateItem.sound_id,
+    ).where(models.EventTemplateItem.tenant_id == tenant_id).order_by(
+        models.EventTemplateItem.template_id, models.EventTemplateItem.offset_minutes
+    )):
+        yield _json_line({"type": "template_item", **row._asdict()})
+    for row in _rows(db, _timetables_statement(user_id)):
+        yield _json_line({"type": "timetable", **row._asdict()})
+    for row in _rows(db, _events_statement(user_id)):
+        record = row._asdict()
+        del record["id"]
+        yield _json_line({"type": "event", **record})
+
+# CSV: üks rida sündmuse kohta koos tunniplaani ja helina nimega
+
+CSV_COLUMNS = ["timetable", "valid_from", "valid_until", "weekdays", "event_time", "event_name", "sound"]
+
+def export_csv(db: Session, tenant_id: int, user_id: int) -> Iterator[str]:
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def flush() -> str:
+        text = out.getvalue()
+        out.seek(0)
+        out.truncate()
+        return text
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    statement = select(
+        models.Timetable.name.label("timetable"),
+        models.Timetable.valid_from,
+        models.Timetable.valid_until,
+        models.Timetable.weekdays,
+        models.TimetableEvent.event_time,
+        models.TimetableEvent.event_name,
+        models.Sound.name.label("sound"),
+    ).select_from(models.TimetableEvent).join(models.Timetable).outerjoin(
+        models.Sound, models.Sound.id == models.TimetableEvent.sound_id
+    ).where(models.Timetable.user_id == user_id).order_by(
+        models.Timetable.id, models.TimetableEvent.event_time
+    )
+    for row in _rows(db, statement):
+        writer.writerow([
+            row.timetable,
+            row.valid_from.isoformat() if row.valid_from else "",
+            row.valid_until.isoformat() if row.valid_until else "",
+            row.weekdays,
+            row.event_time.strftime("%H:%M") if row.event_time else "",
+            row.event_name,
+            row.sound or "",
+        ])
+        yield flush()
+
+# ICS: pühad kogu päeva sündmustena, tunniplaani sündmused iganädalaste
+# korduvate sündmustena
+
+ICS_WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]  # bitid 1, 2, 4, ... 64
+
+def _ics_text(value: Optional[str]) -> str:
+    value = value or ""
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _first_matching_day(start: date, weekdays: int) -> Optional[date]:
+    for offset in range(7):
+        day = start + timedelta(days=offset)
+        if weekdays & (1 << day.weekday()):
+            return day
+    return None
+
+def export_ics(db: Session, tenant_id: int, user_id: int) -> Iterator[str]:
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Lible//Koolikell//ET\r\n"
+    for row in _rows(db, select(
+        models.Holiday.id, models.Holiday.valid_from, models.Holiday.valid_until
+    ).where(models.Holiday.tenant_id == tenant_id).order_by(models.Holiday.valid_from)):
+        yield (
+            "BEGIN:VEVENT\r\n"
+            f"UID:holiday-{row.id}@lible\r\n"
+            f"DTSTART;VALUE=DATE:{row.valid_from:%Y%m%d}\r\n"
+            f"DTEND;VALUE=DATE:{row.valid_until + timedelta(days=1):%Y%m%d}\r\n"
+            "SUMMARY:Vaheaeg\r\n"
+            "END:VEVENT\r\n"
+        )
+    timetables = {row.id: row for row in _rows(db, _timetables_statement(user_id))}
+    for row in _rows(db, _events_statement(user_id)):
+        timetable = timetables.get(row.timetable_id)
+        if timetable is None or timetable.valid_from is None or row.event_time is None:
+            continue
+        first = _first_matching_day(timetable.valid_from, timetable.weekdays or 0)
+        if first is None:
+            continue
+        byday = ",".join(code for bit, code in enumerate(ICS_WEEKDAYS) if timetable.weekdays & (1 << bit))
+        rule = f"RRULE:FREQ=WEEKLY;BYDAY={byday}"
+        if timetable.valid_until:
+            rule += f";UNTIL={timetable.valid_until:%Y%m%d}T235959"
+        yield (
+            "BEGIN:VEVENT\r\n"
+            f"UID:event-{row.id}@lible\r\n"
+            f"DTSTART:{first:%Y%m%d}T{row.event_time:%H%M%S}\r\n"
+            f"{rule}\r\n"
+            f"SUMMARY:{_ics_text(row.event_name)}\r\n"
+            f"CATEGORIES:{_ics_text(timetable.name)}\r\n"
+            "END:VEVENT\r\n"
+        )
+    yield "END:VCALENDAR\r\n"
+
+EXPORTERS = {
+    "json": export_json,
+    "csv": export_csv,
+    "ics": export_ics,
+}
+
+def stream_export(session_factory, tenant_id: int, user_id: int, export_format: str) -> Iterator[bytes]:
+    # Generaator kasutab oma sessiooni, sest vastust voogedastatakse alles
+    # pärast päringu käsitleja lõppu
+    db = session_factory()
+    try:
+        yield from _chunked(EXPORTERS[export_format](db, tenant_id, user_id))
+    finally:
+        db.close()
+
+# Import (NDJSON)
+
+RECORD_ORDER = ["sound", "holiday", "template", "template_item", "timetable", "event"]
+
+def _parse_time(value: str) -> time:
+    return time.fromisoformat(value)
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(value) if value else None
+
+def _overlaps(a: tuple, b: tuple) -> bool:
+    # (nimi, valid_from, valid_until, weekdays); kehtivusajaga ja vaikimisi
+    # tunniplaanid on eri prioriteediga ega kattu omavahel
+    _, a_from, a_until, a_weekdays = a
+    _, b_from, b_until, b_weekdays = b
+    if not a_weekdays & b_weekdays:
+        return False
+    if a_until is None or b_until is None:
+        return a_until is None and b_until is None
+    return b_from <= a_until and b_until >= a_from
+
+class _Importer:
+    def __init__(self, db: Session, tenant_id: int, user_id: int):
+        self.db = db
+        self.tenant_id = tenant_id
+        self.user_id = user_id
+        self.sounds: Dict[int, int] = {}
+        self.sound_names: Dict[int, str] = {}
+        self.templates: Dict[int, int] = {}
+        self.timetables: Dict[int, int] = {}
+        self.instances: Dict[int, int] = {}
+        self.holidays: List[tuple] = []
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.pending: List[dict] = []
+        self.pending_type: Optional[str] = None
+        self.line = 0
+
+    def error(self, message: str) -> ArchiveImportError:
+        return ArchiveImportError(f"Rida {self.line}: {message}")
+
+    def add(self, record: dict) -> None:
+        record_type = record.get("type")
+        if record_type not in RECORD_ORDER:
+            raise self.error(f"tundmatu kirje tüüp '{record_type}'")
+        if self.pending_type is not None and record_type != self.pending_type:
+            if RECORD_ORDER.index(record_type) < RECORD_ORDER.index(self.pending_type):
+                raise self.error("kirjed on vales järjekorras")
+            self.flush()
+        self.pending_type = record_type
+        self.pending.append(record)
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        records, self.pending = self.pending, []
+        if records:
+            getattr(self, f"_flush_{self.pending_type}")(records)
+            self.counts[self.pending_type] += len(records)
+
+    def finish(self) -> Dict[str, int]:
+        self.flush()
+        if self.holidays:
+            merge_holidays(self.db, self.holidays, self.tenant_id)
+        return dict(self.counts)
+
+    def _insert(self, model, rows: List[dict]) -> List[int]:
+        result = self.db.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True), rows
+        )
+        return [row.id for row in result]
+
+    def _sound(self, old_id: Optional[int]) -> Optional[int]:
+        if old_id is None:
+            return None
+        if old_id not in self.sounds:
+            name = self.sound_names.get(old_id, old_id)
+            raise self.error(f"helinat '{name}' ei leitud")
+        return self.sounds[old_id]
+
+    # Helinaid ei kopeerita: viited seotakse olemasolevate helinatega
+    # sisu räsi või nime järgi
+    def _flush_sound(self, records: List[dict]) -> None:
+        hashes = {r["content_hash"] for r in records if r.get("content_hash")}
+        names = {r["name"] for r in records}
+        rows = self.db.execute(select(models.Sound.id, models.Sound.name, models.Sound.content_hash).where(
+            models.Sound.tenant_id == self.tenant_id,
+            or_(models.Sound.content_hash.in_(hashes), models.Sound.name.in_(names))
+        ).order_by(models.Sound.id)).all()
+        by_hash = {}
+        by_name = {}
+        for row in rows:
+            if row.content_hash:
+                by_hash.setdefault(row.content_hash, row.id)
+            by_name.setdefault(row.name, row.id)
+        for record in records:
+            self.sound_names[record["id"]] = record["name"]
+            found = by_hash.get(record.get("content_hash")) or by_name.get(record["name"])
+            if found is not None:
+                self.sounds[record["id"]] = found
+
+    def _flush_holiday(self, records: List[dict]) -> None:
+        for record in records:
+            self.holidays.append((_parse_date(record["valid_from"]), _parse_date(record["valid_until"])))
+
+    def _flush_template(self, records: List[dict]) -> None:
+        new_ids = self._insert(models.EventTemplate, [
+            {"tenant_id": self.tenant_id, "name": r["name"], "description": r.get("description")}
+            for r in records
+        ])
+        for record, new_id in zip(records, new_ids):
+            self.templates[record["id"]] = new_id
+        changes.record(self.db, "event_templates", "insert", new_ids, tenant_id=self.tenant_id)
+
+    def _flush_template_item(self, records: List[dict]) -> None:
+        rows = []
+        for record in records:
+            if record["template_id"] not in self.templates:
+                raise self.error("mall puudub")
+            rows.append({
+                "tenant_id": self.tenant_id,
+                "template_id": self.templates[record["template_id"]],
+                "offset_minutes": record["offset_minutes"],
+                "event_name": record["event_name"],
+                "sound_id": self._sound(record.get("sound_id")),
+            })
+        new_ids = self._insert(models.EventTemplateItem, rows)
+        by_parent = defaultdict(list)
+        for row, new_id in zip(rows, new_ids):
+            by_parent[row["template_id"]].append(new_id)
+        for template_id, ids in by_parent.items():
+            changes.record(self.db, "event_template_items", "insert", ids, template_id, self.tenant_id)
+
+    # Samad reeglid mis API-s: nimi on kooli piires unikaalne ja sama
+    # prioriteediga tunniplaanid ei kattu (vt main.check_timetable_overlap).
+    # Konfliktid kogutakse partii kaupa ja import katkestatakse.
+    def _check_timetables(self, rows: List[dict]) -> None:
+        Timetable = models.Timetable
+        taken = set(self.db.execute(select(Timetable.name).where(
+            Timetable.tenant_id == self.tenant_id,
+            Timetable.name.in_({row["name"] for row in rows})
+        )).scalars())
+        existing = [tuple(row) for row in self.db.execute(select(
+            Timetable.name, Timetable.valid_from, Timetable.valid_until, Timetable.weekdays
+        ).where(Timetable.user_id == self.user_id))]
+        conflicts = []
+        for row in rows:
+            candidate = (row["name"], row["valid_from"], row["valid_until"], row["weekdays"])
+            if candidate[2] is not None and candidate[2] < candidate[1]:
+                conflicts.append(f"'{row['name']}': kehtivuse lõpp peab olema hilisem kui algus")
+            if row["name"] in taken:
+                conflicts.append(f"'{row['name']}': sama nimega tunniplaan on juba olemas")
+            overlapping = [other[0] for other in existing if _overlaps(candidate, other)]
+            if overlapping:
+                conflicts.append(
+                    f"'{row['name']}': kattub sama prioriteediga tunniplaaniga "
+                    + ", ".join(f"'{name}'" for name in overlapping)
+                )
+            taken.add(row["name"])
+            existing.append(candidate)
+        if conflicts:
+            raise ArchiveImportError("Tunniplaane ei saa importida: " + "; ".join(conflicts))
+
+    def _flush_timetable(self, records: List[dict]) -> None:
+        rows = [{
+            "tenant_id": self.tenant_id,
+            "name": r["name"],
+            "valid_from": _parse_date(r["valid_from"]),
+            "valid_until": _parse_date(r.get("valid_until")),
+            "weekdays": r["weekdays"],
+            "user_id": self.user_id,
+        } for r in records]
+        self._check_timetables(rows)
+        new_ids = self._insert(models.Timetable, rows)
+        for record, new_id in zip(records, new_ids):
+            self.timetables[record["id"]] = new_id
+        changes.record(self.db, "timetables", "insert", new_ids, self.user_id, self.tenant_id)
+
+    def _instance(self, old_id: Optional[int]) -> Optional[int]:
+        return self.instances[old_id] if old_id is not None else None
+
+    def _flush_event(self, records: List[dict]) -> None:
+        # Malli instantsid saavad kooli loendurist uued id-d, et need ei
+        # seguneks olemasolevate instantsidega
+        new_instances = sorted({
+            r["template_instance_id"] for r in records
+            if r.get("template_instance_id") is not None and r["template_instance_id"] not in self.instances
+        })
+        if new_instances:
+            first_id = templates.allocate_instance_ids(self.db, self.tenant_id, len(new_instances))
+            for offset, old_id in enumerate(new_instances):
+                self.instances[old_id] = first_id + offset
+        rows = []
+        for record in records:
+            if record["timetable_id"] not in self.timetables:
+                raise self.error("tunniplaan puudub")
+            rows.append({
+                "tenant_id": self.tenant_id,
+                "timetable_id": self.timetables[record["timetable_id"]],
+                "event_name": record["event_name"],
+                "event_time": _parse_time(record["event_time"]),
+                "sound_id": self._sound(record.get("sound_id")),
+                "template_instance_id": self._instance(record.get("template_instance_id")),
+                "is_template_base": bool(record.get("is_template_base")),
+            })
+        new_ids = self._insert(models.TimetableEvent, rows)
+        by_parent = defaultdict(list)
+        for row, new_id in zip(rows, new_ids):
+            by_parent[row["timetable_id"]].append(new_id)
+        for timetable_id, ids in by_parent.items():
+            changes.record(self.db, "timetable_events", "insert", ids, timetable_id, self.tenant_id)
+
+def _guarded(importer: _Importer, step, *args):
+    try:
+        return step(*args)
+    except ArchiveImportError:
+        raise
+    except (KeyError, TypeError, ValueError) as exc:
+        raise importer.error(f"vigane väli {exc}")
+
+def import_json(db: Session, tenant_id: int, user_id: int, stream: TextIO) -> Dict[str, int]:
+    # Kogu import on üks tehing: vea korral ei jää poolikut arhiivi
+    importer = _Importer(db, tenant_id, user_id)
+    try:
+        for line_number, line in enumerate(stream, start=1):
+            importer.line = line_number
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise importer.error("vigane JSON")
+            if not isinstance(record, dict):
+                raise importer.error("vigane kirje")
+            if record.get("type") == "lible-export":
+                if record.get("version") != ARCHIVE_VERSION:
+                    raise importer.error("toetamata arhiivi versioon")
+                continue
+            _guarded(importer, importer.add, record)
+        counts = _guarded(importer, importer.finish)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return counts
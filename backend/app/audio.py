@@ -0,0 +1,182 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+import os
+import threading
+from sqlalchemy.orm import Session
+from . import changes, metrics, models, pcm
+from .cache import LRUCache
+from .config import settings
+from .pcm import PcmBuffer
+from .schedule import Bell, ScheduleEngines, schedule_engines
+from .storage import SOUNDS_DIRECTORY
+from .tenancy import TenantRegistry, tenants
+
+logger = logging.getLogger(__name__)
+
+# Dekodeeritud PCM failide kaust (mälukaardistatud režiimi jaoks)
+PCM_DIRECTORY = os.path.join(SOUNDS_DIRECTORY, ".pcm")
+
+AUDIO_CACHE_BYTES = settings.audio.cache_bytes
+AUDIO_CACHE_MMAP = settings.audio.cache_mmap
+
+cache_hits = metrics.Counter("lible_sound_cache_hits_total", "Helinavahemälu tabamused")
+cache_misses = metrics.Counter("lible_sound_cache_misses_total", "Helinavahemälu möödalasud")
+cache_bytes = metrics.Gauge("lible_sound_cache_bytes", "Helinavahemälus hoitavate PCM andmete maht")
+
+# Ühine mälupiirang kõigi koolide peale; helinad on võtmestatud (kool, id)
+SoundKey = Tuple[int, int]
+
+class SoundCache:
+    def __init__(
+        self,
+        engines: ScheduleEngines,
+        max_bytes: int = AUDIO_CACHE_BYTES,
+        use_mmap: bool = AUDIO_CACHE_MMAP,
+        databases: TenantRegistry = tenants,
+    ):
+        self.engines = engines
+        self.use_mmap = use_mmap
+        self.databases = databases
+        self._buffers: LRUCache[PcmBuffer] = LRUCache(max_bytes, weigh=lambda b: b.nbytes)
+        self._paths: Dict[SoundKey, str] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sound-decode")
+
+    def _pcm_path(self, path: str) -> Optional[str]:
+        if not self.use_mmap:
+            return None
+        return pcm.pcm_path(PCM_DIRECTORY, path)
+
+    def load(self, tenant_id: int, sound_id: int, path: str) -> Optional[PcmBuffer]:
+        # Puhvrid on võtmestatud failitee järgi: sisuaadressiga failid on
+        # muutumatud ja sama sisuga helinad jagavad üht puhvrit
+        with self._lock:
+            self._paths[(tenant_id, sound_id)] = path
+        buffer = self._buffers.get(path)
+        if buffer is not None:
+            return buffer
+        pcm_path = self._pcm_path(path)
+        try:
+            buffer = pcm.load(path, pcm_path)
+        except Exception as exc:
+            logger.warning("Helinat %s ei õnnestunud dekodeerida: %s", path, exc)
+            return None
+        self._buffers.put(path, buffer)
+        cache_bytes.set(self._buffers.weight)
+        return buffer
+
+    def get(self, tenant_id: int, sound_id: int) -> Optional[PcmBuffer]:
+        with self._lock:
+            path = self._paths.get((tenant_id, sound_id))
+        buffer = self._buffers.get(path) if path else None
+        if buffer is not None:
+            cache_hits.inc()
+        else:
+            cache_misses.inc()
+        return buffer
+
+    def evict(self, tenant_id: int, sound_id: int) -> None:
+        with self._lock:
+            path = self._paths.pop((tenant_id, sound_id), None)
+            shared = path in self._paths.values()
+        if path is None or shared:
+            return
+        self._buffers.pop(path)
+        pcm_path = self._pcm_path(path)
+        if pcm_path and os.path.exists(pcm_path):
+            os.remove(pcm_path)
+        cache_bytes.set(self._buffers.weight)
+
+    # Soojendamine: tänase ja homse ajakava helinad dekodeeritakse ette
+
+    def _sound_paths(self, db: Session, tenant_id: int, sound_ids: Iterable[int]) -> Dict[int, str]:
+        ids = set(sound_ids)
+        if not ids:
+            return {}
+        directory = self.databases.database(tenant_id).sounds_directory
+        rows = db.query(models.Sound.id, models.Sound.filename).filter(
+            models.Sound.tenant_id == tenant_id,
+            models.Sound.id.in_(ids)
+        ).all()
+        return {row.id: os.path.join(directory, row.filename) for row in rows}
+
+    def warm_upcoming(self, tenant_id: int, days: int = 2) -> None:
+        engine = self.engines.get(tenant_id)
+        db = engine.session_factory()
+        try:
+            start = date.today()
+            end = start + timedelta(days=days - 1)
+            sound_ids = set()
+            for user_id in engine.user_ids(db):
+                for day in engine.resolve_range(db, user_id, start, end):
+                    sound_ids.update(event.sound_id for event in day.events)
+            for sound_id, path in self._sound_paths(db, tenant_id, sound_ids).items():
+                self.load(tenant_id, sound_id, path)
+        finally:
+            db.close()
+
+    def warm_in_background(self, tenant_id: Optional[int] = None) -> None:
+        # None: kõigi koolide helinad
+        self._executor.submit(self._safe_warm, tenant_id)
+
+    def load_in_background(self, tenant_id: int, sound_id: int, path: str) -> None:
+        self._executor.submit(self.load, tenant_id, sound_id, path)
+
+    def _safe_warm(self, tenant_id: Optional[int]) -> None:
+        try:
+            tenant_ids = self.databases.tenant_ids() if tenant_id is None else [tenant_id]
+            for tenant_id in tenant_ids:
+                self.warm_upcoming(tenant_id)
+        except Exception:
+            logger.exception("Helinavahemälu soojendamine ebaõnnestus")
+
+    def apply_changes(self, batch: List[changes.Change]) -> None:
+        rewarm = set()
+        for change in batch:
+            if change.table == "sounds" and change.op != "insert":
+                if change.tenant_id is None:
+                    with self._lock:
+                        keys = [key for key in self._paths if key[1] == change.id]
+                    for key in keys:
+                        self.evict(*key)
+                else:
+                    self.evict(change.tenant_id, change.id)
+            elif change.table in ("timetables", "timetable_events", "holidays"):
+                rewarm.add(change.tenant_id)
+        if None in rewarm:
+            self.warm_in_background()
+        else:
+            for tenant_id in rewarm:
+                self.warm_in_background(tenant_id)
+
+    # Helistamine: eeldekodeeritud puhver antakse otse heliväljundile
+
+    def play(self, tenant_id: int, sound_id: int) -> None:
+        buffer = self.get(tenant_id, sound_id)
+        if buffer is None:
+            # Vahemälust puudu: dekodeerime taustal ja mängime hiljem
+            self._executor.submit(self._load_and_play, tenant_id, sound_id)
+            return
+        self._output(buffer)
+
+    def _load_and_play(self, tenant_id: int, sound_id: int) -> None:
+        db = self.databases.database(tenant_id).session_factory()
+        try:
+            path = self._sound_paths(db, tenant_id, [sound_id]).get(sound_id)
+        finally:
+            db.close()
+        buffer = self.load(tenant_id, sound_id, path) if path else None
+        if buffer is not None:
+            self._output(buffer)
+
+    def _output(self, buffer: PcmBuffer) -> None:
+        pcm.play(buffer)
+
+    def ring(self, tenant_id: int, user_id: int, bell: Bell) -> None:
+        logger.info("Kell: %s %s (heli %s)", bell.at, bell.event_name, bell.sound_id)
+        self.play(tenant_id, bell.sound_id)
+
+sound_cache = SoundCache(schedule_engines)
+changes.subscribe(sound_cache.apply_changes)
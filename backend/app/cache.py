@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+import threading
+import time
+
+# Lõimekindel LRU vahemälu. Piirang on kas kirjete arv või kaal (nt baitides),
+# kui on antud kaalufunktsioon. Valikuliselt aeguvad kirjed ttl sekundi järel.
+
+V = TypeVar("V")
+
+class LRUCache(Generic[V]):
+    def __init__(
+        self,
+        max_weight: int,
+        weigh: Optional[Callable[[V], int]] = None,
+        ttl: Optional[float] = None,
+    ):
+        self.max_weight = max_weight
+        self.weigh = weigh or (lambda value: 1)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, V]" = OrderedDict()
+        self._weights = {}
+        self._expires = {}
+        self._lock = threading.Lock()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data and not self._expired(key)
+
+    def _expired(self, key: Hashable) -> bool:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._remove(key)
+            return True
+        return False
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        with self._lock:
+            if key in self._data and not self._expired(key):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        weight = self.weigh(value)
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            if weight > self.max_weight or (ttl is not None and ttl <= 0):
+                # Liiga suurt või juba aegunud kirjet ei hoita
+                return
+            self._data[key] = value
+            self._weights[key] = weight
+            if ttl is not None:
+                self._expires[key] = time.monotonic() + ttl
+            self.weight += weight
+            while self.weight > self.max_weight:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            if key in self._data:
+                return self._remove(key)
+            return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._weights.clear()
+            self._expires.clear()
+            self.weight = 0
+
+    def _remove(self, key: Hashable) -> V:
+        value = self._data.pop(key)
+        self.weight -= self._weights.pop(key)
+        self._expires.pop(key, None)
+        return value
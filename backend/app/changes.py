@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+import logging
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Muudatuste kogumine: sessioon märgib flushi ajal muudetud read ja pärast
+# commit'i antakse need tellijatele (ajakava mootor, vahemälud jne) edasi.
+
+# Tabelid, mille puhul jätame meelde ka "vanema" võtme
+PARENT_KEYS = {
+    "timetables": "user_id",
+    "timetable_events": "timetable_id",
+    "event_template_items": "template_id",
+}
+
+@dataclass(frozen=True)
+class Change:
+    table: str
+    op: str  # "insert", "update" või "delete"
+    id: Optional[int]
+    parent_id: Optional[int] = None
+    # Kool, kelle andmeid muudeti; None tähendab, et kool pole teada
+    tenant_id: Optional[int] = None
+
+Listener = Callable[[List[Change]], None]
+
+# Tellijad käivitatakse etappide kaupa, etapi sees tellimise järjekorras.
+# Järjekord ei sõltu moodulite importimise järjekorrast: enne tühjendatakse
+# vahemälud, millest vastused arvutatakse, siis vastuste vahemälu ja alles
+# siis tõstetakse revisjon (ETag). Nii ei saa päring uut ETagi koos vana
+# vastusega. Teavitused (WebSocket, esitusloendid) tulevad viimasena.
+DATA_CACHES = 0
+RESPONSE_CACHE = 1
+REVISIONS = 2
+NOTIFY = 3
+
+_listeners: List[Tuple[int, Listener]] = []
+_listeners_lock = threading.Lock()
+
+def subscribe(listener: Listener, stage: int = NOTIFY) -> None:
+    with _listeners_lock:
+        if all(existing != listener for _, existing in _listeners):
+            _listeners.append((stage, listener))
+            # sort on stabiilne, seega etapi sees jääb tellimise järjekord
+            _listeners.sort(key=lambda entry: entry[0])
+
+def unsubscribe(listener: Listener) -> None:
+    with _listeners_lock:
+        _listeners[:] = [entry for entry in _listeners if entry[1] != listener]
+
+def _pending(session: Session) -> List[Change]:
+    return session.info.setdefault("pending_changes", [])
+
+def _describe(obj, op: str) -> Optional[Change]:
+    table = getattr(obj, "__tablename__", None)
+    if table is None:
+        return None
+    parent_key = PARENT_KEYS.get(table)
+    parent_id = getattr(obj, parent_key, None) if parent_key else None
+    return Change(
+        table=table,
+        op=op,
+        id=getattr(obj, "id", None),
+        parent_id=parent_id,
+        tenant_id=getattr(obj, "tenant_id", None),
+    )
+
+def record(
+    session: Session,
+    table: str,
+    op: str,
+    ids,
+    parent_id: Optional[int] = None,
+    tenant_id: Optional[int] = None,
+) -> None:
+    # Bulk-operatsioonid (bulk_insert_mappings jms) ei käivita ORM-i flush
+    # sündmusi, seega märgitakse need käsitsi
+    pending = _pending(session)
+    for row_id in ids:
+        pending.append(Change(table=table, op=op, id=row_id, parent_id=parent_id, tenant_id=tenant_id))
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    pending = _pending(session)
+    for obj in session.new:
+        change = _describe(obj, "insert")
+        if change:
+            pending.append(change)
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            change = _describe(obj, "update")
+            if change:
+                pending.append(change)
+    for obj in session.deleted:
+        change = _describe(obj, "delete")
+        if change:
+            pending.append(change)
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_changes(session):
+    changes = session.info.pop("pending_changes", None)
+    if not changes:
+        return
+    with _listeners_lock:
+        listeners = [listener for _, listener in _listeners]
+    for listener in listeners:
+        try:
+            listener(changes)
+        except Exception:
+            # Tellija viga ei tohi juba tehtud commit'i tagasi keerata
+            logger.exception("Muudatuste tellija ebaõnnestus")
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changes(session, previous_transaction):
+    session.info.pop("pending_changes", None)
@@ -0,0 +1,137 @@
+from dataclasses import dataclass, field, fields, is_dataclass
+from typing import Any, Dict, List, Optional
+import os
+
+# Rakenduse seadistus failist config.yaml (vt disainidokument 8.2).
+# Faili asukoha saab muuta keskkonnamuutujaga LIBLE_CONFIG; kui faili pole,
+# kasutatakse vaikeväärtusi.
+
+BACKEND_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_CONFIG_PATH = os.path.join(BACKEND_DIRECTORY, "config.yaml")
+
+@dataclass
+class ServerSettings:
+    host: str = "0.0.0.0"
+    port: int = 8000
+    debug: bool = False
+    response_cache_bytes: int = 16 * 1024 * 1024
+    # /metrics nõuab sisselogimist; nendelt aadressidelt lubatakse ilma
+    metrics_allow: List[str] = field(default_factory=list)
+
+@dataclass
+class DatabaseSettings:
+    url: str = "sqlite:///./schoolbell.db"
+    # SQLite seaded, rakendatakse igale uuele ühendusele
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size: int = -64000  # negatiivne väärtus on KiB-des
+    busy_timeout: int = 5000  # ms
+    foreign_keys: bool = True
+    # Ühenduste kogum: vaikimisi sama suur kui Starlette'i lõimede kogum
+    pool_size: int = 20
+    max_overflow: int = 20
+    pool_timeout: int = 30
+    # Uuenda skeemi käivitumisel; paigaldamisel võib käivitada
+    # "python -m app.migrate" enne serverit ja selle välja lülitada
+    migrate_on_startup: bool = True
+
+@dataclass
+class AuthSettings:
+    type: str = "local"
+    secret_key: str = "your-secret-key-here"
+    token_expire_minutes: int = 1440
+    password_hash_workers: int = os.cpu_count() or 2
+    password_hash_max_queue: int = 64
+
+@dataclass
+class SystemSettings:
+    timezone: str = "Europe/Tallinn"
+
+@dataclass
+class AudioSettings:
+    output_device: str = "default"
+    storage_path: str = "./sounds"
+    cache_bytes: int = 64 * 1024 * 1024
+    cache_mmap: bool = False
+
+@dataclass
+class SchedulerSettings:
+    # Helista kellad API protsessis. Kui kellad helistab eraldi kellamängija
+    # (playlist.enabled ja python -m app.player), tuleb see välja lülitada,
+    # muidu helistatakse iga kell kaks korda; ajastaja teavitab siis
+    # kliente edasi, kuid heli ei mängi.
+    ring_in_process: bool = True
+
+@dataclass
+class LoggingSettings:
+    level: str = "INFO"
+    format: str = "text"  # 'text' (võti=väärtus) või 'json'
+
+@dataclass
+class ProfilingSettings:
+    # Profileeri kõiki päringuid ja salvesta aeglaste päringute profiilid
+    enabled: bool = False
+    # Luba profileerimist päise kaudu (nt X-Lible-Profile: 1)
+    allow_header: bool = False
+    header: str = "X-Lible-Profile"
+    slow_request_ms: int = 500
+    interval_ms: int = 5
+    directory: str = "./profiles"
+
+@dataclass
+class TenancySettings:
+    # 'shared': kõik koolid ühes andmebaasis (read eristatakse tenant_id järgi)
+    # 'sqlite_per_tenant': igal koolil oma SQLite fail ja helinate kaust
+    mode: str = "shared"
+    directory: str = "./tenants"
+    # Koolide nimekiri ja andmebaasid hoitakse mälus
+    cache_ttl: int = 60  # sekundit
+
+@dataclass
+class PlaylistSettings:
+    # Kirjuta päevade esitusloendid eraldi kellamängija jaoks (python -m app.player)
+    enabled: bool = False
+    directory: str = "./playlists"
+    days: int = 7  # mitu päeva ette
+    debounce_ms: int = 500  # muudatuste koondamise aeg enne ümberkirjutamist
+
+@dataclass
+class Settings:
+    server: ServerSettings = field(default_factory=ServerSettings)
+    database: DatabaseSettings = field(default_factory=DatabaseSettings)
+    auth: AuthSettings = field(default_factory=AuthSettings)
+    system: SystemSettings = field(default_factory=SystemSettings)
+    audio: AudioSettings = field(default_factory=AudioSettings)
+    scheduler: SchedulerSettings = field(default_factory=SchedulerSettings)
+    logging: LoggingSettings = field(default_factory=LoggingSettings)
+    profiling: ProfilingSettings = field(default_factory=ProfilingSettings)
+    tenancy: TenancySettings = field(default_factory=TenancySettings)
+    playlist: PlaylistSettings = field(default_factory=PlaylistSettings)
+
+def _apply(target, values: Dict[str, Any]) -> None:
+    known = {f.name for f in fields(target)}
+    for key, value in (values or {}).items():
+        if key not in known:
+            continue
+        current = getattr(target, key)
+        if is_dataclass(current) and isinstance(value, dict):
+            _apply(current, value)
+        else:
+            setattr(target, key, value)
+
+def load_settings(path: Optional[str] = None) -> Settings:
+    path = path or os.getenv("LIBLE_CONFIG", DEFAULT_CONFIG_PATH)
+    settings = Settings()
+    if os.path.exists(path):
+        import yaml
+
+        with open(path, encoding="utf-8") as f:
+            _apply(settings, yaml.safe_load(f) or {})
+    return settings
+
+def resolve_path(path: str) -> str:
+    # Suhtelised teed on backend kausta suhtes
+    return os.path.abspath(os.path.join(BACKEND_DIRECTORY, path))
+
+settings = load_settings()
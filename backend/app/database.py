@@ -1,16 +1,114 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from .config import DatabaseSettings, settings
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./schoolbell.db"
+SQLALCHEMY_DATABASE_URL = settings.database.url
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def create_db_engine(db_settings: DatabaseSettings):
+    url = db_settings.url
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_size=db_settings.pool_size, max_overflow=db_settings.max_overflow)
+
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": db_settings.busy_timeout / 1000},
+        pool_size=db_settings.pool_size,
+        max_overflow=db_settings.max_overflow,
+        pool_timeout=db_settings.pool_timeout,
+        pool_pre_ping=False,
+    )
+
+    _set_sqlite_pragmas(engine, db_settings)
+    return engine
+
+def _set_sqlite_pragmas(engine, db_settings: DatabaseSettings) -> None:
+    # SQLite seaded kehtivad ühenduse kaupa, seega seame need igale uuele ühendusele
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={db_settings.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={db_settings.synchronous}")
+        cursor.execute(f"PRAGMA mmap_size={int(db_settings.mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={int(db_settings.cache_size)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(db_settings.busy_timeout)}")
+        cursor.execute(f"PRAGMA foreign_keys={'ON' if db_settings.foreign_keys else 'OFF'}")
+        cursor.close()
+
+# Asünkroonne mootor lugemispäringute jaoks: päringud ootavad sündmustsüklis
+# ega hõiva Starlette'i lõimede kogumit. SQLite puhul kasutatakse aiosqlite
+# draiverit, muudel andmebaasidel tuleb URL-is anda asünkroonne draiver.
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite"}
+
+def create_async_db_engine(db_settings: DatabaseSettings):
+    url = make_url(db_settings.url)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    if not url.drivername.startswith("sqlite"):
+        return create_async_engine(url, pool_size=db_settings.pool_size, max_overflow=db_settings.max_overflow)
+
+    engine = create_async_engine(
+        url,
+        connect_args={"timeout": db_settings.busy_timeout / 1000},
+        pool_size=db_settings.pool_size,
+        max_overflow=db_settings.max_overflow,
+        pool_timeout=db_settings.pool_timeout,
+    )
+    _set_sqlite_pragmas(engine.sync_engine, db_settings)
+    return engine
+
+engine = create_db_engine(settings.database)
+async_engine = create_async_db_engine(settings.database)
+
+# Päringute loendamine: count_queries() plokis tehtud SQL-päringute arv ja
+# kestus kogutakse ContextVar-i kaudu (toimib ka lõimede kogumis, sest
+# Starlette kopeerib konteksti töölõime).
+@dataclass
+class QueryStats:
+    count: int = 0
+    seconds: float = 0.0
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+@contextmanager
+def count_queries():
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+def instrument_engine(target) -> None:
+    @event.listens_for(target, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(target, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += time.perf_counter() - started
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Asünkroonse sessiooni objektid ei aegu commit'i järel, et vastuse
+# serialiseerimine ei teeks varjatud päringuid
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -18,3 +116,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,187 @@
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+import csv
+import io
+from sqlalchemy.orm import Session
+from . import models
+
+# Pühade ja vaheaegade alamsüsteem: liidetud ja sorteeritud vahemike indeks
+# ning riiklike pühade kalendri (CSV/ICS) import.
+
+DateRange = Tuple[date, date]
+
+def merge_ranges(ranges: Iterable[DateRange]) -> List[DateRange]:
+    # Kattuvad ja kõrvuti asetsevad vahemikud liidetakse üheks
+    merged: List[List[date]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+class HolidayIndex:
+    def __init__(self, ranges: Iterable[DateRange]):
+        merged = merge_ranges(ranges)
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def end_of(self, day: date) -> Optional[date]:
+        i = bisect_right(self.starts, day) - 1
+        if i >= 0 and self.ends[i] >= day:
+            return self.ends[i]
+        return None
+
+    def contains(self, day: date) -> bool:
+        return self.end_of(day) is not None
+
+    def between(self, start: date, end: date) -> List[DateRange]:
+        # Liidetud vahemikud on järjestatud ja ei kattu, seega on ka lõpud
+        # järjestatud: esimene sobiv on esimene, mille lõpp >= start
+        first = bisect_left(self.ends, start)
+        last = bisect_right(self.starts, end)
+        return list(zip(self.starts[first:last], self.ends[first:last]))
+
+# Import
+
+MAX_HOLIDAY_DAYS = 366
+
+class HolidayImportError(ValueError):
+    pass
+
+def _parse_date(value: str) -> date:
+    value = value.strip()
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+def _validate(start: date, end: date, line: int) -> DateRange:
+    if end < start:
+        raise HolidayImportError(f"Rida {line}: lõpp on enne algust")
+    if (end - start).days >= MAX_HOLIDAY_DAYS:
+        raise HolidayImportError(f"Rida {line}: periood on pikem kui 1 aasta")
+    return start, end
+
+def parse_csv(text: str) -> List[DateRange]:
+    # Veerud: algus[,lõpp[,...]]; päiserida ja tühjad read jäetakse vahele
+    ranges = []
+    sample = text[:1024]
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    for line, row in enumerate(csv.reader(io.StringIO(text), dialect), start=1):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if not cells:
+            continue
+        try:
+            start = _parse_date(cells[0])
+        except ValueError:
+            if line == 1:
+                continue  # päiserida
+            raise HolidayImportError(f"Rida {line}: vigane kuupäev '{cells[0]}'")
+        end = start
+        if len(cells) > 1:
+            try:
+                end = _parse_date(cells[1])
+            except ValueError:
+                end = start  # teine veerg võib olla püha nimi
+        ranges.append(_validate(start, end, line))
+    return ranges
+
+def _unfold_ics(text: str) -> List[str]:
+    lines: List[str] = []
+    for raw in text.splitlines():
+        if raw[:1] in (" ", "\t") and lines:
+            lines[-1] += raw[1:]
+        else:
+            lines.append(raw)
+    return lines
+
+def parse_ics(text: str) -> List[DateRange]:
+    ranges = []
+    start: Optional[date] = None
+    end: Optional[date] = None
+    start_is_date = True
+    in_event = False
+    for line, content in enumerate(_unfold_ics(text), start=1):
+        name, _, value = content.partition(":")
+        key = name.split(";")[0].upper()
+        if key == "BEGIN" and value.upper() == "VEVENT":
+            in_event, start, end, start_is_date = True, None, None, True
+        elif key == "END" and value.upper() == "VEVENT":
+            in_event = False
+            if start is None:
+                raise HolidayImportError(f"Rida {line}: sündmusel puudub DTSTART")
+            if end is None:
+                last = start
+            elif start_is_date:
+                # Kogu päeva sündmuste DTEND on välistav
+                last = max(start, end - timedelta(days=1))
+            else:
+                last = end
+            ranges.append(_validate(start, last, line))
+        elif in_event and key in ("DTSTART", "DTEND"):
+            try:
+                parsed = _parse_date(value[:8])
+            except ValueError:
+                raise HolidayImportError(f"Rida {line}: vigane kuupäev '{value}'")
+            if key == "DTSTART":
+                start = parsed
+                start_is_date = "T" not in value
+            else:
+                end = parsed
+    return ranges
+
+def parse_calendar(filename: str, text: str) -> List[DateRange]:
+    if filename.lower().endswith(".ics") or text.lstrip().upper().startswith("BEGIN:VCALENDAR"):
+        return parse_ics(text)
+    return parse_csv(text)
+
+def merge_holidays(
+    db: Session, ranges: Iterable[DateRange], tenant_id: int = models.DEFAULT_TENANT_ID
+) -> List[int]:
+    # Imporditud vahemikud liidetakse omavahel ja olemasolevate kattuvate
+    # pühadega; commit jääb kutsuja teha
+    merged = merge_ranges(ranges)
+    if not merged:
+        return []
+    # Üks vahemikupäring kogu imporditud akna kohta; eraldi tingimus iga
+    # vahemiku kohta ületaks suure impordi korral SQLite'i avaldise sügavuse
+    # piiri. Akna sees puudutamata pühad jäetakse alles.
+    day = timedelta(days=1)
+    window = db.query(models.Holiday).filter(
+        models.Holiday.tenant_id == tenant_id,
+        models.Holiday.valid_from <= merged[-1][1] + day,
+        models.Holiday.valid_until >= merged[0][0] - day
+    ).all()
+    index = HolidayIndex(merged)
+    existing = [h for h in window if index.between(h.valid_from - day, h.valid_until + day)]
+    merged = merge_ranges(merged + [(h.valid_from, h.valid_until) for h in existing])
+    for holiday in existing:
+        db.delete(holiday)
+    created = [
+        models.Holiday(tenant_id=tenant_id, valid_from=start, valid_until=end) for start, end in merged
+    ]
+    db.add_all(created)
+    db.flush()
+    return [holiday.id for holiday in created]
+
+def import_holidays(
+    db: Session, ranges: Iterable[DateRange], tenant_id: int = models.DEFAULT_TENANT_ID
+) -> List[models.Holiday]:
+    # Kõik muudatused kirjutatakse ühe tehinguga
+    created_ids = merge_holidays(db, ranges, tenant_id)
+    if not created_ids:
+        return []
+    db.commit()
+    return db.query(models.Holiday).filter(
+        models.Holiday.id.in_(created_ids)
+    ).order_by(models.Holiday.valid_from).all()
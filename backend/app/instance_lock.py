@@ -0,0 +1,66 @@
+from typing import IO, Optional
+import logging
+import os
+from sqlalchemy.engine import make_url
+from .config import BACKEND_DIRECTORY, settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: lukku ei kontrollita
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Rakendus töötab ühe protsessina. Ajakava mootor, vastuste vahemälu,
+# revisjonid (ETag, ?since), helinavahemälu ja kellade ajastaja hoiavad
+# olekut protsessi mälus ning saavad muudatustest teada ainult sama
+# protsessi commit'idest; teine töötaja serveeriks aegunud vastuseid ja
+# helistaks kellad uuesti. Käivitumisel võetakse seetõttu andmebaasi kõrval
+# olevale lukufailile eksklusiivne lukk ja teine protsess sama andmebaasiga
+# keeldub käivitumast.
+
+class InstanceLocked(RuntimeError):
+    pass
+
+def lock_path(url: str = settings.database.url) -> str:
+    parsed = make_url(url)
+    if parsed.drivername.startswith("sqlite") and parsed.database and parsed.database != ":memory:":
+        return os.path.abspath(parsed.database) + ".lock"
+    return os.path.join(BACKEND_DIRECTORY, "lible.lock")
+
+class InstanceLock:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or lock_path()
+        self._file: Optional[IO[str]] = None
+
+    def acquire(self) -> None:
+        if self._file is not None:
+            return
+        if fcntl is None:
+            logger.warning("Protsessi lukku ei toetata, käivita ainult üks töötaja")
+            return
+        lock_file = open(self.path, "a+", encoding="utf-8")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.seek(0)
+            owner = lock_file.read().strip() or "?"
+            lock_file.close()
+            raise InstanceLocked(
+                f"Lible töötab sama andmebaasiga juba protsessis {owner} (lukk {self.path}); "
+                "rakendus toetab ainult ühte töötajat"
+            )
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+
+    def release(self) -> None:
+        if self._file is None:
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+instance_lock = InstanceLock()
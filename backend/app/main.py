@@ -1,69 +1,267 @@
-from datetime import timedelta
-from typing import List
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Union
+import asyncio
+import io
+import logging
 import os
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+import anyio
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Header, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from . import models, schemas, security
-from .database import engine, get_db
-
-# Loome andmebaasi tabelid
-models.Base.metadata.create_all(bind=engine)
-
-app = FastAPI(
-    title="Lible - Koolikella süsteem",
-    description="Veebipõhine koolikella süsteem",
-    version="1.0.0"
-)
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import archive, changes, holidays, metrics, migrate, models, schemas, security, storage, telemetry, templates
+from .config import settings
+from .audio import sound_cache
+from .instance_lock import instance_lock
+from .playlist import playlist_writer
+from .schedule import schedule_engines
+from .realtime import hub
+from .response_cache import response_cache
+from .revisions import revisions
+from .scheduler import bell_schedulers
+from .tenancy import TENANT_HEADER, UnknownTenant, tenants
 
-# CORS seadistus
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:5173",
-        "http://localhost:5174",
-        "http://127.0.0.1:5173",
-        "http://127.0.0.1:5174"
-    ],
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE"],
-    allow_headers=["*"],
-    expose_headers=["*"]
-)
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _warm_caches() -> None:
+    # Raskemad moodulid ja ajakava laetakse ette, et esimene päring ei ootaks
+    security.warm()
+    for tenant_id in tenants.tenant_ids():
+        db = tenants.database(tenant_id).session_factory()
+        try:
+            schedule_engines.get(tenant_id).warm(db)
+        finally:
+            db.close()
+
+async def warm_caches(app: FastAPI) -> None:
+    try:
+        await anyio.to_thread.run_sync(_warm_caches)
+        app.state.warm = True
+        logger.info("Vahemälud soojendatud")
+    except Exception:
+        logger.exception("Vahemälude soojendamine ebaõnnestus")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Vahemälud ja ajastaja on protsessi-sisesed: teine protsess sama
+    # andmebaasiga ei käivitu (vt instance_lock)
+    instance_lock.acquire()
+    # Skeemi versiooni kontroll on üks päring; migratsioonid käivituvad
+    # ainult siis, kui andmebaas on vanem kui kood
+    if settings.database.migrate_on_startup:
+        await anyio.to_thread.run_sync(migrate.ensure_schema)
+    await anyio.to_thread.run_sync(storage.ensure_directory)
+    # Kellade helistamise taustateenus (iga kooli jaoks)
+    await bell_schedulers.start()
+    hub.start()
+    # Kellamängija (app.player) päevaloendid
+    if settings.playlist.enabled:
+        await playlist_writer.start()
+        if settings.scheduler.ring_in_process:
+            logger.warning(
+                "Esitusloendid on sisse lülitatud ja kellad helistatakse ka API protsessis; "
+                "kellamängija kasutamisel sea scheduler.ring_in_process: false"
+            )
+    # Soojendamine käib taustal, /health vastab kohe
+    warming = asyncio.create_task(warm_caches(app))
+    yield
+    warming.cancel()
+    await playlist_writer.stop()
+    hub.stop()
+    await bell_schedulers.stop()
+    await tenants.dispose()
+    instance_lock.release()
+
+def create_app() -> FastAPI:
+    telemetry.configure_logging()
+    app = FastAPI(
+        title="Lible - Koolikella süsteem",
+        description="Veebipõhine koolikella süsteem",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+    app.state.warm = False
 
-# Helinate kausta seadistamine
-SOUNDS_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "sounds"))
-if not os.path.exists(SOUNDS_DIRECTORY):
-    os.makedirs(SOUNDS_DIRECTORY)
-    print(f"Created sounds directory at: {SOUNDS_DIRECTORY}")  # Debug log
+    # CORS seadistus
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=[
+            "http://localhost:5173",
+            "http://localhost:5174",
+            "http://127.0.0.1:5173",
+            "http://127.0.0.1:5174"
+        ],
+        allow_credentials=True,
+        allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
+        allow_headers=["*"],
+        expose_headers=["*"]
+    )
+
+    # Päringute mõõdikud ja valikuline profileerimine
+    app.add_middleware(telemetry.TelemetryMiddleware)
+
+    app.include_router(router)
+    return app
+
+# Valmisoleku kontroll: ei tee andmebaasi- ega failitööd
+@router.get("/health")
+async def health(request: Request):
+    return {"status": "ok", "warm": request.app.state.warm}
+
+# Kontrolli, et viidatud helinad on olemas (üks päring kõigi id-de kohta)
+def ensure_sounds_exist(db: Session, tenant_id: int, sound_ids) -> None:
+    ids = set(sound_ids)
+    if not ids:
+        return
+    found = {row.id for row in db.query(models.Sound.id).filter(
+        models.Sound.tenant_id == tenant_id,
+        models.Sound.id.in_(ids)
+    )}
+    if ids - found:
+        raise HTTPException(status_code=400, detail="Helin ei leitud")
 
 # Helinate serveerimine ID järgi
-@app.get("/sounds/{sound_id}")
+SOUND_MEDIA_TYPE = "audio/mpeg"
+
+def _parse_range(header: str, size: int):
+    # Toetame ühte baidivahemikku: "bytes=start-end", "bytes=start-" või "bytes=-suffix"
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    start_text, _, end_text = (part.strip() for part in spec.strip().partition("-"))
+    # Vigast vahemikku eiratakse ja saadetakse kogu fail (RFC 7233)
+    if not start_text and not end_text or not all(text.isdigit() for text in (start_text, end_text) if text):
+        return None
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+            if end < start:
+                return None
+        else:
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    # Korrektne, kuid faili ulatusest väljas vahemik annab 416
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+class _WholeFileResponse(FileResponse):
+    # Vahemikud käsitleb _parse_range; siia jõudnud päringule saadetakse kogu
+    # fail ka siis, kui Range päis oli vigane või If-Range ei klappinud
+    async def __call__(self, scope, receive, send):
+        headers = [(name, value) for name, value in scope["headers"] if name != b"range"]
+        await super().__call__({**scope, "headers": headers}, receive, send)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    return bool(if_none_match) and etag in [tag.strip() for tag in if_none_match.split(",")]
+
+# Nimekirjade tingimuslik päring (ETag) ja muudatuste päring (?since=)
+async def list_response(
+    request: Request,
+    response: Response,
+    tenant_id: int,
+    table: str,
+    since: Optional[int],
+    load: Callable[[Optional[Set[int]]], Awaitable[list]],
+    model,
+    cache_key,
+    tags,
+    parent_id: Optional[int] = None
+):
+    # Revisjon loetakse enne andmeid: vahepealne muudatus tuleb järgmisel
+    # korral uuesti, kuid ei jää vahele. Commit tühjendab vastuste vahemälu
+    # enne revisjoni tõstmist (changes.RESPONSE_CACHE < changes.REVISIONS),
+    # seega uus ETag ei satu kunagi vana vahemälu vastusega kokku
+    revision = revisions.revision
+    etag = revisions.etag(tenant_id, table, parent_id)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "X-Revision": str(revision)}
+    if since is None and etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if since is None:
+        # Täisnimekiri tuleb vastuste vahemälust
+        route = request.scope["route"].path
+        return await response_cache.json(
+            route, tenant_id, cache_key, tags, List[model], lambda: load(None), headers
+        )
+    response.headers.update(headers)
+    delta = revisions.changes_since(tenant_id, table, since, parent_id)
+    if delta is None:
+        return {"revision": revision, "full": True, "changed": await load(None), "deleted": []}
+    return {
+        "revision": revision,
+        "full": False,
+        "changed": await load(delta.changed) if delta.changed else [],
+        "deleted": sorted(delta.deleted),
+    }
+
+@router.get("/sounds/{sound_id}")
 def get_sound_file(
     sound_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    sound = db.query(models.Sound).filter(models.Sound.id == sound_id).first()
-    if not sound:
+    tenant_id = current_user.tenant_id
+    sound_file = storage.lookup_sound_file(
+        db, sound_id, tenant_id, tenants.database(tenant_id).sounds_directory
+    )
+    if sound_file is None:
         raise HTTPException(status_code=404, detail="Helin ei leitud")
     
-    file_path = os.path.join(SOUNDS_DIRECTORY, sound.filename)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Helifail ei leitud")
+    headers = {
+        "ETag": sound_file.etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable" if sound_file.immutable else "private, no-cache",
+    }
+    if etag_matches(request, sound_file.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
     
-    return FileResponse(file_path, media_type="audio/mpeg")
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == sound_file.etag):
+        byte_range = _parse_range(range_header, sound_file.size)
+        if byte_range is not None:
+            start, end = byte_range
+            content = storage.read_range(sound_file.path, start, end - start + 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{sound_file.size}"
+            return Response(
+                content=content,
+                status_code=status.HTTP_206_PARTIAL_CONTENT,
+                media_type=SOUND_MEDIA_TYPE,
+                headers=headers
+            )
+    
+    return _WholeFileResponse(sound_file.path, media_type=SOUND_MEDIA_TYPE, headers=headers)
 
 # Autentimine
-@app.post("/token", response_model=schemas.Token)
+@router.post("/token", response_model=schemas.Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    tenant: Optional[str] = Header(None, alias=TENANT_HEADER)
 ):
-    user = security.authenticate_user(db, form_data.username, form_data.password)
+    # Kool valitakse päisega (kooli lühinimi); päiseta vaikimisi kool
+    try:
+        tenant_id = await tenants.resolve(tenant)
+        database = await tenants.database_async(tenant_id)
+    except UnknownTenant:
+        raise HTTPException(status_code=400, detail="Kooli ei leitud")
+    async with database.async_session_factory() as db:
+        user = await security.authenticate_user_async(db, form_data.username, form_data.password, tenant_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -72,33 +270,45 @@ async def login_for_access_token(
         )
     access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "tid": tenant_id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Kasutaja info
-@app.get("/users/me", response_model=schemas.User)
+@router.get("/users/me", response_model=schemas.User)
 async def read_users_me(
     current_user: models.User = Depends(security.get_current_user)
 ):
     return current_user
 
 # Helinate haldus
-@app.get("/sounds", response_model=List[schemas.Sound])
-def get_sounds(
-    db: Session = Depends(get_db),
+@router.get("/sounds", response_model=Union[List[schemas.Sound], schemas.ListDelta[schemas.Sound]])
+async def get_sounds(
+    request: Request,
+    response: Response,
+    since: Optional[int] = None,
+    db: AsyncSession = Depends(security.get_tenant_async_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    return db.query(models.Sound).all()
+    async def load(ids):
+        query = select(models.Sound).where(models.Sound.tenant_id == current_user.tenant_id)
+        if ids is not None:
+            query = query.where(models.Sound.id.in_(ids))
+        return (await db.execute(query)).scalars().all()
+    return await list_response(
+        request, response, current_user.tenant_id, "sounds", since, load, schemas.Sound,
+        cache_key=current_user.id, tags=[("sounds", None)]
+    )
 
-@app.post("/sounds", response_model=schemas.Sound)
+@router.post("/sounds", response_model=schemas.Sound)
 async def create_sound(
     sound_file: UploadFile = File(...),
     name: str = Form(...),
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    print(f"Receiving sound upload: name={name}, file={sound_file.filename}")  # Debug log
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Helina üleslaadimine", extra={"sound_name": name, "upload_filename": sound_file.filename})
     
     # Kontrolli failitüüpi
     if not sound_file.content_type.startswith("audio/"):
@@ -107,72 +317,143 @@ async def create_sound(
             detail="Ainult helifailid on lubatud"
         )
     
-    # Kontrolli faili suurust (max 2MB)
+    # Võta fail vastu tükkhaaval (max 2MB)
     MAX_FILE_SIZE = 2 * 1024 * 1024  # 2MB
-    contents = await sound_file.read()
-    file_size = len(contents)
-    
-    if file_size > MAX_FILE_SIZE:
+    tenant_id = current_user.tenant_id
+    directory = (await tenants.database_async(tenant_id)).sounds_directory
+    try:
+        upload = await storage.receive_upload(sound_file, directory, MAX_FILE_SIZE)
+    except storage.UploadTooLarge:
         raise HTTPException(
             status_code=400,
             detail="Fail on liiga suur (max 2MB)"
         )
     
-    # Salvesta fail
-    filename = f"{name}_{sound_file.filename}"
-    file_path = os.path.join(SOUNDS_DIRECTORY, filename)
-    
-    with open(file_path, "wb") as f:
-        f.write(contents)
+    # Salvesta fail sisu räsi järgi ja loo andmebaasi kirje
+    db_sound = await run_in_threadpool(storage.save_sound, db, name, upload, tenant_id, directory)
+    file_path = storage.blob_path(db_sound.content_hash, directory)
     
-    print(f"Sound file saved to: {file_path}")  # Debug log
-    
-    # Salvesta andmebaasi
-    db_sound = models.Sound(name=name, filename=filename)
-    db.add(db_sound)
-    db.commit()
-    db.refresh(db_sound)
-    
-    print(f"Sound record created: {db_sound.id}")  # Debug log
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Helin salvestatud", extra={"sound_id": db_sound.id, "content_hash": db_sound.content_hash, "bytes": upload.size})
+
+    # Dekodeeri helin taustal ette, et helistamine ei peaks seda tegema
+    sound_cache.load_in_background(tenant_id, db_sound.id, file_path)
     return db_sound
 
-@app.delete("/sounds/{sound_id}")
+@router.delete("/sounds/{sound_id}")
 def delete_sound(
     sound_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    sound = db.query(models.Sound).filter(models.Sound.id == sound_id).first()
+    sound = db.query(models.Sound).filter(
+        models.Sound.tenant_id == current_user.tenant_id,
+        models.Sound.id == sound_id
+    ).first()
     if not sound:
         raise HTTPException(status_code=404, detail="Helin ei leitud")
     
-    # Kustuta fail
-    file_path = os.path.join(SOUNDS_DIRECTORY, sound.filename)
-    if os.path.exists(file_path):
-        os.remove(file_path)
+    # Kontrolli, kas helinat kasutatakse (välisvõtmed on jõustatud)
+    in_use = db.query(models.TimetableEvent.id).filter(
+        models.TimetableEvent.sound_id == sound_id
+    ).first() or db.query(models.EventTemplateItem.id).filter(
+        models.EventTemplateItem.sound_id == sound_id
+    ).first()
+    if in_use:
+        raise HTTPException(status_code=400, detail="Helin on kasutusel")
     
-    # Kustuta andmebaasist
+    # Kustuta andmebaasist ja vabasta sisufail
+    content_hash = sound.content_hash
     db.delete(sound)
+    db.flush()
+    orphaned = storage.release_blob(db, content_hash)
     db.commit()
+
+    directory = tenants.database(current_user.tenant_id).sounds_directory
+    if orphaned:
+        storage.remove_orphan_blob(db, content_hash, directory)
+    elif not content_hash:
+        # Vana, räsita salvestatud helifail
+        file_path = os.path.join(directory, sound.filename)
+        if os.path.exists(file_path):
+            os.remove(file_path)
     
     return {"message": "Helin kustutatud"}
 
 # Tunniplaanid
-@app.get("/timetables", response_model=List[schemas.Timetable])
-def get_timetables(
-    db: Session = Depends(get_db),
+def check_timetable_overlap(
+    db: Session,
+    user_id: int,
+    timetable: schemas.TimetableCreate,
+    exclude_id: Optional[int] = None
+) -> None:
+    # Sama prioriteediga (kehtivusajaga või vaikimisi) tunniplaanid ei tohi
+    # kattuda nii kuupäevade kui ka nädalapäevade poolest (disainidokument 6.3).
+    # Päring kasutab indeksit (user_id, valid_from, valid_until) ja tagastab
+    # kõik konfliktid korraga.
+    if timetable.valid_until is not None and timetable.valid_until < timetable.valid_from:
+        raise HTTPException(
+            status_code=400,
+            detail="Kehtivuse lõpp peab olema hilisem kui algus"
+        )
+    Timetable = models.Timetable
+    query = db.query(Timetable).filter(
+        Timetable.user_id == user_id,
+        Timetable.weekdays.op("&")(timetable.weekdays) != 0
+    )
+    if timetable.valid_until is None:
+        query = query.filter(
+            Timetable.valid_until.is_(None)
+        )
+    else:
+        query = query.filter(
+            Timetable.valid_until.isnot(None),
+            Timetable.valid_from <= timetable.valid_until,
+            Timetable.valid_until >= timetable.valid_from
+        )
+    if exclude_id is not None:
+        query = query.filter(Timetable.id != exclude_id)
+    conflicts = query.order_by(Timetable.valid_from).all()
+    if conflicts:
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "message": "Tunniplaan kattub sama prioriteediga tunniplaaniga",
+                "conflicts": [
+                    schemas.TimetableConflict.model_validate(conflict).model_dump(mode="json")
+                    for conflict in conflicts
+                ]
+            }
+        )
+
+@router.get("/timetables", response_model=Union[List[schemas.Timetable], schemas.ListDelta[schemas.Timetable]])
+async def get_timetables(
+    request: Request,
+    response: Response,
+    since: Optional[int] = None,
+    db: AsyncSession = Depends(security.get_tenant_async_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    return db.query(models.Timetable).filter(models.Timetable.user_id == current_user.id).all()
+    async def load(ids):
+        query = select(models.Timetable).where(models.Timetable.user_id == current_user.id)
+        if ids is not None:
+            query = query.where(models.Timetable.id.in_(ids))
+        return (await db.execute(query)).scalars().all()
+    # Tunniplaanide "vanem" on kasutaja, seega revisjon ja muudatused on kasutajapõhised
+    return await list_response(
+        request, response, current_user.tenant_id, "timetables", since, load, schemas.Timetable,
+        cache_key=current_user.id, tags=[("timetables", current_user.id)], parent_id=current_user.id
+    )
 
-@app.post("/timetables", response_model=schemas.Timetable)
+@router.post("/timetables", response_model=schemas.Timetable)
 def create_timetable(
     timetable: schemas.TimetableCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    # Kontrolli, kas sama nimega tunniplaan juba eksisteerib
-    existing = db.query(models.Timetable).filter(
+    # Kontrolli, kas sama nimega tunniplaan juba eksisteerib (kooli piires)
+    existing = db.query(models.Timetable.id).filter(
+        models.Timetable.tenant_id == current_user.tenant_id,
         models.Timetable.name == timetable.name
     ).first()
     if existing:
@@ -180,32 +461,52 @@ def create_timetable(
             status_code=400,
             detail="Sama nimega tunniplaan on juba olemas"
         )
+    check_timetable_overlap(db, current_user.id, timetable)
 
-    db_timetable = models.Timetable(**timetable.model_dump(), user_id=current_user.id)
+    db_timetable = models.Timetable(
+        **timetable.model_dump(), tenant_id=current_user.tenant_id, user_id=current_user.id
+    )
     db.add(db_timetable)
     db.commit()
     db.refresh(db_timetable)
     return db_timetable
 
-@app.get("/timetables/{timetable_id}", response_model=schemas.Timetable)
-def get_timetable(
+# Lahendatud ajakava sõltub kasutaja tunniplaanidest, nende sündmustest ja pühadest
+def schedule_tags(user_id: int):
+    return [("timetables", user_id), ("timetable_events", None), ("holidays", None)]
+
+@router.get("/timetables/by-date/{day}", response_model=schemas.DaySchedule)
+async def get_timetable_by_date(
+    day: date,
+    db: AsyncSession = Depends(security.get_tenant_async_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    engine = schedule_engines.get(current_user.tenant_id)
+    return await response_cache.json(
+        "/timetables/by-date/{day}", current_user.tenant_id, (current_user.id, day),
+        schedule_tags(current_user.id), schemas.DaySchedule,
+        lambda: engine.resolve_async(db, current_user.id, day)
+    )
+
+@router.get("/timetables/{timetable_id}", response_model=schemas.Timetable)
+async def get_timetable(
     timetable_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(security.get_tenant_async_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    timetable = db.query(models.Timetable).filter(
+    timetable = (await db.execute(select(models.Timetable).where(
         models.Timetable.id == timetable_id,
         models.Timetable.user_id == current_user.id
-    ).first()
+    ))).scalar_one_or_none()
     if timetable is None:
         raise HTTPException(status_code=404, detail="Tunniplaan ei leitud")
     return timetable
 
-@app.put("/timetables/{timetable_id}", response_model=schemas.Timetable)
+@router.put("/timetables/{timetable_id}", response_model=schemas.Timetable)
 def update_timetable(
     timetable_id: int,
     timetable: schemas.TimetableCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
     db_timetable = db.query(models.Timetable).filter(
@@ -216,7 +517,8 @@ def update_timetable(
         raise HTTPException(status_code=404, detail="Tunniplaan ei leitud")
     
     # Kontrolli, kas sama nimega tunniplaan juba eksisteerib (välja arvatud praegune)
-    existing = db.query(models.Timetable).filter(
+    existing = db.query(models.Timetable.id).filter(
+        models.Timetable.tenant_id == current_user.tenant_id,
         models.Timetable.name == timetable.name,
         models.Timetable.id != timetable_id
     ).first()
@@ -225,6 +527,7 @@ def update_timetable(
             status_code=400,
             detail="Sama nimega tunniplaan on juba olemas"
         )
+    check_timetable_overlap(db, current_user.id, timetable, exclude_id=timetable_id)
     
     for key, value in timetable.model_dump().items():
         setattr(db_timetable, key, value)
@@ -233,10 +536,10 @@ def update_timetable(
     db.refresh(db_timetable)
     return db_timetable
 
-@app.delete("/timetables/{timetable_id}")
+@router.delete("/timetables/{timetable_id}")
 def delete_timetable(
     timetable_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
     timetable = db.query(models.Timetable).filter(
@@ -251,20 +554,37 @@ def delete_timetable(
     return {"message": "Tunniplaan kustutatud"}
 
 # Mallid
-@app.get("/templates", response_model=List[schemas.EventTemplate])
-def get_templates(
-    db: Session = Depends(get_db),
+@router.get("/templates", response_model=Union[List[schemas.EventTemplate], schemas.ListDelta[schemas.EventTemplate]])
+async def get_templates(
+    request: Request,
+    response: Response,
+    since: Optional[int] = None,
+    db: AsyncSession = Depends(security.get_tenant_async_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    return db.query(models.EventTemplate).all()
+    async def load(ids):
+        # Malli read laetakse ühe lisapäringuga kõigi mallide jaoks korraga
+        query = select(models.EventTemplate).options(selectinload(models.EventTemplate.items)).where(
+            models.EventTemplate.tenant_id == current_user.tenant_id
+        )
+        if ids is not None:
+            query = query.where(models.EventTemplate.id.in_(ids))
+        return (await db.execute(query.order_by(models.EventTemplate.id))).scalars().all()
+    return await list_response(
+        request, response, current_user.tenant_id, "event_templates", since, load, schemas.EventTemplate,
+        cache_key=current_user.id, tags=[("event_templates", None), ("event_template_items", None)]
+    )
 
-@app.post("/templates", response_model=schemas.EventTemplate)
+@router.post("/templates", response_model=schemas.EventTemplate)
 def create_template(
     template: schemas.EventTemplateCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
+    ensure_sounds_exist(db, current_user.tenant_id, [item.sound_id for item in template.items])
+
     db_template = models.EventTemplate(
+        tenant_id=current_user.tenant_id,
         name=template.name,
         description=template.description
     )
@@ -275,6 +595,7 @@ def create_template(
     for item in template.items:
         db_item = models.EventTemplateItem(
             **item.model_dump(),
+            tenant_id=current_user.tenant_id,
             template_id=db_template.id
         )
         db.add(db_item)
@@ -283,45 +604,98 @@ def create_template(
     return db_template
 
 # Pühad
-@app.get("/holidays", response_model=List[schemas.Holiday])
-def get_holidays(
-    db: Session = Depends(get_db),
+@router.get("/holidays", response_model=Union[List[schemas.Holiday], schemas.ListDelta[schemas.Holiday]])
+async def get_holidays(
+    request: Request,
+    response: Response,
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    since: Optional[int] = None,
+    db: AsyncSession = Depends(security.get_tenant_async_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    async def load(ids):
+        query = select(models.Holiday).where(models.Holiday.tenant_id == current_user.tenant_id)
+        if date_from is not None:
+            query = query.where(models.Holiday.valid_until >= date_from)
+        if date_to is not None:
+            query = query.where(models.Holiday.valid_from <= date_to)
+        if ids is not None:
+            query = query.where(models.Holiday.id.in_(ids))
+        return (await db.execute(query.order_by(models.Holiday.valid_from))).scalars().all()
+    return await list_response(
+        request, response, current_user.tenant_id, "holidays", since, load, schemas.Holiday,
+        cache_key=(current_user.id, date_from, date_to), tags=[("holidays", None)]
+    )
+
+@router.post("/holidays/import", response_model=List[schemas.Holiday])
+async def import_holidays(
+    calendar_file: UploadFile = File(...),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    return db.query(models.Holiday).all()
+    MAX_CALENDAR_SIZE = 1024 * 1024  # 1MB
+    contents = await calendar_file.read(MAX_CALENDAR_SIZE + 1)
+    if len(contents) > MAX_CALENDAR_SIZE:
+        raise HTTPException(status_code=400, detail="Fail on liiga suur (max 1MB)")
+    try:
+        text = contents.decode("utf-8-sig")
+        ranges = holidays.parse_calendar(calendar_file.filename or "", text)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Fail peab olema UTF-8 kodeeringus")
+    except holidays.HolidayImportError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return await run_in_threadpool(holidays.import_holidays, db, ranges, current_user.tenant_id)
 
-@app.post("/holidays", response_model=schemas.Holiday)
+@router.post("/holidays", response_model=schemas.Holiday)
 def create_holiday(
     holiday: schemas.HolidayCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    db_holiday = models.Holiday(**holiday.model_dump())
+    db_holiday = models.Holiday(**holiday.model_dump(), tenant_id=current_user.tenant_id)
     db.add(db_holiday)
     db.commit()
     db.refresh(db_holiday)
     return db_holiday
 
 # Tunniplaani sündmused
-@app.get("/timetables/{timetable_id}/events", response_model=List[schemas.TimetableEvent])
-def get_timetable_events(
+@router.get(
+    "/timetables/{timetable_id}/events",
+    response_model=Union[List[schemas.TimetableEvent], schemas.ListDelta[schemas.TimetableEvent]]
+)
+async def get_timetable_events(
     timetable_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    since: Optional[int] = None,
+    db: AsyncSession = Depends(security.get_tenant_async_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
-    timetable = db.query(models.Timetable).filter(
+    timetable = (await db.execute(select(models.Timetable.id).where(
         models.Timetable.id == timetable_id,
         models.Timetable.user_id == current_user.id
-    ).first()
+    ))).first()
     if timetable is None:
         raise HTTPException(status_code=404, detail="Tunniplaan ei leitud")
-    return timetable.events
+    
+    async def load(ids):
+        query = select(models.TimetableEvent).where(models.TimetableEvent.timetable_id == timetable_id)
+        if ids is not None:
+            query = query.where(models.TimetableEvent.id.in_(ids))
+        query = query.order_by(models.TimetableEvent.event_time, models.TimetableEvent.id)
+        return (await db.execute(query)).scalars().all()
+    return await list_response(
+        request, response, current_user.tenant_id, "timetable_events", since, load, schemas.TimetableEvent,
+        cache_key=(current_user.id, timetable_id), tags=[("timetable_events", timetable_id)],
+        parent_id=timetable_id
+    )
 
-@app.post("/timetables/{timetable_id}/events", response_model=schemas.TimetableEvent)
+@router.post("/timetables/{timetable_id}/events", response_model=schemas.TimetableEvent)
 def create_timetable_event(
     timetable_id: int,
     event: schemas.TimetableEventCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
     timetable = db.query(models.Timetable).filter(
@@ -330,19 +704,140 @@ def create_timetable_event(
     ).first()
     if timetable is None:
         raise HTTPException(status_code=404, detail="Tunniplaan ei leitud")
+    ensure_sounds_exist(db, current_user.tenant_id, [event.sound_id])
     
-    db_event = models.TimetableEvent(**event.model_dump(), timetable_id=timetable_id)
+    db_event = models.TimetableEvent(
+        **event.model_dump(), tenant_id=current_user.tenant_id, timetable_id=timetable_id
+    )
     db.add(db_event)
     db.commit()
     db.refresh(db_event)
     return db_event
 
-@app.put("/timetables/{timetable_id}/events/{event_id}", response_model=schemas.TimetableEvent)
+@router.patch("/timetables/{timetable_id}/events", response_model=List[schemas.TimetableEvent])
+def batch_timetable_events(
+    timetable_id: int,
+    batch: schemas.TimetableEventBatch,
+    db: Session = Depends(security.get_tenant_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    timetable = db.query(models.Timetable.id).filter(
+        models.Timetable.id == timetable_id,
+        models.Timetable.user_id == current_user.id
+    ).first()
+    if timetable is None:
+        raise HTTPException(status_code=404, detail="Tunniplaan ei leitud")
+    
+    # Valideeri kogu muudatus enne kirjutamist
+    update_ids = [event.id for event in batch.update]
+    delete_ids = list(set(batch.delete))
+    if len(set(update_ids)) != len(update_ids) or set(update_ids) & set(delete_ids):
+        raise HTTPException(status_code=400, detail="Sündmust saab muuta või kustutada ainult üks kord")
+    
+    touched_ids = set(update_ids) | set(delete_ids)
+    if touched_ids:
+        owned = {row.id for row in db.query(models.TimetableEvent.id).filter(
+            models.TimetableEvent.id.in_(touched_ids),
+            models.TimetableEvent.timetable_id == timetable_id
+        )}
+        if touched_ids - owned:
+            raise HTTPException(status_code=404, detail="Sündmus ei leitud")
+    
+    tenant_id = current_user.tenant_id
+    ensure_sounds_exist(db, tenant_id, [event.sound_id for event in batch.create + batch.update])
+    
+    # Kirjuta kõik ühe tehinguga
+    if batch.create:
+        mappings = [
+            {**event.model_dump(), "tenant_id": tenant_id, "timetable_id": timetable_id}
+            for event in batch.create
+        ]
+        db.bulk_insert_mappings(models.TimetableEvent, mappings, return_defaults=True)
+        changes.record(db, "timetable_events", "insert", [m["id"] for m in mappings], timetable_id, tenant_id)
+    if batch.update:
+        db.bulk_update_mappings(
+            models.TimetableEvent,
+            [{**event.model_dump(), "timetable_id": timetable_id} for event in batch.update]
+        )
+        changes.record(db, "timetable_events", "update", update_ids, timetable_id, tenant_id)
+    if delete_ids:
+        db.query(models.TimetableEvent).filter(
+            models.TimetableEvent.id.in_(delete_ids),
+            models.TimetableEvent.timetable_id == timetable_id
+        ).delete(synchronize_session=False)
+        changes.record(db, "timetable_events", "delete", delete_ids, timetable_id, tenant_id)
+    db.commit()
+    
+    return db.query(models.TimetableEvent).filter(
+        models.TimetableEvent.timetable_id == timetable_id
+    ).order_by(models.TimetableEvent.event_time, models.TimetableEvent.id).all()
+
+@router.post("/timetables/{timetable_id}/apply-template", response_model=List[schemas.TimetableEvent])
+def apply_template(
+    timetable_id: int,
+    template_apply: schemas.TemplateApply,
+    db: Session = Depends(security.get_tenant_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    timetable = db.query(models.Timetable.id).filter(
+        models.Timetable.id == timetable_id,
+        models.Timetable.user_id == current_user.id
+    ).first()
+    if timetable is None:
+        raise HTTPException(status_code=404, detail="Tunniplaan ei leitud")
+    
+    tenant_id = current_user.tenant_id
+    items = db.query(
+        models.EventTemplateItem.offset_minutes,
+        models.EventTemplateItem.event_name,
+        models.EventTemplateItem.sound_id
+    ).filter(
+        models.EventTemplateItem.tenant_id == tenant_id,
+        models.EventTemplateItem.template_id == template_apply.template_id
+    ).all()
+    if not items:
+        raise HTTPException(status_code=404, detail="Mall ei leitud")
+    
+    # Iga baasaeg saab oma malli instantsi id (kooli piires); vea korral
+    # tehing tühistatakse ja loendur jääb muutmata
+    first_instance_id = templates.allocate_instance_ids(db, tenant_id, len(template_apply.base_times))
+    
+    # Laienda kõik malli read kõigi baasaegade vastu ühe läbikäiguga
+    mappings = []
+    for index, base_time in enumerate(template_apply.base_times):
+        base_minutes = base_time.hour * 60 + base_time.minute
+        for offset_minutes, event_name, sound_id in items:
+            minutes = base_minutes + offset_minutes
+            if not 0 <= minutes < 24 * 60:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Malli sündmus jääb väljapoole päeva (00:00-23:59)"
+                )
+            mappings.append({
+                "tenant_id": tenant_id,
+                "timetable_id": timetable_id,
+                "event_name": event_name,
+                "event_time": time(minutes // 60, minutes % 60, base_time.second),
+                "sound_id": sound_id,
+                "template_instance_id": first_instance_id + index,
+                "is_template_base": offset_minutes == 0,
+            })
+    
+    db.bulk_insert_mappings(models.TimetableEvent, mappings, return_defaults=True)
+    created_ids = [m["id"] for m in mappings]
+    changes.record(db, "timetable_events", "insert", created_ids, timetable_id, tenant_id)
+    db.commit()
+    
+    return db.query(models.TimetableEvent).filter(
+        models.TimetableEvent.id.in_(created_ids)
+    ).order_by(models.TimetableEvent.event_time, models.TimetableEvent.id).all()
+
+@router.put("/timetables/{timetable_id}/events/{event_id}", response_model=schemas.TimetableEvent)
 def update_timetable_event(
     timetable_id: int,
     event_id: int,
     event: schemas.TimetableEventCreate,
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
     # Kontrolli, kas tunniplaan kuulub kasutajale
@@ -360,6 +855,7 @@ def update_timetable_event(
     ).first()
     if db_event is None:
         raise HTTPException(status_code=404, detail="Sündmus ei leitud")
+    ensure_sounds_exist(db, current_user.tenant_id, [event.sound_id])
     
     for key, value in event.model_dump().items():
         setattr(db_event, key, value)
@@ -368,11 +864,11 @@ def update_timetable_event(
     db.refresh(db_event)
     return db_event
 
-@app.delete("/timetables/{timetable_id}/events/{event_id}")
+@router.delete("/timetables/{timetable_id}/events/{event_id}")
 def delete_timetable_event(
     timetable_id: int,
     event_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(security.get_tenant_db),
     current_user: models.User = Depends(security.get_current_user)
 ):
     # Kontrolli, kas tunniplaan kuulub kasutajale
@@ -394,3 +890,134 @@ def delete_timetable_event(
     db.delete(event)
     db.commit()
     return {"message": "Sündmus kustutatud"}
+
+# Kalender
+MAX_CALENDAR_DAYS = 366
+
+@router.get("/calendar", response_model=List[schemas.CalendarDay])
+async def get_calendar(
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    db: AsyncSession = Depends(security.get_tenant_async_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="Vahemiku lõpp on enne algust")
+    if (date_to - date_from).days >= MAX_CALENDAR_DAYS:
+        raise HTTPException(status_code=400, detail="Vahemik on liiga pikk (max 366 päeva)")
+    engine = schedule_engines.get(current_user.tenant_id)
+    return await response_cache.json(
+        "/calendar", current_user.tenant_id, (current_user.id, date_from, date_to),
+        schedule_tags(current_user.id), List[schemas.CalendarDay],
+        lambda: engine.resolve_range_async(db, current_user.id, date_from, date_to)
+    )
+
+# Järgmised kellad
+@router.get("/bells/next", response_model=List[schemas.Bell])
+async def get_next_bells(
+    after: Optional[datetime] = None,
+    count: int = Query(10, ge=1, le=500),
+    db: AsyncSession = Depends(security.get_tenant_async_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    if after is None:
+        after = datetime.now()
+    elif after.tzinfo is not None:
+        # Kellaajad on serveri kohalikus ajas
+        after = after.astimezone().replace(tzinfo=None)
+    engine = schedule_engines.get(current_user.tenant_id)
+    return await engine.next_bells_async(db, current_user.id, after, count)
+
+# Eksport ja import
+@router.get("/export")
+def export_archive(
+    export_format: str = Query("json", alias="format", pattern="^(json|csv|ics)$"),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    media_type, extension = archive.EXPORT_FORMATS[export_format]
+    return StreamingResponse(
+        archive.stream_export(
+            tenants.database(current_user.tenant_id).session_factory,
+            current_user.tenant_id, current_user.id, export_format
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="lible-export.{extension}"'}
+    )
+
+@router.post("/import", response_model=Dict[str, int])
+async def import_archive(
+    archive_file: UploadFile = File(...),
+    db: Session = Depends(security.get_tenant_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    # Fail loetakse rida realt; Starlette hoiab suure üleslaadimise kettal
+    stream = io.TextIOWrapper(archive_file.file, encoding="utf-8-sig")
+    try:
+        return await run_in_threadpool(archive.import_json, db, current_user.tenant_id, current_user.id, stream)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Fail peab olema UTF-8 kodeeringus")
+    except archive.ArchiveImportError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        stream.detach()
+
+# Reaalajas teavitused: muudatused ja kellade olek
+@router.websocket("/ws")
+async def updates_websocket(websocket: WebSocket, token: str = Query(...)):
+    # Brauseri WebSocket ei saada Authorization päist, token tuleb URL-is
+    try:
+        current_user = await security.get_current_user(token=token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    client = hub.connect(current_user.tenant_id, current_user.id)
+    
+    async def send(cancel_scope):
+        while True:
+            text = await client.queue.get()
+            if text is None:
+                await websocket.close()
+                break
+            await websocket.send_text(text)
+        cancel_scope.cancel()
+    
+    async def receive(cancel_scope):
+        # Kliendi teateid ei oodata, loeme ainult ühenduse sulgemiseni
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        cancel_scope.cancel()
+    
+    try:
+        async with anyio.create_task_group() as tasks:
+            tasks.start_soon(send, tasks.cancel_scope)
+            tasks.start_soon(receive, tasks.cancel_scope)
+    finally:
+        hub.disconnect(client)
+
+# Mõõdikud (Prometheuse tekstivorming). Sisaldavad kõigi koolide loendureid
+# ja viiteid, seega on need sisselogimise taga; server.metrics_allow
+# aadressidelt (nt kohalik Prometheus) loetakse neid ilma tokenita.
+METRICS_ALLOW = set(settings.server.metrics_allow)
+
+async def metrics_access(request: Request, token: Optional[str] = Depends(security.optional_oauth2_scheme)):
+    if request.client is not None and request.client.host in METRICS_ALLOW:
+        return
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Mõõdikud nõuavad sisselogimist",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    await security.get_current_user(token)
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(metrics_access)])
+async def get_metrics():
+    telemetry.update_threadpool_metrics()
+    return metrics.render()
+
+app = create_app()
@@ -0,0 +1,79 @@
+from typing import Optional
+import logging
+import os
+from sqlalchemy import inspect, text
+from .config import BACKEND_DIRECTORY, settings
+from .database import engine
+
+# Andmebaasi skeemi uuendamine Alembicu migratsioonidega.
+#
+#   cd backend
+#   python -m app.migrate
+#
+# Paigaldamisel võib selle teha enne serveri käivitamist ja seada
+# database.migrate_on_startup väärtusele false. Rakenduse käivitus
+# kontrollib siis ainult versiooni (üks päring), Alembicut ei impordita.
+# Server ise töötab ühe protsessina (vt instance_lock).
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(BACKEND_DIRECTORY, "alembic.ini")
+MIGRATIONS_DIRECTORY = os.path.join(BACKEND_DIRECTORY, "migrations")
+
+# Viimane migratsioon; uue migratsiooni lisamisel tuleb ka see muuta
+HEAD_REVISION = "0003"
+
+def current_revision(bind=engine) -> Optional[str]:
+    with bind.connect() as connection:
+        if not inspect(connection).has_table("alembic_version"):
+            return None
+        return connection.execute(text("SELECT version_num FROM alembic_version")).scalar()
+
+class ForeignKeyViolation(RuntimeError):
+    pass
+
+def _check_foreign_keys(connection) -> None:
+    # Kuna kontroll oli migratsiooni ajal väljas, kontrollitakse viiteid enne
+    # commit'i; rikkumise korral tehing tühistatakse
+    rows = connection.exec_driver_sql("PRAGMA foreign_key_check").fetchall()
+    if rows:
+        tables = sorted({row[0] for row in rows})
+        raise ForeignKeyViolation(
+            f"Migratsioon jättis {len(rows)} katkist välisvõtit (tabelid: {', '.join(tables)})"
+        )
+
+def upgrade_database(bind=engine, revision: str = "head") -> None:
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", MIGRATIONS_DIRECTORY)
+    with bind.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # Batch-režiim loob tabelid uuesti (DROP TABLE), mis välisvõtmete
+            # kontrolliga ebaõnnestub, kui tabelile viitavad read. PRAGMA ei
+            # mõju tehingu sees, seega lülitatakse kontroll välja enne tehingut.
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+        try:
+            with connection.begin():
+                config.attributes["connection"] = connection
+                command.upgrade(config, revision)
+                if sqlite:
+                    _check_foreign_keys(connection)
+        finally:
+            if sqlite:
+                connection.exec_driver_sql(f"PRAGMA foreign_keys={'ON' if settings.database.foreign_keys else 'OFF'}")
+                connection.commit()
+
+def ensure_schema(bind=engine) -> None:
+    revision = current_revision(bind)
+    if revision == HEAD_REVISION:
+        return
+    logger.info("Andmebaasi skeemi uuendamine", extra={"from_revision": revision, "to_revision": HEAD_REVISION})
+    upgrade_database(bind)
+
+if __name__ == "__main__":
+    upgrade_database()
+    print(f"Andmebaasi skeem on versioonil {current_revision()}")
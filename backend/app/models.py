@@ -1,12 +1,34 @@
-from sqlalchemy import Column, Integer, String, Date, Time, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, Time, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 
+# Kõik andmed kuuluvad ühele koolile (tenant). Ühise andmebaasi puhul
+# algavad indeksid tenant_id-ga, et ühe kooli päringud ei loeks teiste ridu;
+# kooli oma andmebaasifailis on kõigil ridadel sama tenant_id.
+DEFAULT_TENANT_ID = 1
+
+def tenant_column():
+    return Column(Integer, ForeignKey("tenants.id"), nullable=False, default=DEFAULT_TENANT_ID)
+
+class Tenant(Base):
+    __tablename__ = "tenants"
+
+    id = Column(Integer, primary_key=True)
+    slug = Column(String, unique=True, nullable=False)  # nt X-Lible-Tenant päises
+    name = Column(String)
+    # Järgmine vaba malli instantsi id (vt templates.allocate_instance_ids)
+    next_template_instance_id = Column(Integer, nullable=False, default=1, server_default="1")
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Kasutajanimi on unikaalne kooli piires
+        Index("ix_users_tenant_username", "tenant_id", "username", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True)
+    tenant_id = tenant_column()
+    username = Column(String)
     password_hash = Column(String)
     is_local_auth = Column(Boolean, default=True)
     language = Column(String, default="et")
@@ -15,9 +37,16 @@ class User(Base):
 
 class Timetable(Base):
     __tablename__ = "timetables"
+    __table_args__ = (
+        # Kehtivusaegade kattuvuse kontroll (vahemikupäring valid_from järgi)
+        Index("ix_timetables_user_validity", "user_id", "valid_from", "valid_until"),
+        # Nime unikaalsuse kontroll kooli piires
+        Index("ix_timetables_tenant_name", "tenant_id", "name"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String)
+    tenant_id = tenant_column()
+    name = Column(String, index=True)
     valid_from = Column(Date)
     valid_until = Column(Date, nullable=True)
     weekdays = Column(Integer)  # Bitmask: 1=E, 2=T, 4=K, 8=N, 16=R, 32=L, 64=P
@@ -28,8 +57,12 @@ class Timetable(Base):
 
 class TimetableEvent(Base):
     __tablename__ = "timetable_events"
+    __table_args__ = (
+        Index("ix_timetable_events_tenant_timetable", "tenant_id", "timetable_id", "event_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = tenant_column()
     timetable_id = Column(Integer, ForeignKey("timetables.id", ondelete="CASCADE"))
     event_name = Column(String)
     event_time = Column(Time)
@@ -42,8 +75,12 @@ class TimetableEvent(Base):
 
 class EventTemplate(Base):
     __tablename__ = "event_templates"
+    __table_args__ = (
+        Index("ix_event_templates_tenant", "tenant_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = tenant_column()
     name = Column(String)
     description = Column(String, nullable=True)
 
@@ -51,8 +88,12 @@ class EventTemplate(Base):
 
 class EventTemplateItem(Base):
     __tablename__ = "event_template_items"
+    __table_args__ = (
+        Index("ix_event_template_items_tenant_template", "tenant_id", "template_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = tenant_column()
     template_id = Column(Integer, ForeignKey("event_templates.id", ondelete="CASCADE"))
     offset_minutes = Column(Integer)
     event_name = Column(String)
@@ -63,14 +104,35 @@ class EventTemplateItem(Base):
 
 class Sound(Base):
     __tablename__ = "sounds"
+    __table_args__ = (
+        Index("ix_sounds_tenant_name", "tenant_id", "name"),
+        Index("ix_sounds_tenant_content_hash", "tenant_id", "content_hash"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = tenant_column()
     name = Column(String)
     filename = Column(String)
+    content_hash = Column(String, ForeignKey("sound_blobs.hash"), nullable=True, index=True)
+
+    blob = relationship("SoundBlob")
+
+# Sisufailid on salvestuskiht: ühises andmebaasis jagavad sama sisuga
+# helinad üht faili ka koolide vahel (viited loendatakse üle kõigi koolide)
+class SoundBlob(Base):
+    __tablename__ = "sound_blobs"
+
+    hash = Column(String, primary_key=True)  # SHA-256, failinimi helinate kaustas
+    size = Column(Integer)
+    ref_count = Column(Integer, default=0)
 
 class Holiday(Base):
     __tablename__ = "holidays"
+    __table_args__ = (
+        Index("ix_holidays_tenant_range", "tenant_id", "valid_from", "valid_until"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    tenant_id = tenant_column()
     valid_from = Column(Date)
     valid_until = Column(Date)
@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+from typing import Optional
+import logging
+import mmap
+import os
+
+try:
+    import miniaudio
+except ImportError:  # Dekodeerimine on valikuline
+    miniaudio = None
+
+try:
+    import simpleaudio
+except ImportError:  # Heliväljund on valikuline
+    simpleaudio = None
+
+# Helinate dekodeerimine ja esitamine. Moodul kasutab ainult
+# standardteeki ja valikulisi helipakette, et ka eraldi kellamängija
+# (app.player) saaks seda kasutada ilma andmebaasikihita.
+
+logger = logging.getLogger(__name__)
+
+# Kõik helinad dekodeeritakse ühte väljundvormingusse
+SAMPLE_RATE = 44100
+CHANNELS = 2
+SAMPLE_WIDTH = 2  # 16-bit
+
+@dataclass(frozen=True)
+class PcmBuffer:
+    data: memoryview
+    sample_rate: int = SAMPLE_RATE
+    channels: int = CHANNELS
+    sample_width: int = SAMPLE_WIDTH
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+def pcm_path(pcm_directory: str, path: str) -> str:
+    # Dekodeeritud fail on nimetatud helifaili (sisu räsi) järgi
+    return os.path.join(pcm_directory, os.path.basename(path) + ".pcm")
+
+def decode_file(path: str, mmap_path: Optional[str] = None) -> PcmBuffer:
+    if miniaudio is None:
+        raise RuntimeError("Helinate dekodeerimiseks on vaja miniaudio paketti")
+    decoded = miniaudio.decode_file(
+        path,
+        output_format=miniaudio.SampleFormat.SIGNED16,
+        nchannels=CHANNELS,
+        sample_rate=SAMPLE_RATE,
+    )
+    pcm = decoded.samples.tobytes()
+    if mmap_path is None:
+        return PcmBuffer(data=memoryview(pcm))
+
+    # Kirjutame PCM-i kettale ja kaardistame selle mällu
+    os.makedirs(os.path.dirname(mmap_path), exist_ok=True)
+    tmp_path = mmap_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pcm)
+    os.replace(tmp_path, mmap_path)
+    return map_file(mmap_path)
+
+def map_file(path: str) -> PcmBuffer:
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return PcmBuffer(data=memoryview(mapped))
+
+def load(path: str, mmap_path: Optional[str] = None) -> PcmBuffer:
+    # Varem dekodeeritud PCM fail kaardistatakse, kui see on helifailist uuem
+    if mmap_path and os.path.exists(mmap_path) \
+            and os.path.getmtime(mmap_path) >= os.path.getmtime(path):
+        return map_file(mmap_path)
+    return decode_file(path, mmap_path)
+
+def play(buffer: PcmBuffer) -> None:
+    if simpleaudio is None:
+        logger.warning("Heliväljund puudub (simpleaudio pole paigaldatud)")
+        return
+    simpleaudio.play_buffer(buffer.data, buffer.channels, buffer.sample_width, buffer.sample_rate)
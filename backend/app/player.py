@@ -0,0 +1,177 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Set, Tuple
+import argparse
+import logging
+import os
+import sys
+import time
+from . import pcm, playlist_file
+from .config import resolve_path, settings
+from .playlist_file import Playlist, PlaylistEntry
+
+# Kerge kellamängija: helistab app.playlist koostatud päevaloendite järgi.
+# Ei impordi SQLAlchemyt ega andmebaasimooduleid ja jätkab helistamist ka
+# siis, kui API või andmebaas pole kättesaadav. Uuendatud failid
+# kaardistatakse uuesti niipea, kui need muutuvad. API seadetes peab siis
+# olema scheduler.ring_in_process: false, muidu helistab kella ka API.
+#
+#   cd backend
+#   python -m app.player [--tenant 1] [--dry-run]
+
+logger = logging.getLogger("app.player")
+
+# Nii palju hilinenud kell helistatakse veel, vanemad jäetakse vahele
+GRACE_SECONDS = 5
+# Pikim ootamine järjest, et failide muutused jõuaksid kiiresti kohale
+POLL_SECONDS = 1.0
+
+FiredKey = Tuple[date, int, int, int]
+
+def _seconds_of_day(moment: datetime) -> float:
+    return moment.hour * 3600 + moment.minute * 60 + moment.second + moment.microsecond / 1e6
+
+class Player:
+    def __init__(self, directory: str, dry_run: bool = False):
+        self.directory = directory
+        self.dry_run = dry_run
+        self._playlists: Dict[date, Playlist] = {}
+        self._buffers: Dict[str, pcm.PcmBuffer] = {}
+        self._fired: Set[FiredKey] = set()
+
+    # Päevaloendid
+
+    def playlist(self, day: date) -> Optional[Playlist]:
+        # Fail kaardistatakse uuesti, kui see on asendatud (muutunud stamp)
+        path = playlist_file.day_path(self.directory, day)
+        current = self._playlists.get(day)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if current is not None:
+                current.close()
+                del self._playlists[day]
+            return None
+        if current is not None and current.stamp == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            return current
+        try:
+            playlist = Playlist(path)
+        except (OSError, ValueError) as exc:
+            # Vigase uue faili korral jääb kehtima eelmine
+            logger.warning("Esitusloendit %s ei õnnestunud lugeda: %s", path, exc)
+            return current
+        if current is not None:
+            current.close()
+        self._playlists[day] = playlist
+        logger.info("Esitusloend laaditud: %s (%d kella, põlvkond %d)", day, len(playlist), playlist.generation)
+        return playlist
+
+    def _forget_before(self, day: date) -> None:
+        for old in [d for d in self._playlists if d < day]:
+            self._playlists.pop(old).close()
+        self._fired = {key for key in self._fired if key[0] >= day}
+
+    def next_bell(self, now: datetime) -> Optional[Tuple[datetime, PlaylistEntry, Playlist]]:
+        # Järgmine helistamata kell alates ajapiirist (now - GRACE_SECONDS)
+        earliest = now - timedelta(seconds=GRACE_SECONDS)
+        for offset in range(2):
+            day = earliest.date() + timedelta(days=offset)
+            playlist = self.playlist(day)
+            if playlist is None:
+                continue
+            start = int(_seconds_of_day(earliest)) if offset == 0 else 0
+            for index in range(playlist.index_after(start), len(playlist)):
+                entry = playlist[index]
+                if (day, entry.event_id, entry.user_id, entry.seconds) not in self._fired:
+                    return datetime.combine(day, playlist_file.entry_time(entry)), entry, playlist
+        return None
+
+    # Helistamine
+
+    def ring(self, entry: PlaylistEntry, playlist: Playlist) -> None:
+        logger.info("Kell: %s %s (heli %s)", playlist_file.entry_time(entry), entry.event_name, entry.sound)
+        if self.dry_run:
+            return
+        buffer = self._buffer(os.path.join(playlist.sounds_directory, entry.sound))
+        if buffer is not None:
+            pcm.play(buffer)
+
+    def _buffer(self, path: str) -> Optional[pcm.PcmBuffer]:
+        buffer = self._buffers.get(path)
+        if buffer is None:
+            # API dekodeeritud PCM fail kasutatakse, kui see on olemas
+            pcm_directory = os.path.join(os.path.dirname(path), ".pcm")
+            mmap_path = pcm.pcm_path(pcm_directory, path)
+            try:
+                buffer = pcm.load(path, mmap_path if os.path.exists(mmap_path) else None)
+            except Exception as exc:
+                logger.warning("Helinat %s ei õnnestunud dekodeerida: %s", path, exc)
+                return None
+            self._buffers[path] = buffer
+        return buffer
+
+    def preload(self, day: date) -> None:
+        playlist = self.playlist(day)
+        if playlist is None or self.dry_run:
+            return
+        for sound in {entry.sound for entry in playlist}:
+            self._buffer(os.path.join(playlist.sounds_directory, sound))
+
+    # Põhitsükkel
+
+    def run_once(self, now: Optional[datetime] = None) -> float:
+        # Helistab kõik kätte jõudnud kellad ja tagastab ooteaja sekundites
+        now = now or datetime.now()
+        self._forget_before(now.date() - timedelta(days=1))
+        while True:
+            upcoming = self.next_bell(now)
+            if upcoming is None:
+                return POLL_SECONDS
+            at, entry, playlist = upcoming
+            wait = (at - now).total_seconds()
+            if wait > 0:
+                return min(wait, POLL_SECONDS)
+            self._fired.add((at.date(), entry.event_id, entry.user_id, entry.seconds))
+            self.ring(entry, playlist)
+
+    def run(self) -> None:
+        today = date.today()
+        self.preload(today)
+        self._fired_before(datetime.now())
+        while True:
+            time.sleep(self.run_once())
+            if date.today() != today:
+                today = date.today()
+                self.preload(today)
+
+    def _fired_before(self, now: datetime) -> None:
+        # Käivitamisel ei helistata juba möödunud kellasid
+        earliest = now - timedelta(seconds=GRACE_SECONDS)
+        for day in sorted({earliest.date(), now.date()}):
+            playlist = self.playlist(day)
+            if playlist is None:
+                continue
+            limit = len(playlist) if day < now.date() else playlist.index_after(int(_seconds_of_day(earliest)))
+            for index in range(limit):
+                entry = playlist[index]
+                self._fired.add((day, entry.event_id, entry.user_id, entry.seconds))
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.player", description="Lible kellamängija")
+    parser.add_argument("--tenant", type=int, default=1, help="kooli id (vaikimisi 1)")
+    parser.add_argument("--directory", default=settings.playlist.directory, help="esitusloendite kaust")
+    parser.add_argument("--dry-run", action="store_true", help="ainult logi, ära helista")
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=settings.logging.level.upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+    directory = os.path.join(resolve_path(args.directory), str(args.tenant))
+    logger.info("Kellamängija käivitatud: %s", directory)
+    try:
+        Player(directory, dry_run=args.dry_run).run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
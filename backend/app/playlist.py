@@ -0,0 +1,230 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set
+import asyncio
+import logging
+import os
+import time
+from . import changes, metrics, models, playlist_file
+from .config import resolve_path, settings
+from .playlist_file import PlaylistEntry
+from .revisions import revisions
+from .schedule import ScheduleEngines, schedule_engines
+from .tenancy import TenantRegistry, tenants
+
+logger = logging.getLogger(__name__)
+
+# Päevade esitusloendite koostamine: ajakava mootor lahendab iga kooli
+# järgmised päevad (tunniplaanide prioriteedid, pühad) ja tulemus kirjutatakse
+# kompaktse failina (vt playlist_file), mida kellamängija (app.player) loeb
+# ilma andmebaasita. Muudatuste järel koostatakse uuesti ainult mõjutatud
+# koolide loendid ja kirjutatakse ainult muutunud päevad.
+#
+#   cd backend
+#   python -m app.playlist
+
+PLAYLIST_DIRECTORY = resolve_path(settings.playlist.directory)
+PLAYLIST_DAYS = settings.playlist.days
+PLAYLIST_DEBOUNCE = settings.playlist.debounce_ms / 1000
+
+# Päeva vahetumisel lisandub uus päev; kontrollime vähemalt nii tihti
+REFRESH_INTERVAL = timedelta(hours=1)
+
+# Tabelid, millest esitusloend sõltub
+SOURCE_TABLES = {"timetables", "timetable_events", "holidays", "sounds"}
+
+playlist_builds = metrics.Histogram(
+    "lible_playlist_build_seconds", "Kooli esitusloendite koostamise kestus",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+playlist_writes = metrics.Counter("lible_playlist_files_written_total", "Kirjutatud esitusloendi failid")
+
+def tenant_directory(directory: str, tenant_id: int) -> str:
+    return os.path.join(directory, str(tenant_id))
+
+class PlaylistWriter:
+    def __init__(
+        self,
+        engines: ScheduleEngines = schedule_engines,
+        databases: TenantRegistry = tenants,
+        directory: str = PLAYLIST_DIRECTORY,
+        days: int = PLAYLIST_DAYS,
+        debounce: float = PLAYLIST_DEBOUNCE,
+    ):
+        self.engines = engines
+        self.databases = databases
+        self.directory = directory
+        self.days = max(1, days)
+        self.debounce = debounce
+        self._dirty: Set[int] = set()
+        self._dirty_all = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # Koostamine (lõimes)
+
+    def _collect(self, tenant_id: int, start: date, end: date) -> Dict[date, List[PlaylistEntry]]:
+        engine = self.engines.get(tenant_id)
+        db = engine.session_factory()
+        try:
+            resolved = []
+            for user_id in engine.user_ids(db):
+                for day in engine.resolve_range(db, user_id, start, end):
+                    resolved.extend((day.date, user_id, event) for event in day.events)
+            sound_ids = {event.sound_id for _, _, event in resolved if event.sound_id is not None}
+            sounds = dict(db.query(models.Sound.id, models.Sound.filename).filter(
+                models.Sound.tenant_id == tenant_id,
+                models.Sound.id.in_(sound_ids)
+            ).all()) if sound_ids else {}
+        finally:
+            db.close()
+
+        playlists: Dict[date, List[PlaylistEntry]] = {
+            start + timedelta(days=offset): [] for offset in range((end - start).days + 1)
+        }
+        for day, user_id, event in resolved:
+            sound = sounds.get(event.sound_id)
+            if sound is None:
+                # Helinata sündmust pole võimalik helistada
+                continue
+            at = event.event_time
+            playlists[day].append(PlaylistEntry(
+                seconds=at.hour * 3600 + at.minute * 60 + at.second,
+                event_id=event.id,
+                user_id=user_id,
+                sound=sound,
+                event_name=event.event_name or "",
+            ))
+        return playlists
+
+    def materialize(self, tenant_id: int, start: Optional[date] = None) -> int:
+        # Tagastab kirjutatud failide arvu
+        started = time.perf_counter()
+        start = start or date.today()
+        end = start + timedelta(days=self.days - 1)
+        sounds_directory = self.databases.database(tenant_id).sounds_directory
+        directory = tenant_directory(self.directory, tenant_id)
+        generation = revisions.revision
+        written = 0
+        for day, entries in self._collect(tenant_id, start, end).items():
+            path = playlist_file.day_path(directory, day)
+            entries.sort(key=lambda e: (e.seconds, e.event_id, e.user_id))
+            if self._unchanged(path, entries, sounds_directory):
+                continue
+            playlist_file.write(path, playlist_file.encode(day, entries, generation, sounds_directory))
+            written += 1
+        self._prune(directory, start)
+        playlist_writes.inc(written)
+        playlist_builds.observe(time.perf_counter() - started)
+        if written:
+            logger.info("Esitusloendid uuendatud", extra={"tenant_id": tenant_id, "files": written})
+        return written
+
+    @staticmethod
+    def _unchanged(path: str, entries: List[PlaylistEntry], sounds_directory: str) -> bool:
+        try:
+            with playlist_file.Playlist(path) as existing:
+                return existing.sounds_directory == sounds_directory and existing.entries() == entries
+        except (OSError, ValueError):
+            return False
+
+    @staticmethod
+    def _prune(directory: str, start: date) -> None:
+        # Möödunud päevade failid kustutatakse
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            day = playlist_file.file_day(name)
+            if day is not None and day < start:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def materialize_all(self) -> int:
+        return sum(self.materialize(tenant_id) for tenant_id in self.databases.tenant_ids())
+
+    # Elutsükkel
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._dirty_all = True
+        changes.subscribe(self._on_changes)
+        self._task = asyncio.create_task(self._run(), name="playlist-writer")
+
+    async def stop(self) -> None:
+        changes.unsubscribe(self._on_changes)
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    # Muudatused (kutsutakse commit'i teinud lõimest)
+
+    def _on_changes(self, batch: List[changes.Change]) -> None:
+        tenant_ids = {change.tenant_id for change in batch if change.table in SOURCE_TABLES}
+        if tenant_ids and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._mark_dirty, tenant_ids)
+
+    def _mark_dirty(self, tenant_ids: Set[Optional[int]]) -> None:
+        if None in tenant_ids:
+            self._dirty_all = True
+        self._dirty.update(tenant_id for tenant_id in tenant_ids if tenant_id is not None)
+        self._wake.set()
+
+    # Põhitsükkel
+
+    async def _run(self) -> None:
+        refresh_at = 0.0
+        while True:
+            try:
+                if self._dirty or self._dirty_all:
+                    # Lühikese aja jooksul tulnud muudatused koondatakse
+                    await asyncio.sleep(self.debounce)
+                if self._dirty_all or time.monotonic() >= refresh_at:
+                    self._dirty_all = False
+                    self._dirty.clear()
+                    await asyncio.to_thread(self.materialize_all)
+                    refresh_at = time.monotonic() + self._refresh_delay()
+                elif self._dirty:
+                    tenant_ids, self._dirty = self._dirty, set()
+                    for tenant_id in sorted(tenant_ids):
+                        await asyncio.to_thread(self.materialize, tenant_id)
+
+                timeout = refresh_at - time.monotonic()
+                if timeout > 0 and not (self._dirty or self._dirty_all):
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Esitusloendite koostamine ebaõnnestus")
+                await asyncio.sleep(1)
+
+    @staticmethod
+    def _refresh_delay() -> float:
+        # Järgmine kontroll hiljemalt veidi pärast keskööd
+        now = datetime.now()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        return min(REFRESH_INTERVAL.total_seconds(), (midnight - now).total_seconds() + 1)
+
+playlist_writer = PlaylistWriter()
+
+if __name__ == "__main__":
+    from . import migrate
+
+    migrate.ensure_schema()
+    written = playlist_writer.materialize_all()
+    print(f"Esitusloendid kaustas {PLAYLIST_DIRECTORY} ({written} faili uuendatud)")
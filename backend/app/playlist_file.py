@@ -0,0 +1,150 @@
+from collections import namedtuple
+from datetime import date, time
+from typing import Iterable, Iterator, List, Optional
+import mmap
+import os
+import struct
+
+# Päeva esitusloendi failivorming. Fail sisaldab ühe kooli ühe päeva kellasid
+# kellaaja järgi sorteeritult ja on mõeldud mälukaardistamiseks: päis,
+# fikseeritud pikkusega kirjed ja lõpus UTF-8 sõnede tabel. Moodul kasutab
+# ainult standardteeki (seda loeb ka app.player).
+#
+#   päis:  maagia "LBPL", vormingu versioon, päev (ordinaal), kirjete arv,
+#          põlvkond (API revisjon kirjutamise ajal), sõnede tabeli asukoht,
+#          helinate kausta asukoht sõnede tabelis
+#   kirje: sekundid keskööst, sündmuse id, kasutaja id, helifaili nimi
+#          (sisu räsi) ja sündmuse nimi viidetena sõnede tabelisse
+
+MAGIC = b"LBPL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHiIQIIII")
+ENTRY = struct.Struct("<IIIIIHH")
+SUFFIX = ".bin"
+
+PlaylistEntry = namedtuple("PlaylistEntry", "seconds event_id user_id sound event_name")
+
+class PlaylistFormatError(ValueError):
+    pass
+
+def entry_time(entry: PlaylistEntry) -> time:
+    return time(entry.seconds // 3600, entry.seconds // 60 % 60, entry.seconds % 60)
+
+def day_path(directory: str, day: date) -> str:
+    return os.path.join(directory, day.isoformat() + SUFFIX)
+
+def file_day(filename: str) -> Optional[date]:
+    if not filename.endswith(SUFFIX):
+        return None
+    try:
+        return date.fromisoformat(filename[:-len(SUFFIX)])
+    except ValueError:
+        return None
+
+def encode(day: date, entries: Iterable[PlaylistEntry], generation: int, sounds_directory: str) -> bytes:
+    entries = sorted(entries, key=lambda e: (e.seconds, e.event_id, e.user_id))
+    strings = bytearray()
+    offsets = {}
+
+    def intern(text: str):
+        data = text.encode("utf-8")
+        if data not in offsets:
+            offsets[data] = len(strings)
+            strings.extend(data)
+        return offsets[data], len(data)
+
+    directory_offset, directory_length = intern(sounds_directory)
+    records = bytearray()
+    for entry in entries:
+        sound_offset, sound_length = intern(entry.sound)
+        name_offset, name_length = intern(entry.event_name or "")
+        records += ENTRY.pack(
+            entry.seconds, entry.event_id, entry.user_id,
+            sound_offset, name_offset, sound_length, name_length,
+        )
+    strings_offset = HEADER.size + len(records)
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, day.toordinal(), len(entries), generation,
+        strings_offset, len(strings), directory_offset, directory_length,
+    )
+    return header + bytes(records) + bytes(strings)
+
+def write(path: str, data: bytes) -> None:
+    # Atomaarne asendamine: lugeja näeb kas vana või uut faili, mitte
+    # poolikut; juba kaardistatud vana fail jääb lugejale kehtima
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+class Playlist:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < HEADER.size:
+                raise PlaylistFormatError(f"{path}: fail on liiga lühike")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        (magic, version, _, ordinal, self.count, self.generation, self._strings,
+         strings_size, directory_offset, directory_length) = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise PlaylistFormatError(f"{path}: tundmatu vorming")
+        if self._strings + strings_size > len(self._map) \
+                or self._strings != HEADER.size + self.count * ENTRY.size:
+            self.close()
+            raise PlaylistFormatError(f"{path}: vigane fail")
+        self.day = date.fromordinal(ordinal)
+        self.sounds_directory = self._string(directory_offset, directory_length)
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "Playlist":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def _seconds(self, index: int) -> int:
+        return struct.unpack_from("<I", self._map, HEADER.size + index * ENTRY.size)[0]
+
+    def __getitem__(self, index: int) -> PlaylistEntry:
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        seconds, event_id, user_id, sound_offset, name_offset, sound_length, name_length = \
+            ENTRY.unpack_from(self._map, HEADER.size + index * ENTRY.size)
+        return PlaylistEntry(
+            seconds, event_id, user_id,
+            self._string(sound_offset, sound_length),
+            self._string(name_offset, name_length),
+        )
+
+    def __iter__(self) -> Iterator[PlaylistEntry]:
+        for index in range(self.count):
+            yield self[index]
+
+    def entries(self) -> List[PlaylistEntry]:
+        return list(self)
+
+    def index_after(self, seconds: int) -> int:
+        # Esimene kirje, mille aeg on >= seconds (kahendotsing kaardistatud kirjetes)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._seconds(middle) < seconds:
+                low = middle + 1
+            else:
+                high = middle
+        return low
@@ -0,0 +1,95 @@
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+# Valikuline proovivõttev profiilija aeglaste päringute jaoks. Taustalõim
+# võtab kõigi lõimede pinudest hetktõmmiseid seni, kuni mõni profileeritav
+# päring on pooleli. Tulemus kirjutatakse "folded stacks" vormingus
+# (rida "lõim;kutsuja;...;funktsioon arv"), mida saavad otse lugeda
+# flamegraph.pl, speedscope ja inferno.
+#
+# Kõik lõimed on samas protsessis, seega samaaegsete päringute pinud võivad
+# segiminna; profiil on mõeldud üksikute aeglaste päringute uurimiseks.
+
+logger = logging.getLogger(__name__)
+
+# Ooteseisus lõimede pinud jäetakse välja (nt tühi lõimede kogum)
+IDLE_MODULES = ("threading.py", "selectors.py", "queue.py")
+IDLE_FUNCTIONS = {"_worker", "_connection_worker_thread"}
+
+class Recording:
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.perf_counter()
+        self.samples: Counter = Counter()
+
+class SamplingProfiler:
+    def __init__(self, interval: float, directory: str):
+        self.interval = interval
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._recordings: List[Recording] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self, label: str) -> Recording:
+        recording = Recording(label)
+        with self._lock:
+            self._recordings.append(recording)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        return recording
+
+    def end(self, recording: Recording) -> float:
+        with self._lock:
+            self._recordings.remove(recording)
+        return time.perf_counter() - recording.started
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                recordings = list(self._recordings)
+                if not recordings:
+                    self._thread = None
+                    return
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [
+                _fold(names.get(ident, str(ident)), frame)
+                for ident, frame in sys._current_frames().items()
+                if ident != own and not _idle(frame)
+            ]
+            for recording in recordings:
+                recording.samples.update(stacks)
+            time.sleep(self.interval)
+
+    def dump(self, recording: Recording, elapsed: float) -> Optional[str]:
+        if not recording.samples:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", recording.label).strip("_") or "root"
+        path = os.path.join(self.directory, f"{stamp}-{slug}-{int(elapsed * 1000)}ms.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(recording.samples.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+def _idle(frame) -> bool:
+    code = frame.f_code
+    return code.co_filename.endswith(IDLE_MODULES) or code.co_name in IDLE_FUNCTIONS
+
+def _fold(thread_name: str, frame) -> str:
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}")
+        frame = frame.f_back
+    parts.append(thread_name.replace(" ", "_"))
+    return ";".join(reversed(parts))
@@ -0,0 +1,196 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+from . import changes, metrics, models
+from .schedule import Bell
+from .scheduler import BellSchedulers, bell_schedulers
+from .tenancy import TenantRegistry, tenants
+
+logger = logging.getLogger(__name__)
+
+# Reaalajas teavitused WebSocketi kaudu. Muudatuste partii teisendatakse
+# pärast commit'i üks kord JSON tekstiks (ühe kasutaja kohta) ja lisatakse
+# kõigi selle kasutaja ühenduste järjekordadesse; ühenduse kohta
+# andmebaasipäringuid ei tehta. Kasutajad ja tunniplaanid on võtmestatud
+# (kool, id), sest eraldi andmebaasifailides võivad id-d korduda.
+
+# Aeglane klient, kelle järjekord täitub, ühendatakse lahti
+CLIENT_QUEUE_SIZE = 256
+
+# Tabelid, mille muudatused on kõigile sama kooli kasutajatele ühised
+SHARED_TABLES = {"sounds", "holidays", "event_templates", "event_template_items"}
+
+ws_clients = metrics.Gauge("lible_ws_clients", "Ühendatud WebSocketi kliendid")
+ws_messages = metrics.Counter("lible_ws_messages_total", "Klientidele saadetud teated")
+ws_dropped = metrics.Counter("lible_ws_dropped_clients_total", "Täis järjekorra tõttu lahti ühendatud kliendid")
+
+def _bell_payload(bell: Optional[Bell]) -> Optional[dict]:
+    if bell is None:
+        return None
+    return {
+        "at": bell.at.isoformat(),
+        "event_id": bell.event_id,
+        "timetable_id": bell.timetable_id,
+        "event_name": bell.event_name,
+        "sound_id": bell.sound_id,
+    }
+
+# (kool, kasutaja) või (kool, tunniplaan)
+Key = Tuple[int, int]
+
+class Client:
+    def __init__(self, tenant_id: int, user_id: int):
+        self.tenant_id = tenant_id
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(CLIENT_QUEUE_SIZE)
+
+    @property
+    def key(self) -> Key:
+        return (self.tenant_id, self.user_id)
+
+class Hub:
+    def __init__(self, schedulers: BellSchedulers, databases: TenantRegistry = tenants):
+        self.schedulers = schedulers
+        self.databases = databases
+        self._clients: Dict[Key, Set[Client]] = defaultdict(set)
+        self._owners: Dict[Key, int] = {}  # (kool, tunniplaan) -> kasutaja
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        schedulers.add_fire_listener(self._on_bell)
+
+    # Elutsükkel
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        changes.subscribe(self._on_changes)
+
+    def stop(self) -> None:
+        changes.unsubscribe(self._on_changes)
+        for clients in self._clients.values():
+            for client in clients:
+                self._close(client)
+        self._clients.clear()
+        self._loop = None
+        ws_clients.set(0)
+
+    def connect(self, tenant_id: int, user_id: int) -> Client:
+        client = Client(tenant_id, user_id)
+        self._clients[client.key].add(client)
+        ws_clients.inc()
+        client.queue.put_nowait(self._message("hello", next=_bell_payload(self._next_bell(client.key))))
+        return client
+
+    def disconnect(self, client: Client) -> None:
+        clients = self._clients.get(client.key)
+        if clients and client in clients:
+            clients.discard(client)
+            if not clients:
+                del self._clients[client.key]
+            ws_clients.dec()
+
+    # Edastamine (ainult sündmustsükli lõimes)
+
+    @staticmethod
+    def _message(kind: str, **fields) -> str:
+        return json.dumps({"type": kind, **fields}, separators=(",", ":"))
+
+    def _deliver(self, keys: Iterable[Key], text: str) -> None:
+        for key in list(keys):
+            for client in list(self._clients.get(key, ())):
+                try:
+                    client.queue.put_nowait(text)
+                    ws_messages.inc()
+                except asyncio.QueueFull:
+                    ws_dropped.inc()
+                    self.disconnect(client)
+                    self._close(client)
+
+    @staticmethod
+    def _close(client: Client) -> None:
+        # None järjekorras tähendab saatjale ühenduse sulgemist
+        while True:
+            try:
+                client.queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                client.queue.get_nowait()
+
+    def _deliver_tenant(self, tenant_id: Optional[int], text: str) -> None:
+        # None: kõigi koolide kasutajad
+        keys = [key for key in self._clients if tenant_id is None or key[0] == tenant_id]
+        self._deliver(keys, text)
+
+    def _next_bell(self, key: Key) -> Optional[Bell]:
+        tenant_id, user_id = key
+        upcoming = self.schedulers.upcoming(tenant_id, 1, user_id=user_id)
+        return upcoming[0] if upcoming else None
+
+    # Kellad (ajastaja kutsub sündmustsükli lõimes)
+
+    def _on_bell(self, tenant_id: int, user_id: int, bell: Bell) -> None:
+        key = (tenant_id, user_id)
+        if key not in self._clients:
+            return
+        text = self._message(
+            "bell",
+            rang=_bell_payload(bell),
+            next=_bell_payload(self._next_bell(key)),
+        )
+        self._deliver([key], text)
+
+    # Muudatused (kutsutakse commit'i teinud lõimest)
+
+    def _resolve_owners(self, tenant_id: int, timetable_ids: Set[int]) -> None:
+        unknown = {tid for tid in timetable_ids if (tenant_id, tid) not in self._owners}
+        if not unknown:
+            return
+        db = self.databases.database(tenant_id).session_factory()
+        try:
+            rows = db.query(models.Timetable.id, models.Timetable.user_id).filter(
+                models.Timetable.tenant_id == tenant_id,
+                models.Timetable.id.in_(unknown)
+            ).all()
+        finally:
+            db.close()
+        self._owners.update({(tenant_id, row.id): row.user_id for row in rows})
+
+    def _on_changes(self, batch: List[changes.Change]) -> None:
+        loop = self._loop
+        if loop is None or not self._clients:
+            return
+        events_by_tenant: Dict[int, Set[int]] = defaultdict(set)
+        for change in batch:
+            if change.tenant_id is None:
+                continue
+            if change.table == "timetables" and change.parent_id is not None:
+                self._owners[(change.tenant_id, change.id)] = change.parent_id
+            elif change.table == "timetable_events" and change.parent_id is not None:
+                events_by_tenant[change.tenant_id].add(change.parent_id)
+        for tenant_id, timetable_ids in events_by_tenant.items():
+            self._resolve_owners(tenant_id, timetable_ids)
+
+        shared: Dict[Optional[int], List[dict]] = defaultdict(list)
+        per_user: Dict[Key, List[dict]] = defaultdict(list)
+        for change in batch:
+            item = {"table": change.table, "op": change.op, "id": change.id, "parent_id": change.parent_id}
+            if change.table in SHARED_TABLES:
+                shared[change.tenant_id].append(item)
+            elif change.tenant_id is None:
+                continue
+            elif change.table == "timetables" and change.parent_id is not None:
+                per_user[(change.tenant_id, change.parent_id)].append(item)
+            elif change.table == "timetable_events":
+                owner = self._owners.get((change.tenant_id, change.parent_id))
+                if owner is not None:
+                    per_user[(change.tenant_id, owner)].append(item)
+        for change in batch:
+            if change.table == "timetables" and change.op == "delete":
+                self._owners.pop((change.tenant_id, change.id), None)
+
+        for tenant_id, items in shared.items():
+            loop.call_soon_threadsafe(self._deliver_tenant, tenant_id, self._message("changes", changes=items))
+        for key, items in per_user.items():
+            loop.call_soon_threadsafe(self._deliver, [key], self._message("changes", changes=items))
+
+hub = Hub(bell_schedulers)
@@ -0,0 +1,150 @@
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import threading
+from fastapi import Response
+from pydantic import TypeAdapter
+from . import changes, metrics
+from .cache import LRUCache
+from .config import settings
+
+# Lugemispäringute vastuste vahemälu: hoitakse valmis serialiseeritud JSON
+# baite, seega tabamuse korral ei tehta andmebaasipäringut ega Pydanticu
+# valideerimist. Iga kirje on märgistatud tabelitega, millest see sõltub;
+# pärast commit'i eemaldatakse kõik muudetud tabelitest sõltuvad kirjed.
+# Võtmed ja märgised sisaldavad kooli, seega ühe kooli muudatus ei tühjenda
+# teiste koolide kirjeid. Vahemälu on protsessi mälus ja tühjendatakse
+# ainult sama protsessi commit'ide järel, seega server töötab ühe
+# protsessina (vt instance_lock).
+#
+# Nimekirjade ETag tuleb revisjonidest (app.revisions) ja loetakse enne
+# vahemälu. Seetõttu tellib vahemälu muudatused etapis
+# changes.RESPONSE_CACHE, mis käib enne revisjoni tõstmist
+# (changes.REVISIONS): commit'i ajal sisse tulnud päring saab kas vana ETagi
+# või juba tühjendatud vahemälu, mitte kunagi uut ETagi vana vastusega.
+# Vastused, mis arvutatakse teistest vahemäludest (ajakava mootor), eeldavad,
+# et need tühjendatakse varem etapis changes.DATA_CACHES.
+
+RESPONSE_CACHE_BYTES = settings.server.response_cache_bytes
+
+# Märgis: (tabel, vanema id) või (tabel, None), kui sõltutakse kogu tabelist
+Tag = Tuple[str, Optional[int]]
+# Salvestatud märgis: (kool, tabel, vanema id)
+TenantTag = Tuple[Optional[int], str, Optional[int]]
+
+response_cache_hits = metrics.Counter(
+    "lible_response_cache_hits_total", "Vastuste vahemälu tabamused", ["route"]
+)
+response_cache_misses = metrics.Counter(
+    "lible_response_cache_misses_total", "Vastuste vahemälu möödalasud", ["route"]
+)
+response_cache_bytes = metrics.Gauge("lible_response_cache_bytes", "Vastuste vahemälu maht")
+
+_adapters: Dict[Any, TypeAdapter] = {}
+
+def _adapter(model) -> TypeAdapter:
+    adapter = _adapters.get(model)
+    if adapter is None:
+        adapter = _adapters[model] = TypeAdapter(model)
+    return adapter
+
+def serialize(model, value) -> bytes:
+    adapter = _adapter(model)
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_BYTES):
+        self._entries: LRUCache[bytes] = LRUCache(max_bytes, weigh=len)
+        self._keys: Dict[TenantTag, Set[Hashable]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._tagged = 0
+
+    async def json(
+        self,
+        route: str,
+        tenant_id: int,
+        key: Hashable,
+        tags: Iterable[Tag],
+        model,
+        load: Callable[[], Awaitable[Any]],
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        full_key = (route, tenant_id, key)
+        body = self._lookup(route, full_key)
+        if body is None:
+            generation = self._snapshot()
+            tenant_tags = [(tenant_id, table, parent_id) for table, parent_id in tags]
+            body = self._store(full_key, tenant_tags, generation, serialize(model, await load()))
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def _lookup(self, route: str, full_key: Hashable) -> Optional[bytes]:
+        body = self._entries.get(full_key)
+        if body is not None:
+            response_cache_hits.labels(route=route).inc()
+        else:
+            response_cache_misses.labels(route=route).inc()
+        return body
+
+    def _snapshot(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def _store(self, full_key: Hashable, tags: Iterable[TenantTag], generation: int, body: bytes) -> bytes:
+        with self._lock:
+            # Kui laadimise ajal jõudis kohale muudatus, võib tulemus
+            # olla juba aegunud ja seda ei salvestata
+            if generation == self._generation:
+                self._entries.put(full_key, body)
+                for tag in tags:
+                    self._keys[tag].add(full_key)
+                self._tagged += 1
+                if self._tagged > 4 * len(self._entries) + 1024:
+                    self._prune()
+        response_cache_bytes.set(self._entries.weight)
+        return body
+
+    def _prune(self) -> None:
+        # LRU poolt välja tõstetud kirjete märgised eemaldatakse
+        for tag in list(self._keys):
+            keys = {key for key in self._keys[tag] if key in self._entries}
+            if keys:
+                self._keys[tag] = keys
+            else:
+                del self._keys[tag]
+        self._tagged = sum(len(keys) for keys in self._keys.values())
+
+    def invalidate(self, tags: Iterable[TenantTag]) -> None:
+        with self._lock:
+            self._generation += 1
+            targets = set()
+            for tenant_id, table, parent_id in tags:
+                if tenant_id is None:
+                    # Kool pole teada: kehtetuks muutub tabel kõigis koolides
+                    targets.update(
+                        tag for tag in self._keys
+                        if tag[1] == table and (parent_id is None or tag[2] in (parent_id, None))
+                    )
+                elif parent_id is None:
+                    # Vanem pole teada: kehtetuks muutub kooli kogu tabel
+                    targets.update(tag for tag in self._keys if tag[0] == tenant_id and tag[1] == table)
+                else:
+                    targets.update([(tenant_id, table, parent_id), (tenant_id, table, None)])
+            for tag in targets:
+                for key in self._keys.pop(tag, ()):
+                    self._entries.pop(key)
+        response_cache_bytes.set(self._entries.weight)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._keys.clear()
+            self._tagged = 0
+            self._entries.clear()
+        response_cache_bytes.set(0)
+
+    def apply_changes(self, batch: List[changes.Change]) -> None:
+        # Tellitud etapis changes.RESPONSE_CACHE, enne revisjoni tõstmist
+        self.invalidate({(change.tenant_id, change.table, change.parent_id) for change in batch})
+
+response_cache = ResponseCache()
+changes.subscribe(response_cache.apply_changes, changes.RESPONSE_CACHE)
@@ -0,0 +1,96 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Set, Tuple
+import threading
+import time
+from . import changes
+
+# Tabelite revisjonid tingimuslike päringute (ETag / If-None-Match) ja
+# muudatuste päringu (?since=<revisjon>) jaoks. Revisjon suureneb iga
+# commit'i järel; viimased muudatused hoitakse mälus piiratud logis.
+# Algväärtus on millisekundites kellaaeg, seega serveri taaskäivituse järel
+# ei lange varem väljastatud revisjonid uutega kokku. Tabelite revisjonid
+# on kooli kaupa, loendur on ühine. Logi on protsessi mälus ja seda toidavad
+# ainult sama protsessi commit'id, seega server töötab ühe protsessina
+# (vt instance_lock). Revisjon tõstetakse alles pärast vastuste vahemälu
+# tühjendamist (etapp changes.REVISIONS, vt response_cache).
+
+# Mitu muudatust logis hoitakse; vanema revisjoniga päring saab täisnimekirja
+MAX_LOG_ENTRIES = 10000
+
+# Lapstabeli muudatus muudab ka vanemressurssi (mall sisaldab oma ridu)
+PARENT_RESOURCES = {
+    "event_template_items": "event_templates",
+}
+
+@dataclass(frozen=True)
+class Delta:
+    changed: Set[int]
+    deleted: Set[int]
+
+class RevisionLog:
+    def __init__(self, max_entries: int = MAX_LOG_ENTRIES):
+        self._lock = threading.Lock()
+        self._base = int(time.time() * 1000)
+        self.revision = self._base
+        # (kool, tabel, vanema id) -> revisjon; kool None: kool polnud teada
+        self._tables: Dict[Tuple[Optional[int], str, Optional[int]], int] = {}
+        # (revisjon, kool, tabel, op, id, vanema id)
+        self._log: Deque[Tuple[int, Optional[int], str, str, int, Optional[int]]] = deque(maxlen=max_entries)
+
+    def table_revision(self, tenant_id: int, table: str, parent_id: Optional[int] = None) -> int:
+        with self._lock:
+            return max(
+                self._tables.get((tenant_id, table, parent_id), self._base),
+                self._tables.get((None, table, parent_id), self._base),
+            )
+
+    def etag(self, tenant_id: int, table: str, parent_id: Optional[int] = None) -> str:
+        revision = self.table_revision(tenant_id, table, parent_id)
+        if parent_id is None:
+            return f'W/"{tenant_id}-{table}-{revision}"'
+        return f'W/"{tenant_id}-{table}-{parent_id}-{revision}"'
+
+    def changes_since(
+        self, tenant_id: int, table: str, since: int, parent_id: Optional[int] = None
+    ) -> Optional[Delta]:
+        # None tähendab, et logi ei kata nõutud revisjoni (liiga vana või
+        # eelmise protsessi oma) ja klient peab laadima kogu nimekirja
+        with self._lock:
+            if since > self.revision or since < self._base:
+                return None
+            if self._log and len(self._log) == self._log.maxlen and since < self._log[0][0]:
+                return None
+            last_op: Dict[int, str] = {}
+            for revision, entry_tenant, entry_table, op, row_id, entry_parent in self._log:
+                if revision <= since or entry_table != table:
+                    continue
+                if entry_tenant is not None and entry_tenant != tenant_id:
+                    continue
+                if parent_id is not None and entry_parent != parent_id:
+                    continue
+                last_op[row_id] = op
+        deleted = {row_id for row_id, op in last_op.items() if op == "delete"}
+        return Delta(changed=set(last_op) - deleted, deleted=deleted)
+
+    def apply_changes(self, batch: List[changes.Change]) -> None:
+        with self._lock:
+            self.revision = max(self.revision + 1, int(time.time() * 1000))
+            deleted = {(c.tenant_id, c.table, c.id) for c in batch if c.op == "delete"}
+            for change in batch:
+                if change.id is None:
+                    continue
+                entries = [(change.table, change.op, change.id, change.parent_id)]
+                parent_table = PARENT_RESOURCES.get(change.table)
+                if parent_table and change.parent_id is not None \
+                        and (change.tenant_id, parent_table, change.parent_id) not in deleted:
+                    entries.append((parent_table, "update", change.parent_id, None))
+                tenant_id = change.tenant_id
+                for table, op, row_id, parent_id in entries:
+                    self._log.append((self.revision, tenant_id, table, op, row_id, parent_id))
+                    self._tables[(tenant_id, table, None)] = self.revision
+                    if parent_id is not None:
+                        self._tables[(tenant_id, table, parent_id)] = self.revision
+
+revisions = RevisionLog()
+changes.subscribe(revisions.apply_changes, changes.REVISIONS)
@@ -0,0 +1,448 @@
+from bisect import bisect_right
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+import threading
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from . import changes, models
+from .holidays import HolidayIndex
+from .tenancy import tenants
+
+# Ajakava mootor: kompileerib tunniplaanid, pühad ja sündmused mälus olevaks
+# intervallstruktuuriks, et "mis heliseb kuupäeval X" ja "järgmised N kella"
+# lahenduksid kahendotsinguga, mitte kõigi ridade läbikäimisega.
+# Igal koolil on oma mootor (ScheduleEngines registris).
+
+# Kui kaugele ette järgmisi kellasid otsitakse
+MAX_LOOKAHEAD_DAYS = 366
+
+TimetableSpec = namedtuple(
+    "TimetableSpec", "id user_id name valid_from valid_until weekdays"
+)
+
+CompiledEvent = namedtuple(
+    "CompiledEvent",
+    "id timetable_id event_name event_time sound_id template_instance_id is_template_base",
+)
+
+@dataclass(frozen=True)
+class Bell:
+    at: datetime
+    event_id: int
+    timetable_id: int
+    event_name: str
+    sound_id: int
+
+@dataclass(frozen=True)
+class ResolvedDay:
+    date: date
+    is_holiday: bool
+    timetable: Optional[TimetableSpec] = None
+    events: Tuple[CompiledEvent, ...] = ()
+
+    # Kalendri värvikood: tavaline, eriline (kehtivusajaga) või tunde pole
+    @property
+    def status(self) -> str:
+        if self.timetable is None:
+            return "none"
+        if self.timetable.valid_until is not None:
+            return "special"
+        return "default"
+
+    @property
+    def timetable_id(self) -> Optional[int]:
+        return self.timetable.id if self.timetable is not None else None
+
+def _priority(spec: TimetableSpec):
+    # Kehtivusajaga tunniplaan on vaikimisi tunniplaanist tähtsam
+    return (spec.valid_until is not None, spec.valid_from, spec.id)
+
+class _Segments:
+    # Ajatelg jagatud lõikudeks, milles iga nädalapäeva tunniplaan on konstantne
+    def __init__(self, specs: Iterable[TimetableSpec]):
+        specs = list(specs)
+        boundaries = set()
+        for spec in specs:
+            boundaries.add(spec.valid_from)
+            if spec.valid_until is not None:
+                boundaries.add(spec.valid_until + timedelta(days=1))
+
+        self.starts: List[date] = []
+        self.slots: List[Tuple[Optional[TimetableSpec], ...]] = []
+        for start in sorted(boundaries):
+            active = [
+                s for s in specs
+                if s.valid_from <= start and (s.valid_until is None or s.valid_until >= start)
+            ]
+            slots = []
+            for weekday in range(7):
+                candidates = [s for s in active if s.weekdays & (1 << weekday)]
+                slots.append(max(candidates, key=_priority) if candidates else None)
+            slots = tuple(slots)
+            if self.slots and self.slots[-1] == slots:
+                continue
+            self.starts.append(start)
+            self.slots.append(slots)
+
+    def lookup(self, day: date) -> Optional[TimetableSpec]:
+        i = bisect_right(self.starts, day) - 1
+        if i < 0:
+            return None
+        return self.slots[i][day.weekday()]
+
+class _CompiledEvents:
+    def __init__(self, events: Iterable[CompiledEvent]):
+        self.events = tuple(sorted(events, key=lambda e: (e.event_time, e.id)))
+        self.times = [e.event_time for e in self.events]
+
+    def after(self, moment: Optional[time]) -> Tuple[CompiledEvent, ...]:
+        if moment is None:
+            return self.events
+        return self.events[bisect_right(self.times, moment):]
+
+# Laaditavad veerud (sama järjekord mis TimetableSpec ja CompiledEvent)
+HOLIDAY_COLUMNS = (models.Holiday.valid_from, models.Holiday.valid_until)
+TIMETABLE_COLUMNS = (
+    models.Timetable.id,
+    models.Timetable.user_id,
+    models.Timetable.name,
+    models.Timetable.valid_from,
+    models.Timetable.valid_until,
+    models.Timetable.weekdays,
+)
+EVENT_COLUMNS = (
+    models.TimetableEvent.id,
+    models.TimetableEvent.timetable_id,
+    models.TimetableEvent.event_name,
+    models.TimetableEvent.event_time,
+    models.TimetableEvent.sound_id,
+    models.TimetableEvent.template_instance_id,
+    models.TimetableEvent.is_template_base,
+)
+
+class _NotLoaded(Exception):
+    pass
+
+class _PreloadedOnly:
+    # Asünkroonse tee "sessioon": kõik vajalik on ette laetud ja päringu
+    # vajadus tähendab, et vahepeal tuli muudatus
+    def query(self, *args, **kwargs):
+        raise _NotLoaded()
+
+R = TypeVar("R")
+
+class ScheduleEngine:
+    def __init__(self, tenant_id: int = models.DEFAULT_TENANT_ID, session_factory=None):
+        self.tenant_id = tenant_id
+        self.session_factory = session_factory or tenants.database(tenant_id).session_factory
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._holidays: Optional[HolidayIndex] = None
+        self._segments: Dict[int, _Segments] = {}
+        self._timetables: Dict[int, Dict[int, TimetableSpec]] = {}
+        self._events: Dict[int, _CompiledEvents] = {}
+
+    # Laadimine (iga tabeli kohta üks päring, ainult puuduvate osade jaoks)
+
+    def holiday_index(self, db: Session) -> HolidayIndex:
+        with self._lock:
+            return self._holiday_index(db)
+
+    def _holiday_index(self, db: Session) -> HolidayIndex:
+        if self._holidays is None:
+            self._install_holidays(
+                db.query(*HOLIDAY_COLUMNS).filter(models.Holiday.tenant_id == self.tenant_id).all()
+            )
+        return self._holidays
+
+    def _install_holidays(self, rows) -> None:
+        self._holidays = HolidayIndex(
+            (start, end) for start, end in rows if start is not None and end is not None
+        )
+
+    def _user_segments(self, db: Session, user_id: int) -> _Segments:
+        segments = self._segments.get(user_id)
+        if segments is None:
+            rows = db.query(*TIMETABLE_COLUMNS).filter(models.Timetable.user_id == user_id).all()
+            segments = self._install_segments(user_id, rows)
+        return segments
+
+    def _install_segments(self, user_id: int, rows) -> _Segments:
+        specs = {row.id: TimetableSpec(*row) for row in rows if row.valid_from is not None}
+        self._timetables[user_id] = specs
+        segments = self._segments[user_id] = _Segments(specs.values())
+        return segments
+
+    def _timetable_events(self, db: Session, timetable_id: int) -> _CompiledEvents:
+        compiled = self._events.get(timetable_id)
+        if compiled is None:
+            self._load_events(db, [timetable_id])
+            compiled = self._events[timetable_id]
+        return compiled
+
+    def _load_events(self, db: Session, timetable_ids: Iterable[int]) -> None:
+        missing = {tid for tid in timetable_ids if tid not in self._events}
+        if not missing:
+            return
+        rows = db.query(*EVENT_COLUMNS).filter(
+            models.TimetableEvent.tenant_id == self.tenant_id,
+            models.TimetableEvent.timetable_id.in_(missing)
+        ).all()
+        self._install_events(missing, rows)
+
+    def _install_events(self, timetable_ids: Iterable[int], rows) -> None:
+        grouped: Dict[int, List[CompiledEvent]] = {tid: [] for tid in timetable_ids}
+        for row in rows:
+            if row.event_time is not None:
+                grouped[row.timetable_id].append(CompiledEvent(*row))
+        for tid, events in grouped.items():
+            self._events[tid] = _CompiledEvents(events)
+
+    def warm(self, db: Session) -> None:
+        # Kõigi kasutajate tunniplaanid ja sündmused laetakse ja kompileeritakse
+        # ette (üks päring tabeli kohta), et esimene päring ei peaks ootama
+        with self._lock:
+            self._holiday_index(db)
+            rows_by_user: Dict[int, list] = {}
+            for row in db.query(*TIMETABLE_COLUMNS).filter(
+                models.Timetable.tenant_id == self.tenant_id,
+                models.Timetable.user_id.isnot(None)
+            ).all():
+                rows_by_user.setdefault(row.user_id, []).append(row)
+            for user_id, rows in rows_by_user.items():
+                if user_id not in self._segments:
+                    self._install_segments(user_id, rows)
+            self._load_events(db, [row.id for rows in rows_by_user.values() for row in rows])
+
+    # Asünkroonne laadimine: päringud tehakse luku väliselt AsyncSessioniga
+    # ja tulemused paigaldatakse ainult siis, kui vahepeal muudatusi ei tulnud
+
+    async def _preload(self, db: AsyncSession, user_id: int) -> bool:
+        with self._lock:
+            generation = self._generation
+            holidays_missing = self._holidays is None
+            specs = self._timetables.get(user_id) if user_id in self._segments else None
+        holiday_rows = timetable_rows = None
+        if holidays_missing:
+            holiday_rows = (await db.execute(
+                select(*HOLIDAY_COLUMNS).where(models.Holiday.tenant_id == self.tenant_id)
+            )).all()
+        if specs is None:
+            timetable_rows = (await db.execute(
+                select(*TIMETABLE_COLUMNS).where(models.Timetable.user_id == user_id)
+            )).all()
+            timetable_ids = {row.id for row in timetable_rows if row.valid_from is not None}
+        else:
+            timetable_ids = set(specs)
+        with self._lock:
+            missing = {tid for tid in timetable_ids if tid not in self._events}
+        event_rows = None
+        if missing:
+            event_rows = (await db.execute(
+                select(*EVENT_COLUMNS).where(
+                    models.TimetableEvent.tenant_id == self.tenant_id,
+                    models.TimetableEvent.timetable_id.in_(missing)
+                )
+            )).all()
+        with self._lock:
+            if generation != self._generation:
+                return False
+            if holiday_rows is not None:
+                self._install_holidays(holiday_rows)
+            if timetable_rows is not None:
+                self._install_segments(user_id, timetable_rows)
+            if event_rows is not None:
+                self._install_events(missing, event_rows)
+        return True
+
+    async def _run_async(self, db: AsyncSession, user_id: int, query: Callable[[Session], R]) -> R:
+        for _ in range(3):
+            if await self._preload(db, user_id):
+                try:
+                    return query(_PreloadedOnly())
+                except _NotLoaded:
+                    pass
+        # Pidevate muudatuste korral laeme tavalise sessiooniga lõimes
+        return await run_in_threadpool(self._run_with_session, query)
+
+    def _run_with_session(self, query: Callable[[Session], R]) -> R:
+        db = self.session_factory()
+        try:
+            return query(db)
+        finally:
+            db.close()
+
+    async def resolve_async(self, db: AsyncSession, user_id: int, day: date) -> ResolvedDay:
+        return await self._run_async(db, user_id, lambda s: self.resolve(s, user_id, day))
+
+    async def resolve_range_async(
+        self, db: AsyncSession, user_id: int, start: date, end: date
+    ) -> List[ResolvedDay]:
+        return await self._run_async(db, user_id, lambda s: self.resolve_range(s, user_id, start, end))
+
+    async def next_bells_async(
+        self, db: AsyncSession, user_id: int, after: datetime, count: int
+    ) -> List[Bell]:
+        return await self._run_async(db, user_id, lambda s: self.next_bells(s, user_id, after, count))
+
+    # Päringud
+
+    def resolve(self, db: Session, user_id: int, day: date) -> ResolvedDay:
+        with self._lock:
+            if self._holiday_index(db).contains(day):
+                return ResolvedDay(date=day, is_holiday=True)
+            spec = self._user_segments(db, user_id).lookup(day)
+            if spec is None:
+                return ResolvedDay(date=day, is_holiday=False)
+            events = self._timetable_events(db, spec.id).events
+            return ResolvedDay(date=day, is_holiday=False, timetable=spec, events=events)
+
+    def resolve_range(self, db: Session, user_id: int, start: date, end: date) -> List[ResolvedDay]:
+        # Kogu vahemik lahendatakse ühe läbikäiguga: puhkused, tunniplaanid ja
+        # kõigi vajaminevate tunniplaanide sündmused loetakse ühe päringuga tabeli kohta
+        with self._lock:
+            holidays = self._holiday_index(db)
+            segments = self._user_segments(db, user_id)
+            days = []
+            day = start
+            while day <= end:
+                spec = None if holidays.contains(day) else segments.lookup(day)
+                days.append((day, spec))
+                day += timedelta(days=1)
+            self._load_events(db, {spec.id for _, spec in days if spec is not None})
+            result = []
+            for day, spec in days:
+                if spec is None:
+                    result.append(ResolvedDay(date=day, is_holiday=holidays.contains(day)))
+                else:
+                    result.append(ResolvedDay(
+                        date=day,
+                        is_holiday=False,
+                        timetable=spec,
+                        events=self._events[spec.id].events,
+                    ))
+            return result
+
+    def next_bells(
+        self,
+        db: Session,
+        user_id: int,
+        after: datetime,
+        count: int,
+        until: Optional[datetime] = None,
+    ) -> List[Bell]:
+        bells: List[Bell] = []
+        with self._lock:
+            holidays = self._holiday_index(db)
+            segments = self._user_segments(db, user_id)
+            day = after.date()
+            last_day = after.date() + timedelta(days=MAX_LOOKAHEAD_DAYS)
+            if until is not None:
+                last_day = min(last_day, until.date())
+            moment: Optional[time] = after.time()
+            while day <= last_day and len(bells) < count:
+                holiday_end = holidays.end_of(day)
+                if holiday_end is not None:
+                    # Hüppame kogu vaheaja korraga üle
+                    day = holiday_end + timedelta(days=1)
+                    moment = None
+                    continue
+                spec = segments.lookup(day)
+                if spec is not None:
+                    for event in self._timetable_events(db, spec.id).after(moment):
+                        at = datetime.combine(day, event.event_time)
+                        if until is not None and at > until:
+                            return bells
+                        bells.append(Bell(
+                            at=at,
+                            event_id=event.id,
+                            timetable_id=event.timetable_id,
+                            event_name=event.event_name,
+                            sound_id=event.sound_id,
+                        ))
+                        if len(bells) >= count:
+                            break
+                day += timedelta(days=1)
+                moment = None
+        return bells
+
+    def user_ids(self, db: Session) -> List[int]:
+        rows = db.query(models.Timetable.user_id).filter(
+            models.Timetable.tenant_id == self.tenant_id
+        ).distinct().all()
+        return [row.user_id for row in rows if row.user_id is not None]
+
+    def owner_of(self, timetable_id: int) -> Optional[int]:
+        with self._lock:
+            for user_id, specs in self._timetables.items():
+                if timetable_id in specs:
+                    return user_id
+        return None
+
+    # Invalideerimine
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._holidays = None
+            self._segments.clear()
+            self._timetables.clear()
+            self._events.clear()
+
+    def apply_changes(self, batch: List[changes.Change]) -> None:
+        # Teiste koolide muudatused jäetakse vahele (None: kool pole teada)
+        batch = [c for c in batch if c.tenant_id is None or c.tenant_id == self.tenant_id]
+        if not batch:
+            return
+        with self._lock:
+            self._generation += 1
+            for change in batch:
+                if change.table == "holidays":
+                    self._holidays = None
+                elif change.table == "timetables":
+                    if change.parent_id is None:
+                        self._segments.clear()
+                        self._timetables.clear()
+                    else:
+                        self._segments.pop(change.parent_id, None)
+                        self._timetables.pop(change.parent_id, None)
+                    if change.op == "delete":
+                        self._events.pop(change.id, None)
+                elif change.table == "timetable_events":
+                    if change.parent_id is None:
+                        self._events.clear()
+                    else:
+                        self._events.pop(change.parent_id, None)
+
+class ScheduleEngines:
+    # Koolide mootorid luuakse esimesel kasutamisel
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines: Dict[int, ScheduleEngine] = {}
+
+    def get(self, tenant_id: int) -> ScheduleEngine:
+        engine = self._engines.get(tenant_id)
+        if engine is None:
+            with self._lock:
+                engine = self._engines.get(tenant_id)
+                if engine is None:
+                    engine = self._engines[tenant_id] = ScheduleEngine(tenant_id)
+        return engine
+
+    def all(self) -> List[ScheduleEngine]:
+        return list(self._engines.values())
+
+    def invalidate(self) -> None:
+        for engine in self.all():
+            engine.invalidate()
+
+    def apply_changes(self, batch: List[changes.Change]) -> None:
+        for engine in self.all():
+            engine.apply_changes(batch)
+
+schedule_engines = ScheduleEngines()
+changes.subscribe(schedule_engines.apply_changes, changes.DATA_CACHES)
@@ -0,0 +1,326 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import heapq
+import logging
+import time
+from . import changes, metrics
+from .audio import sound_cache
+from .config import settings
+from .schedule import Bell, ScheduleEngine, ScheduleEngines, schedule_engines
+from .tenancy import tenants
+
+logger = logging.getLogger(__name__)
+
+# Kellade helistamise taustateenus. Eelseisvad kellad hoitakse monotoonse
+# kella järgi järjestatud kuhjas ja teenus magab kuni järgmise kellani;
+# andmebaasi ei küsitleta. Muudatuste korral relvastatakse ümber ainult
+# mõjutatud kasutajate kellad. Igal koolil on oma ajastaja.
+
+# Kui kaugele ette kellad kuhja laetakse
+ARM_HORIZON = timedelta(hours=6)
+# Kuhja täiendamise intervall (peab olema lühem kui ARM_HORIZON)
+REFILL_INTERVAL = timedelta(hours=1)
+# Hilinenud kell helistatakse veel, kui hilinemine on alla selle piiri
+MISSED_GRACE = timedelta(seconds=5)
+MAX_BELLS_PER_USER = 1000
+
+bell_drift = metrics.Histogram(
+    "lible_bell_drift_seconds",
+    "Kella tegeliku ja plaanitud helistamisaja vahe",
+    buckets=(0.0005, 0.001, 0.002, 0.003, 0.005, 0.01, 0.02, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+bells_fired = metrics.Counter("lible_bells_fired_total", "Helistatud kellade arv")
+bells_missed = metrics.Counter("lible_bells_missed_total", "Vahele jäänud kellade arv")
+bells_armed = metrics.Gauge("lible_scheduler_armed_bells", "Kuhjas ootavate kellade arv", ["tenant"])
+
+# Kutsutakse (kool, kasutaja, kell) argumentidega
+RingCallback = Callable[[int, int, Bell], None]
+RefillCallback = Callable[[int], None]
+
+def _log_ring(tenant_id: int, user_id: int, bell: Bell) -> None:
+    logger.info("Kell: %s %s (heli %s)", bell.at, bell.event_name, bell.sound_id)
+
+class BellScheduler:
+    def __init__(
+        self,
+        engine: ScheduleEngine,
+        session_factory=None,
+        ring: RingCallback = _log_ring,
+    ):
+        self.engine = engine
+        self.tenant_id = engine.tenant_id
+        self.session_factory = session_factory or engine.session_factory
+        self.ring = ring
+        self._armed = bells_armed.labels(tenant=self.tenant_id)
+        self._heap: List[Tuple[float, int, int, int, Bell]] = []
+        self._generation: Dict[int, int] = {}
+        self._fired: Set[Tuple[int, datetime]] = set()
+        self._dirty: Set[int] = set()
+        self._dirty_all = False
+        self._seq = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._fire_listeners: List[RingCallback] = []
+        self._refill_listeners: List[RefillCallback] = []
+
+    # Elutsükkel
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._dirty_all = True
+        changes.subscribe(self._on_changes)
+        self._task = asyncio.create_task(self._run(), name=f"bell-scheduler-{self.tenant_id}")
+
+    async def stop(self) -> None:
+        changes.unsubscribe(self._on_changes)
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._heap.clear()
+        self._armed.set(0)
+
+    def add_fire_listener(self, listener: RingCallback) -> None:
+        self._fire_listeners.append(listener)
+
+    def add_refill_listener(self, listener: RefillCallback) -> None:
+        self._refill_listeners.append(listener)
+
+    def upcoming(self, limit: int = 10, user_id: Optional[int] = None) -> List[Bell]:
+        live = [
+            entry for entry in self._heap
+            if self._generation.get(entry[2]) == entry[3]
+            and (user_id is None or entry[2] == user_id)
+        ]
+        return [entry[4] for entry in heapq.nsmallest(limit, live)]
+
+    # Muudatused (kutsutakse commit'i teinud lõimest)
+
+    def _on_changes(self, batch: List[changes.Change]) -> None:
+        users: Set[int] = set()
+        everything = False
+        for change in batch:
+            if change.tenant_id is not None and change.tenant_id != self.tenant_id:
+                continue
+            if change.table == "holidays":
+                everything = True
+            elif change.table == "timetables":
+                if change.parent_id is None:
+                    everything = True
+                else:
+                    users.add(change.parent_id)
+            elif change.table == "timetable_events":
+                owner = self.engine.owner_of(change.parent_id) if change.parent_id else None
+                if owner is None:
+                    everything = True
+                else:
+                    users.add(owner)
+        if (users or everything) and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._mark_dirty, users, everything)
+
+    def _mark_dirty(self, users: Iterable[int], everything: bool) -> None:
+        self._dirty.update(users)
+        self._dirty_all = self._dirty_all or everything
+        self._wake.set()
+
+    # Relvastamine
+
+    def _collect(self, user_ids: Optional[Iterable[int]]) -> Tuple[Dict[int, List[Bell]], datetime]:
+        now = datetime.now()
+        after = now - MISSED_GRACE
+        db = self.session_factory()
+        try:
+            if user_ids is None:
+                user_ids = self.engine.user_ids(db)
+            result = {}
+            for user_id in user_ids:
+                result[user_id] = self.engine.next_bells(
+                    db, user_id, after, MAX_BELLS_PER_USER, until=now + ARM_HORIZON
+                )
+            return result, now
+        finally:
+            db.close()
+
+    async def _rearm(self, user_ids: Optional[Set[int]]) -> None:
+        collected, now = await asyncio.to_thread(self._collect, user_ids)
+        monotonic_now = time.monotonic()
+        wall_now = datetime.now()
+        if user_ids is None:
+            # Kõik varasemad kirjed muutuvad kehtetuks
+            for user_id in list(self._generation):
+                self._generation[user_id] += 1
+            self._fired = {key for key in self._fired if key[1] >= now - ARM_HORIZON}
+        for user_id, bells in collected.items():
+            generation = self._generation.get(user_id, 0) + 1
+            self._generation[user_id] = generation
+            for bell in bells:
+                if (bell.event_id, bell.at) in self._fired:
+                    continue
+                deadline = monotonic_now + (bell.at - wall_now).total_seconds()
+                self._seq += 1
+                heapq.heappush(self._heap, (deadline, self._seq, user_id, generation, bell))
+        self._compact()
+
+    def _compact(self) -> None:
+        if len(self._heap) > 64 and len(self._heap) > 2 * self._live_count():
+            self._heap = [e for e in self._heap if self._generation.get(e[2]) == e[3]]
+            heapq.heapify(self._heap)
+        self._armed.set(self._live_count())
+
+    def _live_count(self) -> int:
+        return sum(1 for e in self._heap if self._generation.get(e[2]) == e[3])
+
+    # Põhitsükkel
+
+    async def _run(self) -> None:
+        refill_at = 0.0
+        while True:
+            try:
+                now = time.monotonic()
+                if self._dirty_all or now >= refill_at:
+                    self._dirty_all = False
+                    self._dirty.clear()
+                    await self._rearm(None)
+                    refill_at = time.monotonic() + REFILL_INTERVAL.total_seconds()
+                    for listener in self._refill_listeners:
+                        listener(self.tenant_id)
+                elif self._dirty:
+                    users, self._dirty = self._dirty, set()
+                    await self._rearm(users)
+
+                self._fire_due()
+
+                timeout = refill_at - time.monotonic()
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - time.monotonic())
+                if timeout > 0:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Kellade ajastaja viga", extra={"tenant_id": self.tenant_id})
+                await asyncio.sleep(1)
+
+    def _fire_due(self) -> None:
+        while self._heap:
+            deadline, _, user_id, generation, bell = self._heap[0]
+            if self._generation.get(user_id) != generation:
+                heapq.heappop(self._heap)
+                continue
+            now = time.monotonic()
+            if deadline > now:
+                break
+            heapq.heappop(self._heap)
+            drift = now - deadline
+            key = (bell.event_id, bell.at)
+            if key in self._fired:
+                continue
+            self._fired.add(key)
+            if drift > MISSED_GRACE.total_seconds():
+                bells_missed.inc()
+                logger.warning("Kell jäi vahele: %s %s (%.3f s hiljem)", bell.at, bell.event_name, drift)
+                continue
+            bell_drift.observe(drift)
+            bells_fired.inc()
+            for callback in [self.ring] + self._fire_listeners:
+                try:
+                    callback(self.tenant_id, user_id, bell)
+                except Exception:
+                    logger.exception("Kella helistamine ebaõnnestus")
+        self._armed.set(self._live_count())
+
+class BellSchedulers:
+    # Kõigi koolide ajastajad. Teises protsessis (python -m app.tenancy)
+    # lisatud kool leitakse koolide nimekirja perioodilisel kontrollil.
+    def __init__(
+        self,
+        engines: ScheduleEngines,
+        ring: RingCallback = _log_ring,
+        poll_interval: float = settings.tenancy.cache_ttl,
+    ):
+        self.engines = engines
+        self.ring = ring
+        self.poll_interval = max(1.0, poll_interval)
+        self._schedulers: Dict[int, BellScheduler] = {}
+        self._fire_listeners: List[RingCallback] = []
+        self._refill_listeners: List[RefillCallback] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, tenant_id: int) -> Optional[BellScheduler]:
+        return self._schedulers.get(tenant_id)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        await self._start_new()
+        self._task = asyncio.create_task(self._watch(), name="bell-schedulers")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        schedulers, self._schedulers = list(self._schedulers.values()), {}
+        for scheduler in schedulers:
+            await scheduler.stop()
+
+    async def _start_new(self) -> None:
+        tenant_ids = await asyncio.to_thread(tenants.tenant_ids)
+        for tenant_id in tenant_ids:
+            if tenant_id in self._schedulers:
+                continue
+            await tenants.database_async(tenant_id)
+            scheduler = BellScheduler(self.engines.get(tenant_id), ring=self.ring)
+            for listener in self._fire_listeners:
+                scheduler.add_fire_listener(listener)
+            for listener in self._refill_listeners:
+                scheduler.add_refill_listener(listener)
+            self._schedulers[tenant_id] = scheduler
+            await scheduler.start()
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._start_new()
+            except Exception:
+                logger.exception("Koolide nimekirja kontroll ebaõnnestus")
+
+    def add_fire_listener(self, listener: RingCallback) -> None:
+        self._fire_listeners.append(listener)
+        for scheduler in self._schedulers.values():
+            scheduler.add_fire_listener(listener)
+
+    def add_refill_listener(self, listener: RefillCallback) -> None:
+        self._refill_listeners.append(listener)
+        for scheduler in self._schedulers.values():
+            scheduler.add_refill_listener(listener)
+
+    def upcoming(self, tenant_id: int, limit: int = 10, user_id: Optional[int] = None) -> List[Bell]:
+        scheduler = self._schedulers.get(tenant_id)
+        return scheduler.upcoming(limit, user_id) if scheduler is not None else []
+
+# Eraldi kellamängija korral (scheduler.ring_in_process: false) ajastaja
+# ainult logib kellad ja teavitab kliente, heli mängib kellamängija
+RING_IN_PROCESS = settings.scheduler.ring_in_process
+
+bell_schedulers = BellSchedulers(schedule_engines, ring=sound_cache.ring if RING_IN_PROCESS else _log_ring)
+if RING_IN_PROCESS:
+    # Iga täiendamise järel dekodeeritakse tänase ja homse ajakava helinad ette
+    bell_schedulers.add_refill_listener(sound_cache.warm_in_background)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from datetime import date, time
-from typing import Optional, List
+from datetime import date, datetime, time
+from typing import Generic, Optional, List, TypeVar
 
 # User schemas
 class UserBase(BaseModel):
@@ -12,6 +12,7 @@ class UserCreate(UserBase):
 
 class User(UserBase):
     id: int
+    tenant_id: int
     is_local_auth: bool
 
     class Config:
@@ -27,6 +28,16 @@ class TimetableBase(BaseModel):
 class TimetableCreate(TimetableBase):
     pass
 
+class TimetableConflict(BaseModel):
+    id: int
+    name: str
+    valid_from: date
+    valid_until: Optional[date] = None
+    weekdays: int
+
+    class Config:
+        from_attributes = True
+
 class Timetable(TimetableBase):
     id: int
     user_id: int
@@ -82,6 +93,18 @@ class TimetableEvent(TimetableEventBase):
     class Config:
         from_attributes = True
 
+class TimetableEventUpdate(TimetableEventBase):
+    id: int
+
+class TimetableEventBatch(BaseModel):
+    create: List[TimetableEventCreate] = []
+    update: List[TimetableEventUpdate] = []
+    delete: List[int] = []
+
+class TemplateApply(BaseModel):
+    template_id: int
+    base_times: List[time] = Field(..., min_length=1, max_length=100)
+
 # Sound schemas
 class SoundBase(BaseModel):
     name: str = Field(..., min_length=2, max_length=100)
@@ -92,6 +115,7 @@ class SoundCreate(SoundBase):
 
 class Sound(SoundBase):
     id: int
+    content_hash: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -110,6 +134,45 @@ class Holiday(HolidayBase):
     class Config:
         from_attributes = True
 
+# Ajakava schemas
+class DaySchedule(BaseModel):
+    date: date
+    is_holiday: bool
+    timetable: Optional[Timetable] = None
+    events: List[TimetableEvent]
+
+    class Config:
+        from_attributes = True
+
+class CalendarDay(BaseModel):
+    date: date
+    status: str  # "default", "special" või "none"
+    is_holiday: bool
+    timetable_id: Optional[int] = None
+    events: List[TimetableEvent]
+
+    class Config:
+        from_attributes = True
+
+class Bell(BaseModel):
+    at: datetime
+    event_id: int
+    timetable_id: int
+    event_name: str
+    sound_id: int
+
+    class Config:
+        from_attributes = True
+
+# Nimekirja muudatused (?since=<revisjon>)
+T = TypeVar("T")
+
+class ListDelta(BaseModel, Generic[T]):
+    revision: int
+    full: bool  # True: changed sisaldab kogu nimekirja
+    changed: List[T]
+    deleted: List[int]
+
 # Token schema
 class Token(BaseModel):
     access_token: str
@@ -1,35 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import asyncio
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from . import models, schemas
-from .database import get_db
+from . import changes, metrics, models, schemas
+from .cache import LRUCache
+from .config import settings
+from .tenancy import UnknownTenant, tenants
 
 # Konfiguratsioon
-SECRET_KEY = "your-secret-key-here"  # TODO: Move to environment variables
+SECRET_KEY = settings.auth.secret_key
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
+ACCESS_TOKEN_EXPIRE_MINUTES = settings.auth.token_expire_minutes
+
+# Autentimise vahemälud: kontrollitud tokenid (token -> (kool, kasutajanimi))
+# ja kasutajad ((kool, kasutajanimi) -> sessioonist lahti võetud User objekt)
+TOKEN_CACHE_SIZE = 4096
+PRINCIPAL_CACHE_SIZE = 1024
+PRINCIPAL_CACHE_TTL = 300  # sekundit
+
+_token_cache: LRUCache[Tuple[int, str]] = LRUCache(TOKEN_CACHE_SIZE)
+_principal_cache: LRUCache[models.User] = LRUCache(PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+auth_cache_hits = metrics.Counter(
+    "lible_auth_cache_hits_total", "Autentimise vahemälu tabamused", ["cache"]
+)
+auth_cache_misses = metrics.Counter(
+    "lible_auth_cache_misses_total", "Autentimise vahemälu möödalasud", ["cache"]
+)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Token pole kohustuslik (nt /metrics lubatud aadressidelt)
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+# passlib/bcrypt ja jose imporditakse esimesel kasutusel, et rakenduse ja
+# käsureatööriistade käivitus ei peaks nende laadimise eest maksma
+@lru_cache(maxsize=None)
+def pwd_context():
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+@lru_cache(maxsize=None)
+def _jose():
+    import jose
+    import jose.jwt
+
+    return jose
+
+def warm() -> None:
+    # bcrypt'i taustasüsteem valitakse samuti esimesel kasutusel
+    pwd_context().handler("bcrypt").get_backend()
+    _jose()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = db.query(models.User).filter(models.User.username == username).first()
+# Sisselogimise paroolikontroll käib piiratud lõimede kogumis, et bcrypt
+# (~200-300 ms) ei blokeeriks sündmustsüklit. bcrypt vabastab GIL-i, seega
+# jaotub töö tuumade vahel.
+PASSWORD_HASH_WORKERS = settings.auth.password_hash_workers
+PASSWORD_HASH_MAX_QUEUE = settings.auth.password_hash_max_queue
+
+password_pool_active = metrics.Gauge("lible_password_pool_active", "Töös olevad paroolikontrollid")
+password_pool_queued = metrics.Gauge("lible_password_pool_queued", "Järjekorras ootavad paroolikontrollid")
+password_pool_rejected = metrics.Counter(
+    "lible_password_pool_rejected_total", "Täis järjekorra tõttu tagasi lükatud paroolikontrollid"
+)
+password_pool_wait = metrics.Histogram(
+    "lible_password_pool_wait_seconds", "Paroolikontrolli ooteaeg järjekorras",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+class PasswordPool:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        self._pending = 0
+
+    async def run(self, func, *args):
+        if self._pending >= self.workers + self.max_queue:
+            password_pool_rejected.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server on hõivatud, proovige hetke pärast uuesti",
+                headers={"Retry-After": "1"},
+            )
+        self._pending += 1
+        password_pool_queued.inc()
+        submitted = time.monotonic()
+
+        def task():
+            password_pool_queued.dec()
+            password_pool_active.inc()
+            password_pool_wait.observe(time.monotonic() - submitted)
+            try:
+                return func(*args)
+            finally:
+                password_pool_active.dec()
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, task)
+        finally:
+            self._pending -= 1
+
+password_pool = PasswordPool()
+
+def authenticate_user(db: Session, username: str, password: str, tenant_id: int = models.DEFAULT_TENANT_ID):
+    user = db.query(models.User).filter(
+        models.User.tenant_id == tenant_id,
+        models.User.username == username
+    ).first()
     if not user or not user.is_local_auth:
         return False
     if not verify_password(password, user.password_hash):
         return False
     return user
 
+async def authenticate_user_async(
+    db: AsyncSession, username: str, password: str, tenant_id: int = models.DEFAULT_TENANT_ID
+):
+    # Kasutaja päring ootab sündmustsüklis, räsi kontroll tehakse paroolide kogumis
+    user = (await db.execute(select(models.User).where(
+        models.User.tenant_id == tenant_id,
+        models.User.username == username
+    ))).scalar_one_or_none()
+    if not user or not user.is_local_auth:
+        return False
+    if not await password_pool.run(verify_password, password, user.password_hash):
+        return False
+    return user
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -37,32 +148,78 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = _jose().jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> models.User:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> models.User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    principal = _token_cache.get(token)
+    if principal is not None:
+        auth_cache_hits.labels(cache="token").inc()
+    else:
+        auth_cache_misses.labels(cache="token").inc()
+        jose = _jose()
+        try:
+            payload = jose.jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+            token_data = schemas.TokenData(username=username)
+        except jose.JWTError:
             raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.username == token_data.username).first()
-    if user is None:
+        # Enne koolide lisamist väljastatud tokenid kuuluvad vaikimisi koolile
+        principal = (payload.get("tid", models.DEFAULT_TENANT_ID), token_data.username)
+        # Token kehtib vahemälus kuni selle aegumiseni
+        expires = payload.get("exp")
+        if expires is not None:
+            _token_cache.put(token, principal, ttl=expires - time.time())
+
+    user = _principal_cache.get(principal)
+    if user is not None:
+        auth_cache_hits.labels(cache="principal").inc()
+        return user
+    auth_cache_misses.labels(cache="principal").inc()
+
+    tenant_id, username = principal
+    try:
+        database = await tenants.database_async(tenant_id)
+    except UnknownTenant:
         raise credentials_exception
+    async with database.async_session_factory() as db:
+        user = (await db.execute(select(models.User).where(
+            models.User.tenant_id == tenant_id,
+            models.User.username == username
+        ))).scalar_one_or_none()
+        if user is None:
+            raise credentials_exception
+        # Lahti võetud objekt on jagatav ka teiste päringute vahel (ainult lugemiseks)
+        db.expunge(user)
+    _principal_cache.put(principal, user)
     return user
 
+# Kooli andmebaasi sessioonid (kool tuleb sisselogitud kasutajalt)
+def get_tenant_db(current_user: models.User = Depends(get_current_user)):
+    db = tenants.database(current_user.tenant_id).session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_tenant_async_db(current_user: models.User = Depends(get_current_user)):
+    database = await tenants.database_async(current_user.tenant_id)
+    async with database.async_session_factory() as db:
+        yield db
+
+def _invalidate_users(batch: List[changes.Change]) -> None:
+    if any(change.table == "users" for change in batch):
+        _principal_cache.clear()
+
+changes.subscribe(_invalidate_users)
+
 # Active Directory autentimine (implementeeri vastavalt vajadusele)
 def authenticate_ad_user(username: str, password: str) -> bool:
     # TODO: Implement AD authentication
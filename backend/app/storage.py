@@ -0,0 +1,190 @@
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import hashlib
+import logging
+import os
+import tempfile
+from fastapi import UploadFile
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from . import changes, models
+from .cache import LRUCache
+from .config import resolve_path, settings
+
+logger = logging.getLogger(__name__)
+
+# Helinate kaust (vaikimisi kool ja ühine andmebaas; kooli oma
+# andmebaasifaili puhul on koolil ka oma kaust)
+SOUNDS_DIRECTORY = resolve_path(settings.audio.storage_path)
+
+def ensure_directory(directory: str = SOUNDS_DIRECTORY) -> None:
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+        logger.info("Helinate kaust loodud", extra={"directory": directory})
+
+# Üleslaadimine loetakse tükkhaaval, et mälukasutus ei sõltuks faili suurusest
+CHUNK_SIZE = 64 * 1024
+
+class UploadTooLarge(Exception):
+    pass
+
+@dataclass(frozen=True)
+class StoredUpload:
+    temp_path: str
+    size: int
+    sha256: str
+
+async def receive_upload(upload: UploadFile, directory: str, max_size: int) -> StoredUpload:
+    # Voogedastab faili ajutisse faili samas kaustas (et hilisem os.replace
+    # oleks atomaarne) ja arvutab samal ajal räsi. Kettatöö tehakse lõimede
+    # kogumis, et sündmustsükkel ei blokeeruks.
+    fd, temp_path = await run_in_threadpool(
+        tempfile.mkstemp, dir=directory, prefix=".upload-", suffix=".part"
+    )
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+            await run_in_threadpool(f.flush)
+            await run_in_threadpool(os.fsync, f.fileno())
+    except BaseException:
+        await run_in_threadpool(discard, temp_path)
+        raise
+    return StoredUpload(temp_path=temp_path, size=size, sha256=digest.hexdigest())
+
+def discard(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+# Sisuaadressiga salvestus: fail salvestatakse SHA-256 räsi nime all ja
+# sound_blobs tabel loendab, mitu helinat sellele viitab.
+
+def blob_path(content_hash: str, directory: str = SOUNDS_DIRECTORY) -> str:
+    return os.path.join(directory, content_hash)
+
+def _acquire_blob(db: Session, upload: StoredUpload, directory: str) -> None:
+    updated = db.query(models.SoundBlob).filter(
+        models.SoundBlob.hash == upload.sha256
+    ).update({models.SoundBlob.ref_count: models.SoundBlob.ref_count + 1}, synchronize_session=False)
+    final_path = blob_path(upload.sha256, directory)
+    if updated and os.path.exists(final_path):
+        # Sama sisu on juba olemas
+        discard(upload.temp_path)
+        return
+    os.replace(upload.temp_path, final_path)
+    if not updated:
+        db.add(models.SoundBlob(hash=upload.sha256, size=upload.size, ref_count=1))
+
+def save_sound(
+    db: Session,
+    name: str,
+    upload: StoredUpload,
+    tenant_id: int = models.DEFAULT_TENANT_ID,
+    directory: str = SOUNDS_DIRECTORY,
+) -> models.Sound:
+    for attempt in range(2):
+        try:
+            _acquire_blob(db, upload, directory)
+            db_sound = models.Sound(
+                tenant_id=tenant_id, name=name, filename=upload.sha256, content_hash=upload.sha256
+            )
+            db.add(db_sound)
+            db.commit()
+        except IntegrityError:
+            # Sama sisu laaditi samal ajal üles; proovime viite suurendamisega uuesti
+            db.rollback()
+            if attempt:
+                raise
+            continue
+        db.refresh(db_sound)
+        return db_sound
+
+def release_blob(db: Session, content_hash: Optional[str]) -> bool:
+    # Vähendab viidete arvu; tagastab True, kui blob jäi viideteta ja
+    # fail tuleb pärast commit'i kustutada
+    if not content_hash:
+        return False
+    db.query(models.SoundBlob).filter(
+        models.SoundBlob.hash == content_hash
+    ).update({models.SoundBlob.ref_count: models.SoundBlob.ref_count - 1}, synchronize_session=False)
+    deleted = db.query(models.SoundBlob).filter(
+        models.SoundBlob.hash == content_hash,
+        models.SoundBlob.ref_count <= 0
+    ).delete(synchronize_session=False)
+    return bool(deleted)
+
+def remove_orphan_blob(db: Session, content_hash: str, directory: str = SOUNDS_DIRECTORY) -> None:
+    # Vahepeal võidi sama sisu uuesti üles laadida
+    if db.get(models.SoundBlob, content_hash) is None:
+        discard(blob_path(content_hash, directory))
+
+# Helifailide metaandmete vahemälu (id -> tee, ETag), et korduvad
+# päringud ei peaks ORM-i ega failisüsteemi poole pöörduma. Võti on
+# (kool, id), sest koolide andmebaasifailides võivad id-d korduda.
+
+@dataclass(frozen=True)
+class SoundFile:
+    path: str
+    size: int
+    etag: str
+    immutable: bool
+
+sound_files: LRUCache[SoundFile] = LRUCache(1024)
+
+def lookup_sound_file(
+    db: Session,
+    sound_id: int,
+    tenant_id: int = models.DEFAULT_TENANT_ID,
+    directory: str = SOUNDS_DIRECTORY,
+) -> Optional[SoundFile]:
+    key: Tuple[int, int] = (tenant_id, sound_id)
+    info = sound_files.get(key)
+    if info is not None:
+        return info
+    row = db.query(models.Sound.filename, models.Sound.content_hash).filter(
+        models.Sound.tenant_id == tenant_id,
+        models.Sound.id == sound_id
+    ).first()
+    if row is None:
+        return None
+    path = os.path.join(directory, row.filename)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if row.content_hash:
+        info = SoundFile(path=path, size=stat.st_size, etag=f'"{row.content_hash}"', immutable=True)
+    else:
+        # Vana fail: ETag suuruse ja muutmisaja järgi
+        etag = f'W/"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        info = SoundFile(path=path, size=stat.st_size, etag=etag, immutable=False)
+    sound_files.put(key, info)
+    return info
+
+def read_range(path: str, start: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+def _invalidate_sound_files(batch: List[changes.Change]) -> None:
+    for change in batch:
+        if change.table != "sounds":
+            continue
+        if change.tenant_id is None:
+            sound_files.clear()
+            return
+        sound_files.pop((change.tenant_id, change.id))
+
+changes.subscribe(_invalidate_sound_files)
@@ -0,0 +1,176 @@
+from typing import Optional
+import json
+import logging
+import sys
+import time
+import anyio.to_thread
+from . import metrics
+from .config import resolve_path, settings
+from .database import count_queries
+from .profiling import SamplingProfiler
+
+# Päringute mõõdikud, logimise seadistus ja profileerimise konks.
+# TelemetryMiddleware on puhas ASGI vahevara: iga HTTP päringu kohta
+# mõõdetakse kestus, SQL-päringute arv ja aeg ning päringu keha maht.
+
+logger = logging.getLogger(__name__)
+
+# Mõõdikute silt on marsruudi mall (nt /timetables/{timetable_id}), mitte
+# konkreetne tee, et siltide arv jääks piiratuks
+UNMATCHED_ROUTE = "unmatched"
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+http_requests = metrics.Counter(
+    "lible_http_requests_total", "HTTP päringute arv", ["method", "route", "status"]
+)
+http_duration = metrics.Histogram(
+    "lible_http_request_duration_seconds", "HTTP päringu kestus", ["method", "route"]
+)
+http_in_progress = metrics.Gauge("lible_http_requests_in_progress", "Pooleliolevad HTTP päringud")
+http_request_bytes = metrics.Counter(
+    "lible_http_request_body_bytes_total", "Vastu võetud päringu kehade (üleslaadimiste) maht", ["route"]
+)
+sql_queries = metrics.Histogram(
+    "lible_http_request_sql_queries", "SQL-päringute arv HTTP päringu kohta", ["route"], buckets=QUERY_BUCKETS
+)
+sql_seconds = metrics.Histogram(
+    "lible_http_request_sql_seconds", "SQL-päringutele kulunud aeg HTTP päringu kohta", ["route"]
+)
+threadpool_size = metrics.Gauge("lible_threadpool_size", "Lõimede kogumi suurus")
+threadpool_busy = metrics.Gauge("lible_threadpool_busy", "Hõivatud lõimed kogumis")
+threadpool_waiting = metrics.Gauge("lible_threadpool_waiting", "Vaba lõime ootavad ülesanded")
+profiles_written = metrics.Counter("lible_profiles_written_total", "Salvestatud päringuprofiilid")
+
+def update_threadpool_metrics() -> None:
+    # Starlette'i sünkroonsed marsruudid ja run_in_threadpool kasutavad
+    # anyio vaikimisi piirajat; loetakse mõõdikute päringu ajal
+    statistics = anyio.to_thread.current_default_thread_limiter().statistics()
+    threadpool_size.set(statistics.total_tokens)
+    threadpool_busy.set(statistics.borrowed_tokens)
+    threadpool_waiting.set(statistics.tasks_waiting)
+
+# Logimine
+
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class StructuredFormatter(logging.Formatter):
+    # logger.info("...", extra={"sound_id": 1}) väljad lisatakse kirjele
+    # võti=väärtus paaridena või JSON objekti väljadena
+    def __init__(self, as_json: bool = False):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+        if not self.as_json:
+            text = super().format(record)
+            if fields:
+                text += " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+            return text
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **fields,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging(level: str = settings.logging.level, format: str = settings.logging.format) -> None:
+    # Rakenduse logijad on "app" all; uvicorni logimist ei muudeta
+    root = logging.getLogger("app")
+    root.setLevel(level.upper())
+    if not any(getattr(handler, "lible", False) for handler in root.handlers):
+        handler = logging.StreamHandler(sys.stderr)
+        handler.lible = True
+        root.addHandler(handler)
+        root.propagate = False
+    for handler in root.handlers:
+        if getattr(handler, "lible", False):
+            handler.setFormatter(StructuredFormatter(as_json=format == "json"))
+
+# Profileerimine
+
+PROFILING = settings.profiling
+PROFILE_HEADER = PROFILING.header.lower().encode("latin-1")
+profiler = SamplingProfiler(PROFILING.interval_ms / 1000, resolve_path(PROFILING.directory))
+
+def _profile_requested(scope) -> bool:
+    if not PROFILING.allow_header:
+        return False
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER:
+            return value not in (b"", b"0")
+    return False
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED_ROUTE)
+
+class TelemetryMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        received = 0
+
+        async def receive_counting():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        forced = _profile_requested(scope)
+        recording = profiler.begin(f"{scope['method']} {scope['path']}") if forced or PROFILING.enabled else None
+        http_in_progress.inc()
+        started = time.perf_counter()
+        with count_queries() as queries:
+            try:
+                await self.app(scope, receive_counting, send_status)
+            finally:
+                elapsed = time.perf_counter() - started
+                http_in_progress.dec()
+                route = _route_label(scope)
+                method = scope["method"]
+                http_requests.labels(method, route, status).inc()
+                http_duration.labels(method, route).observe(elapsed)
+                sql_queries.labels(route).observe(queries.count)
+                sql_seconds.labels(route).observe(queries.seconds)
+                if received:
+                    http_request_bytes.labels(route).inc(received)
+                if recording is not None:
+                    self._finish_profile(recording, forced)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Päring", extra={
+                        "method": method, "path": scope["path"], "status": status,
+                        "ms": round(elapsed * 1000, 2), "queries": queries.count,
+                    })
+
+    def _finish_profile(self, recording, forced: bool) -> Optional[str]:
+        elapsed = profiler.end(recording)
+        if not forced and elapsed * 1000 < PROFILING.slow_request_ms:
+            return None
+        try:
+            path = profiler.dump(recording, elapsed)
+        except OSError:
+            logger.exception("Profiili salvestamine ebaõnnestus")
+            return None
+        if path:
+            profiles_written.inc()
+            logger.info("Päringu profiil salvestatud", extra={"profile": path, "ms": round(elapsed * 1000, 1)})
+        return path
@@ -0,0 +1,19 @@
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from . import models
+
+# Malli instantsi id-d jagatakse kooli loenduri järgi. Loendur suurendatakse
+# ühe UPDATE lausega rakendamise tehingus; rida (SQLite'is kogu andmebaas)
+# jääb lukku tehingu lõpuni, seega samaaegsed rakendamised ei saa sama id-d.
+
+def allocate_instance_ids(db: Session, tenant_id: int, count: int) -> int:
+    # Tagastab esimese id vahemikust [first, first + count)
+    Tenant = models.Tenant
+    next_id = db.execute(
+        update(Tenant)
+        .where(Tenant.id == tenant_id)
+        .values(next_template_instance_id=Tenant.next_template_instance_id + count)
+        .returning(Tenant.next_template_instance_id)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+    return next_id - count
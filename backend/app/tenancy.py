@@ -0,0 +1,258 @@
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+import getpass
+import logging
+import os
+import re
+import sys
+import threading
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+from . import migrate, models
+from .cache import LRUCache
+from .config import resolve_path, settings
+from .database import (
+    AsyncSessionLocal,
+    SessionLocal,
+    create_async_db_engine,
+    create_db_engine,
+    instrument_engine,
+)
+from .storage import SOUNDS_DIRECTORY
+
+# Koolid (tenants). Koolide nimekiri on alati põhiandmebaasis. Andmed on
+# kas samas andmebaasis (mode: shared) või iga kooli oma SQLite failis
+# (mode: sqlite_per_tenant), mis hoiab suure kooli andmemahu ja kirjutamised
+# teistest eraldi. Vaikimisi kool kasutab mõlemal juhul põhiandmebaasi.
+#
+#   cd backend
+#   python -m app.tenancy create <slug> [nimi]
+#   python -m app.tenancy create-user <slug> <kasutajanimi> [parool]
+#   python -m app.tenancy list
+
+logger = logging.getLogger(__name__)
+
+SHARED = "shared"
+SQLITE_PER_TENANT = "sqlite_per_tenant"
+MODES = (SHARED, SQLITE_PER_TENANT)
+
+# Päis, millega sisselogimisel kool valitakse (puudumisel vaikimisi kool)
+TENANT_HEADER = "X-Lible-Tenant"
+SLUG_PATTERN = re.compile(r"^[a-z0-9][a-z0-9-]{0,62}$")
+
+class UnknownTenant(Exception):
+    pass
+
+@dataclass(frozen=True)
+class TenantDatabase:
+    tenant_id: int
+    session_factory: sessionmaker
+    async_session_factory: async_sessionmaker
+    sounds_directory: str
+
+class TenantRegistry:
+    def __init__(
+        self,
+        mode: str = settings.tenancy.mode,
+        directory: str = resolve_path(settings.tenancy.directory),
+        cache_ttl: float = settings.tenancy.cache_ttl,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Tundmatu tenancy.mode '{mode}' (lubatud: {', '.join(MODES)})")
+        self.mode = mode
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._databases: Dict[int, TenantDatabase] = {}
+        self._engines = []
+        self._slugs: LRUCache[int] = LRUCache(1024, ttl=cache_ttl)
+        self._ids: LRUCache[List[int]] = LRUCache(1, ttl=cache_ttl)
+
+    @property
+    def per_tenant(self) -> bool:
+        return self.mode == SQLITE_PER_TENANT
+
+    # Andmebaasid
+
+    def database(self, tenant_id: int) -> TenantDatabase:
+        database = self._databases.get(tenant_id)
+        if database is not None:
+            return database
+        with self._lock:
+            database = self._databases.get(tenant_id)
+            if database is None:
+                database = self._databases[tenant_id] = self._open(tenant_id)
+            return database
+
+    async def database_async(self, tenant_id: int) -> TenantDatabase:
+        # Esimene avamine võib luua faili ja käivitada migratsioonid
+        database = self._databases.get(tenant_id)
+        if database is not None:
+            return database
+        return await run_in_threadpool(self.database, tenant_id)
+
+    def _open(self, tenant_id: int) -> TenantDatabase:
+        if not self.per_tenant or tenant_id == models.DEFAULT_TENANT_ID:
+            return TenantDatabase(tenant_id, SessionLocal, AsyncSessionLocal, SOUNDS_DIRECTORY)
+        tenant = self._tenant(tenant_id)
+        path = os.path.join(self.directory, tenant.slug)
+        sounds_directory = os.path.join(path, "sounds")
+        os.makedirs(sounds_directory, exist_ok=True)
+        db_settings = replace(settings.database, url=f"sqlite:///{os.path.join(path, 'lible.db')}")
+        engine = create_db_engine(db_settings)
+        async_engine = create_async_db_engine(db_settings)
+        instrument_engine(engine)
+        instrument_engine(async_engine.sync_engine)
+        self._engines.extend([engine, async_engine])
+        migrate.ensure_schema(engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        # Kooli rida peab olema ka kooli failis (välisvõtmed)
+        db = session_factory()
+        try:
+            if db.get(models.Tenant, tenant_id) is None:
+                db.add(models.Tenant(id=tenant_id, slug=tenant.slug, name=tenant.name))
+                db.commit()
+        finally:
+            db.close()
+        logger.info("Kooli andmebaas avatud", extra={"tenant": tenant.slug, "path": path})
+        return TenantDatabase(
+            tenant_id,
+            session_factory,
+            async_sessionmaker(async_engine, expire_on_commit=False),
+            sounds_directory,
+        )
+
+    async def dispose(self) -> None:
+        with self._lock:
+            engines, self._engines = self._engines, []
+            self._databases.clear()
+        for engine in engines:
+            result = engine.dispose()
+            if result is not None:
+                await result
+
+    # Koolide nimekiri (põhiandmebaasis)
+
+    def _tenant(self, tenant_id: int) -> models.Tenant:
+        db = SessionLocal()
+        try:
+            tenant = db.get(models.Tenant, tenant_id)
+            if tenant is None:
+                raise UnknownTenant(tenant_id)
+            db.expunge(tenant)
+            return tenant
+        finally:
+            db.close()
+
+    def tenant_ids(self) -> List[int]:
+        ids = self._ids.get("all")
+        if ids is None:
+            db = SessionLocal()
+            try:
+                ids = [row.id for row in db.query(models.Tenant.id).order_by(models.Tenant.id)]
+            finally:
+                db.close()
+            self._ids.put("all", ids)
+        return ids
+
+    async def resolve(self, slug: Optional[str]) -> int:
+        if not slug:
+            return models.DEFAULT_TENANT_ID
+        tenant_id = self._slugs.get(slug)
+        if tenant_id is None:
+            async with AsyncSessionLocal() as db:
+                tenant_id = (await db.execute(
+                    select(models.Tenant.id).where(models.Tenant.slug == slug)
+                )).scalar_one_or_none()
+            if tenant_id is None:
+                raise UnknownTenant(slug)
+            self._slugs.put(slug, tenant_id)
+        return tenant_id
+
+    def create(self, slug: str, name: Optional[str] = None) -> int:
+        if not SLUG_PATTERN.match(slug):
+            raise ValueError("Kooli lühinimi võib sisaldada ainult väiketähti, numbreid ja sidekriipse")
+        db = SessionLocal()
+        try:
+            tenant = models.Tenant(slug=slug, name=name or slug)
+            db.add(tenant)
+            db.commit()
+            tenant_id = tenant.id
+        finally:
+            db.close()
+        self._ids.clear()
+        if self.per_tenant:
+            self.database(tenant_id)
+        return tenant_id
+
+    def create_user(self, slug: str, username: str, password: str, language: str = "et") -> int:
+        # security impordib tenancy mooduli, seega räsimine imporditakse siin
+        from .security import get_password_hash
+
+        db = SessionLocal()
+        try:
+            tenant_id = db.execute(
+                select(models.Tenant.id).where(models.Tenant.slug == slug)
+            ).scalar_one_or_none()
+        finally:
+            db.close()
+        if tenant_id is None:
+            raise UnknownTenant(slug)
+        # Kasutaja kirjutatakse kooli andmebaasi, kust /token teda otsib
+        db = self.database(tenant_id).session_factory()
+        try:
+            exists = db.query(models.User.id).filter(
+                models.User.tenant_id == tenant_id,
+                models.User.username == username
+            ).first()
+            if exists:
+                raise ValueError(f"Kasutaja '{username}' on koolis '{slug}' juba olemas")
+            db.add(models.User(
+                tenant_id=tenant_id,
+                username=username,
+                password_hash=get_password_hash(password),
+                is_local_auth=True,
+                language=language
+            ))
+            db.commit()
+        finally:
+            db.close()
+        return tenant_id
+
+tenants = TenantRegistry()
+
+def main(argv: List[str]) -> int:
+    migrate.ensure_schema()
+    if len(argv) >= 2 and argv[0] == "create":
+        tenant_id = tenants.create(argv[1], " ".join(argv[2:]) or None)
+        print(f"Kool '{argv[1]}' loodud (id {tenant_id})")
+        return 0
+    if len(argv) in (3, 4) and argv[0] == "create-user":
+        password = argv[3] if len(argv) == 4 else getpass.getpass("Parool: ")
+        try:
+            tenants.create_user(argv[1], argv[2], password)
+        except UnknownTenant:
+            print(f"Kooli '{argv[1]}' ei leitud")
+            return 1
+        except ValueError as exc:
+            print(exc)
+            return 1
+        print(f"Kasutaja '{argv[2]}' loodud koolile '{argv[1]}'")
+        return 0
+    if argv == ["list"]:
+        db = SessionLocal()
+        try:
+            for tenant in db.query(models.Tenant).order_by(models.Tenant.id):
+                print(f"{tenant.id}\t{tenant.slug}\t{tenant.name or ''}")
+        finally:
+            db.close()
+        return 0
+    print(
+        "Kasutus: python -m app.tenancy create <slug> [nimi] | "
+        "create-user <slug> <kasutajanimi> [parool] | list"
+    )
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
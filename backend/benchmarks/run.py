@@ -0,0 +1,279 @@
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# Võrdlusmõõtmised API kuumadele radadele ja ajakava lahendamisele.
+#
+#   cd backend
+#   python -m benchmarks.run                       # mõõda ja prindi tulemused
+#   python -m benchmarks.run --save main           # salvesta baastase
+#   python -m benchmarks.run --compare main        # võrdle baastasemega
+#
+# Iga käivitus loob ajutise SQLite andmebaasi ja helinate kausta, täidab
+# need fikseeritud seemnega ning mõõdab päringuid FastAPI TestClient'iga.
+# Ajutine kaust kustutatakse mõõtmise lõpus.
+
+BACKEND_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BASELINE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+def _prepare_environment(work: str) -> None:
+    # Seaded loetakse rakenduse importimisel, seega konfiguratsioon
+    # kirjutatakse enne app paketi importi
+    config_path = os.path.join(work, "config.yaml")
+    with open(config_path, "w", encoding="utf-8") as f:
+        f.write(
+            "database:\n"
+            f"  url: sqlite:///{os.path.join(work, 'bench.db')}\n"
+            "audio:\n"
+            f"  storage_path: {os.path.join(work, 'sounds')}\n"
+        )
+    os.environ["LIBLE_CONFIG"] = config_path
+    if BACKEND_DIRECTORY not in sys.path:
+        sys.path.insert(0, BACKEND_DIRECTORY)
+
+class QueryCounter:
+    # Kõik mõõtmised käivad järjest, seega piisab globaalsest loendurist
+    def __init__(self, engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args) -> None:
+        self.count += 1
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def measure(name: str, request: Callable[[int], None], iterations: int, warmup: int,
+            queries: QueryCounter, before: Optional[Callable[[], None]] = None) -> dict:
+    for i in range(warmup):
+        if before:
+            before()
+        request(i)
+    latencies = []
+    query_count = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        if before:
+            before()
+        queries_before = queries.count
+        t0 = time.perf_counter()
+        request(i)
+        latencies.append(time.perf_counter() - t0)
+        query_count += queries.count - queries_before
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "name": name,
+        "iterations": iterations,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 4),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 4),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 4),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 4),
+        "throughput_rps": round(iterations / elapsed, 1) if elapsed else 0.0,
+        "queries_per_request": round(query_count / iterations, 2),
+    }
+
+def run(args) -> dict:
+    # Ajutine andmebaas ja helinad kustutatakse ka katkenud mõõtmise järel
+    work = tempfile.mkdtemp(prefix="lible-bench-")
+    try:
+        return _run(args, work)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def _run(args, work: str) -> dict:
+    from .seed import BENCH_PASSWORD, BENCH_USERNAME, SeedSize, seed_database
+
+    _prepare_environment(work)
+
+    from fastapi.testclient import TestClient
+    from app import migrate
+    from app.database import SessionLocal, async_engine, engine
+    from app.main import app
+    from app.response_cache import response_cache
+    from app.models import DEFAULT_TENANT_ID
+    from app.schedule import schedule_engines
+    from app.scheduler import bell_schedulers
+    from app.storage import SOUNDS_DIRECTORY, sound_files
+
+    size = SeedSize(
+        timetables=args.timetables,
+        events=args.events,
+        templates=args.templates,
+        template_items=args.template_items,
+        holidays=args.holidays,
+        sounds=args.sounds,
+        sound_bytes=args.sound_bytes,
+        seed=args.seed,
+    )
+    migrate.upgrade_database()
+    db = SessionLocal()
+    try:
+        seeded = seed_database(db, SOUNDS_DIRECTORY, size)
+    finally:
+        db.close()
+
+    queries = QueryCounter([engine, async_engine.sync_engine])
+    rng = random.Random(args.seed)
+    days = [seeded.first_day + timedelta(days=rng.randrange((seeded.last_day - seeded.first_day).days))
+            for _ in range(1024)]
+    timetable_ids = [rng.choice(seeded.timetable_ids) for _ in range(1024)]
+    sound_ids = [rng.choice(seeded.sound_ids) for _ in range(1024)]
+
+    def cold() -> None:
+        # Külm mõõtmine: mälus olevad vahemälud tühjendatakse enne igat päringut
+        response_cache.clear()
+        schedule_engines.invalidate()
+        sound_files.clear()
+
+    before = cold if args.cold else None
+    results = []
+    with TestClient(app) as client:
+        # Kellade ajastaja peatatakse, et taustatöö ei moonutaks mõõtmisi
+        client.portal.call(bell_schedulers.stop)
+
+        def login(i: int) -> None:
+            response = client.post("/token", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+            assert response.status_code == 200, response.text
+
+        token = client.post("/token", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        def get(path: str, expected: int = 200, extra: Optional[Dict[str, str]] = None) -> None:
+            response = client.get(path, headers={**headers, **(extra or {})})
+            assert response.status_code == expected, (path, response.status_code, response.text)
+
+        scenarios = [
+            ("token", login, max(1, args.iterations // 10)),
+            ("timetables", lambda i: get("/timetables"), args.iterations),
+            ("timetable_events", lambda i: get(f"/timetables/{timetable_ids[i % 1024]}/events"), args.iterations),
+            ("templates", lambda i: get("/templates"), args.iterations),
+            ("sound_stream", lambda i: get(f"/sounds/{sound_ids[i % 1024]}"), args.iterations),
+            ("sound_range", lambda i: get(
+                f"/sounds/{sound_ids[i % 1024]}", 206, {"Range": "bytes=0-65535"}
+            ), args.iterations),
+            ("schedule_by_date", lambda i: get(f"/timetables/by-date/{days[i % 1024]}"), args.iterations),
+            ("calendar_month", lambda i: get(
+                f"/calendar?from={days[i % 1024]}&to={days[i % 1024] + timedelta(days=30)}"
+            ), args.iterations),
+            ("bells_next", lambda i: get(f"/bells/next?after={days[i % 1024]}T07:00:00&count=20"), args.iterations),
+        ]
+
+        def resolve_direct(i: int) -> None:
+            session = SessionLocal()
+            try:
+                schedule_engines.get(DEFAULT_TENANT_ID).resolve(session, seeded.user_id, days[i % 1024])
+            finally:
+                session.close()
+
+        scenarios.append(("engine_resolve", resolve_direct, args.iterations))
+
+        selected = set(args.only) if args.only else None
+        for name, request, iterations in scenarios:
+            if selected and name not in selected:
+                continue
+            result = measure(name, request, iterations, args.warmup, queries, before)
+            results.append(result)
+            print(_format_row(result))
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cold": args.cold,
+            "seed": size.as_dict(),
+        },
+        "results": results,
+    }
+
+COLUMNS = ("name", "p50_ms", "p95_ms", "p99_ms", "throughput_rps", "queries_per_request")
+
+def _format_row(result: dict) -> str:
+    return "{:<18} p50 {:>9.3f} ms  p95 {:>9.3f} ms  p99 {:>9.3f} ms  {:>9.1f} req/s  {:>6.2f} päringut".format(
+        *(result[column] for column in COLUMNS)
+    )
+
+def compare(current: dict, baseline: dict, threshold: float) -> bool:
+    # Tagastab True, kui mõni stsenaarium on baastasemest oluliselt aeglasem
+    previous = {result["name"]: result for result in baseline["results"]}
+    regressed = False
+    print()
+    print("Võrdlus baastasemega (p50 / p95, muutus %):")
+    for result in current["results"]:
+        old = previous.get(result["name"])
+        if old is None:
+            print(f"{result['name']:<18} uus stsenaarium")
+            continue
+        changes = []
+        for key in ("p50_ms", "p95_ms"):
+            ratio = result[key] / old[key] - 1 if old[key] else 0.0
+            changes.append(ratio)
+        mark = ""
+        if changes[0] > threshold:
+            regressed = True
+            mark = "  << AEGLASEM"
+        queries = ""
+        if result["queries_per_request"] != old["queries_per_request"]:
+            queries = f"  päringuid {old['queries_per_request']} -> {result['queries_per_request']}"
+        print(f"{result['name']:<18} {changes[0]:+7.1%} / {changes[1]:+7.1%}{queries}{mark}")
+    return regressed
+
+def _baseline_path(name: str) -> str:
+    if name.endswith(".json") or os.sep in name:
+        return name
+    return os.path.join(BASELINE_DIRECTORY, f"{name}.json")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Lible API võrdlusmõõtmised")
+    parser.add_argument("--iterations", type=int, default=200, help="päringuid stsenaariumi kohta")
+    parser.add_argument("--warmup", type=int, default=10, help="soojenduspäringuid enne mõõtmist")
+    parser.add_argument("--timetables", type=int, default=50)
+    parser.add_argument("--events", type=int, default=12, help="sündmusi tunniplaani kohta")
+    parser.add_argument("--templates", type=int, default=20)
+    parser.add_argument("--template-items", type=int, default=6)
+    parser.add_argument("--holidays", type=int, default=30)
+    parser.add_argument("--sounds", type=int, default=10)
+    parser.add_argument("--sound-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cold", action="store_true", help="tühjenda vahemälud enne igat päringut")
+    parser.add_argument("--only", nargs="+", metavar="NIMI", help="mõõda ainult neid stsenaariume")
+    parser.add_argument("--save", metavar="NIMI", help="salvesta tulemused baastasemeks")
+    parser.add_argument("--compare", metavar="NIMI", help="võrdle salvestatud baastasemega")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="lubatud p50 aeglustumine võrdlusel (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    current = run(args)
+
+    if args.save:
+        path = _baseline_path(args.save)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"\nBaastase salvestatud: {path}")
+
+    if args.compare:
+        with open(_baseline_path(args.compare), encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"]["seed"] != current["meta"]["seed"] or baseline["meta"]["cold"] != current["meta"]["cold"]:
+            print("Hoiatus: baastase on mõõdetud teiste andmete või seadetega")
+        if compare(current, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+from dataclasses import asdict, dataclass
+from datetime import date, time, timedelta
+import hashlib
+import os
+import random
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+# Võrdlusmõõtmiste andmebaasi täitmine. Andmed genereeritakse fikseeritud
+# seemnega, et kaks käivitust mõõdaksid sama andmestikku.
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench123"
+
+@dataclass
+class SeedSize:
+    timetables: int = 50
+    events: int = 12  # sündmusi tunniplaani kohta
+    templates: int = 20
+    template_items: int = 6
+    holidays: int = 30
+    sounds: int = 10
+    sound_bytes: int = 256 * 1024
+    seed: int = 1
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+@dataclass
+class SeedResult:
+    user_id: int
+    timetable_ids: list
+    sound_ids: list
+    first_day: date
+    last_day: date
+
+def _rows_in_batches(db: Session, model, rows, batch_size: int = 1000):
+    for start in range(0, len(rows), batch_size):
+        db.execute(insert(model), rows[start:start + batch_size])
+
+def seed_database(db: Session, sounds_directory: str, size: SeedSize) -> SeedResult:
+    from app import models
+    from app.security import get_password_hash
+
+    rng = random.Random(size.seed)
+    user = models.User(username=BENCH_USERNAME, password_hash=get_password_hash(BENCH_PASSWORD), is_local_auth=True)
+    db.add(user)
+    db.flush()
+
+    # Helinad: juhuslik sisu, salvestatud sisu räsi nime all nagu üleslaadimisel
+    os.makedirs(sounds_directory, exist_ok=True)
+    sound_ids = []
+    for i in range(size.sounds):
+        content = rng.randbytes(size.sound_bytes)
+        content_hash = hashlib.sha256(content).hexdigest()
+        with open(os.path.join(sounds_directory, content_hash), "wb") as f:
+            f.write(content)
+        db.add(models.SoundBlob(hash=content_hash, size=len(content), ref_count=1))
+        sound = models.Sound(name=f"Helin {i + 1}", filename=content_hash, content_hash=content_hash)
+        db.add(sound)
+        db.flush()
+        sound_ids.append(sound.id)
+
+    # Tunniplaanid: üks vaikimisi tunniplaan ja ülejäänud kehtivusajaga
+    first_day = date(2024, 9, 1)
+    last_day = first_day + timedelta(days=365 * 3)
+    timetable_ids = []
+    for i in range(size.timetables):
+        if i == 0:
+            valid_from, valid_until, weekdays = first_day, None, 31
+        else:
+            valid_from = first_day + timedelta(days=rng.randrange((last_day - first_day).days))
+            valid_until = valid_from + timedelta(days=rng.randrange(1, 60))
+            weekdays = rng.randrange(1, 128)
+        timetable = models.Timetable(
+            name=f"Tunniplaan {i + 1}",
+            valid_from=valid_from,
+            valid_until=valid_until,
+            weekdays=weekdays,
+            user_id=user.id,
+        )
+        db.add(timetable)
+        db.flush()
+        timetable_ids.append(timetable.id)
+
+    events = []
+    for timetable_id in timetable_ids:
+        for j in range(size.events):
+            minutes = 8 * 60 + j * 50
+            events.append({
+                "timetable_id": timetable_id,
+                "event_name": f"Tund {j + 1}",
+                "event_time": time(minutes // 60 % 24, minutes % 60),
+                "sound_id": rng.choice(sound_ids),
+                "is_template_base": False,
+            })
+    _rows_in_batches(db, models.TimetableEvent, events)
+
+    for i in range(size.templates):
+        template = models.EventTemplate(name=f"Mall {i + 1}", description="Võrdlusmõõtmise mall")
+        db.add(template)
+        db.flush()
+        _rows_in_batches(db, models.EventTemplateItem, [{
+            "template_id": template.id,
+            "offset_minutes": k * 5,
+            "event_name": f"Samm {k + 1}",
+            "sound_id": rng.choice(sound_ids),
+        } for k in range(size.template_items)])
+
+    holidays = []
+    for _ in range(size.holidays):
+        start = first_day + timedelta(days=rng.randrange((last_day - first_day).days))
+        holidays.append({"valid_from": start, "valid_until": start + timedelta(days=rng.randrange(0, 10))})
+    _rows_in_batches(db, models.Holiday, holidays)
+
+    db.commit()
+    return SeedResult(
+        user_id=user.id,
+        timetable_ids=timetable_ids,
+        sound_ids=sound_ids,
+        first_day=first_day,
+        last_day=last_day,
+    )
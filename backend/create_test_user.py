@@ -1,21 +1,26 @@
 from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine
-from app.models import Base, User
+from app.database import SessionLocal
+from app.migrate import ensure_schema
+from app.models import DEFAULT_TENANT_ID, User
 from app.security import get_password_hash
 
 def create_test_user():
-    Base.metadata.create_all(bind=engine)
+    ensure_schema()
     db = SessionLocal()
 
     try:
         # Kontrolli, kas kasutaja juba eksisteerib
-        existing_user = db.query(User).filter(User.username == "admin").first()
+        existing_user = db.query(User).filter(
+            User.tenant_id == DEFAULT_TENANT_ID,
+            User.username == "admin"
+        ).first()
         if existing_user:
             print("Testkasutaja on juba olemas")
             return
 
         # Loo uus testkasutaja
         test_user = User(
+            tenant_id=DEFAULT_TENANT_ID,
             username="admin",
             password_hash=get_password_hash("admin123"),
             is_local_auth=True,
@@ -0,0 +1,42 @@
+from logging.config import fileConfig
+from alembic import context
+from app import models
+from app.database import engine
+
+# Migratsioonid kasutavad rakenduse mootorit (sama URL ja SQLite seaded).
+# app.migrate annab ühenduse ette config.attributes["connection"] kaudu.
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("connection") is None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = models.Base.metadata
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=str(engine.url),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online() -> None:
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+        return
+    with engine.connect() as connection:
+        _run(connection)
+
+def _run(connection) -> None:
+    # SQLite ei toeta enamikku ALTER TABLE lauseid, batch-režiim loob tabeli uuesti
+    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,128 @@
+"""Algne skeem
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Enne migratsioone loodi skeem create_all() abil. Sellises andmebaasis on
+# osa tabeleid juba olemas, seega luuakse ainult puuduvad tabelid, veerud ja
+# indeksid ning olemasolevad andmed jäävad alles.
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+def _create_table(name, *columns):
+    if not _inspector().has_table(name):
+        op.create_table(name, *columns)
+
+def _create_index(name, table, columns, unique=False):
+    existing = {index["name"] for index in _inspector().get_indexes(table)}
+    if name not in existing:
+        op.create_index(name, table, columns, unique=unique)
+
+def upgrade() -> None:
+    _create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String()),
+        sa.Column("password_hash", sa.String()),
+        sa.Column("is_local_auth", sa.Boolean()),
+        sa.Column("language", sa.String()),
+    )
+    _create_index("ix_users_id", "users", ["id"])
+    _create_index("ix_users_username", "users", ["username"], unique=True)
+
+    _create_table(
+        "sound_blobs",
+        sa.Column("hash", sa.String(), primary_key=True),
+        sa.Column("size", sa.Integer()),
+        sa.Column("ref_count", sa.Integer()),
+    )
+
+    _create_table(
+        "sounds",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("filename", sa.String()),
+        sa.Column("content_hash", sa.String(), sa.ForeignKey("sound_blobs.hash"), nullable=True),
+    )
+    # Sisu räsi lisati helinatele hiljem
+    if "content_hash" not in {column["name"] for column in _inspector().get_columns("sounds")}:
+        with op.batch_alter_table("sounds") as batch:
+            batch.add_column(sa.Column("content_hash", sa.String(), nullable=True))
+            batch.create_foreign_key("fk_sounds_content_hash", "sound_blobs", ["content_hash"], ["hash"])
+    _create_index("ix_sounds_id", "sounds", ["id"])
+    _create_index("ix_sounds_content_hash", "sounds", ["content_hash"])
+
+    _create_table(
+        "timetables",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("valid_from", sa.Date()),
+        sa.Column("valid_until", sa.Date(), nullable=True),
+        sa.Column("weekdays", sa.Integer()),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+    )
+    _create_index("ix_timetables_id", "timetables", ["id"])
+    _create_index("ix_timetables_name", "timetables", ["name"])
+    _create_index("ix_timetables_user_validity", "timetables", ["user_id", "valid_from", "valid_until"])
+
+    _create_table(
+        "timetable_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("timetable_id", sa.Integer(), sa.ForeignKey("timetables.id", ondelete="CASCADE")),
+        sa.Column("event_name", sa.String()),
+        sa.Column("event_time", sa.Time()),
+        sa.Column("sound_id", sa.Integer(), sa.ForeignKey("sounds.id")),
+        sa.Column("template_instance_id", sa.Integer(), nullable=True),
+        sa.Column("is_template_base", sa.Boolean()),
+    )
+    _create_index("ix_timetable_events_id", "timetable_events", ["id"])
+
+    _create_table(
+        "event_templates",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String()),
+        sa.Column("description", sa.String(), nullable=True),
+    )
+    _create_index("ix_event_templates_id", "event_templates", ["id"])
+
+    _create_table(
+        "event_template_items",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("template_id", sa.Integer(), sa.ForeignKey("event_templates.id", ondelete="CASCADE")),
+        sa.Column("offset_minutes", sa.Integer()),
+        sa.Column("event_name", sa.String()),
+        sa.Column("sound_id", sa.Integer(), sa.ForeignKey("sounds.id")),
+    )
+    _create_index("ix_event_template_items_id", "event_template_items", ["id"])
+
+    _create_table(
+        "holidays",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("valid_from", sa.Date()),
+        sa.Column("valid_until", sa.Date()),
+    )
+    _create_index("ix_holidays_id", "holidays", ["id"])
+    _create_index("ix_holidays_range", "holidays", ["valid_from", "valid_until"])
+
+def downgrade() -> None:
+    for table in (
+        "holidays",
+        "event_template_items",
+        "event_templates",
+        "timetable_events",
+        "timetables",
+        "sounds",
+        "sound_blobs",
+        "users",
+    ):
+        op.drop_table(table)
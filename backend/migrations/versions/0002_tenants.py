@@ -0,0 +1,81 @@
+"""Koolid (tenants)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+DEFAULT_TENANT_ID = 1
+
+# Kõik olemasolevad andmed kuuluvad vaikimisi koolile
+TENANT_TABLES = (
+    "users",
+    "timetables",
+    "timetable_events",
+    "event_templates",
+    "event_template_items",
+    "sounds",
+    "holidays",
+)
+
+def upgrade() -> None:
+    op.create_table(
+        "tenants",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("slug", sa.String(), nullable=False, unique=True),
+        sa.Column("name", sa.String()),
+    )
+    op.execute(
+        sa.text("INSERT INTO tenants (id, slug, name) VALUES (:id, 'default', 'Vaikimisi kool')")
+        .bindparams(id=DEFAULT_TENANT_ID)
+    )
+
+    for table in TENANT_TABLES:
+        with op.batch_alter_table(table) as batch:
+            batch.add_column(sa.Column(
+                "tenant_id", sa.Integer(), nullable=False, server_default=str(DEFAULT_TENANT_ID)
+            ))
+            batch.create_foreign_key(f"fk_{table}_tenant_id", "tenants", ["tenant_id"], ["id"])
+
+    # Kasutajanimi on unikaalne kooli piires
+    op.drop_index("ix_users_username", table_name="users")
+    op.create_index("ix_users_tenant_username", "users", ["tenant_id", "username"], unique=True)
+
+    op.create_index("ix_timetables_tenant_name", "timetables", ["tenant_id", "name"])
+    op.create_index(
+        "ix_timetable_events_tenant_timetable", "timetable_events", ["tenant_id", "timetable_id", "event_time"]
+    )
+    op.create_index("ix_event_templates_tenant", "event_templates", ["tenant_id", "id"])
+    op.create_index(
+        "ix_event_template_items_tenant_template", "event_template_items", ["tenant_id", "template_id"]
+    )
+    op.create_index("ix_sounds_tenant_name", "sounds", ["tenant_id", "name"])
+    op.create_index("ix_sounds_tenant_content_hash", "sounds", ["tenant_id", "content_hash"])
+    op.drop_index("ix_holidays_range", table_name="holidays")
+    op.create_index("ix_holidays_tenant_range", "holidays", ["tenant_id", "valid_from", "valid_until"])
+
+def downgrade() -> None:
+    op.drop_index("ix_holidays_tenant_range", table_name="holidays")
+    op.create_index("ix_holidays_range", "holidays", ["valid_from", "valid_until"])
+    op.drop_index("ix_sounds_tenant_content_hash", table_name="sounds")
+    op.drop_index("ix_sounds_tenant_name", table_name="sounds")
+    op.drop_index("ix_event_template_items_tenant_template", table_name="event_template_items")
+    op.drop_index("ix_event_templates_tenant", table_name="event_templates")
+    op.drop_index("ix_timetable_events_tenant_timetable", table_name="timetable_events")
+    op.drop_index("ix_timetables_tenant_name", table_name="timetables")
+    op.drop_index("ix_users_tenant_username", table_name="users")
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    for table in TENANT_TABLES:
+        with op.batch_alter_table(table) as batch:
+            batch.drop_constraint(f"fk_{table}_tenant_id", type_="foreignkey")
+            batch.drop_column("tenant_id")
+
+    op.drop_table("tenants")
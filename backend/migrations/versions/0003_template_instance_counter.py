@@ -0,0 +1,32 @@
+"""Malli instantside loendur
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# Järgmine vaba malli instantsi id kooli kohta; varem arvutati see
+# rakendamisel MAX(template_instance_id) + 1 abil, mis polnud samaaegsete
+# päringute korral ohutu
+
+def upgrade() -> None:
+    with op.batch_alter_table("tenants") as batch:
+        batch.add_column(sa.Column(
+            "next_template_instance_id", sa.Integer(), nullable=False, server_default="1"
+        ))
+    op.execute(
+        "UPDATE tenants SET next_template_instance_id = COALESCE(("
+        "SELECT MAX(template_instance_id) FROM timetable_events "
+        "WHERE timetable_events.tenant_id = tenants.id), 0) + 1"
+    )
+
+def downgrade() -> None:
+    with op.batch_alter_table("tenants") as batch:
+        batch.drop_column("next_template_instance_id")
@@ -0,0 +1,72 @@
+import os
+import shutil
+import sys
+import tempfile
+import pytest
+
+# Testid kasutavad ajutist andmebaasi ja kaustu. Seaded loetakse app paketi
+# importimisel, seega konfiguratsioon kirjutatakse enne esimest importi.
+
+BACKEND_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+WORK_DIRECTORY = tempfile.mkdtemp(prefix="lible-test-")
+
+TEST_USERNAME = "admin"
+TEST_PASSWORD = "admin123"
+
+def _prepare_environment(work: str) -> None:
+    config_path = os.path.join(work, "config.yaml")
+    with open(config_path, "w", encoding="utf-8") as f:
+        f.write(
+            "database:\n"
+            f"  url: sqlite:///{os.path.join(work, 'test.db')}\n"
+            "audio:\n"
+            f"  storage_path: {os.path.join(work, 'sounds')}\n"
+            "tenancy:\n"
+            f"  directory: {os.path.join(work, 'tenants')}\n"
+            "profiling:\n"
+            f"  directory: {os.path.join(work, 'profiles')}\n"
+            "playlist:\n"
+            f"  directory: {os.path.join(work, 'playlists')}\n"
+        )
+    os.environ["LIBLE_CONFIG"] = config_path
+    if BACKEND_DIRECTORY not in sys.path:
+        sys.path.insert(0, BACKEND_DIRECTORY)
+
+_prepare_environment(WORK_DIRECTORY)
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK_DIRECTORY, ignore_errors=True)
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app import migrate, models, security
+    from app.database import SessionLocal
+    from app.main import app
+
+    migrate.ensure_schema()
+    db = SessionLocal()
+    try:
+        db.add(models.User(username=TEST_USERNAME, password_hash=security.get_password_hash(TEST_PASSWORD)))
+        db.commit()
+    finally:
+        db.close()
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    response = client.post("/token", data={"username": TEST_USERNAME, "password": TEST_PASSWORD})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture
+def sound(client, auth_headers):
+    response = client.post(
+        "/sounds",
+        headers=auth_headers,
+        data={"name": "Kell"},
+        files={"sound_file": ("kell.mp3", b"ID3" + os.urandom(256), "audio/mpeg")},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
@@ -0,0 +1,52 @@
+import io
+
+def _timetables(client, headers):
+    response = client.get("/timetables", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def _import(client, headers, data: bytes):
+    return client.post(
+        "/import", headers=headers, files={"archive_file": ("lible-export.ndjson", io.BytesIO(data))}
+    )
+
+def test_reimport_rejects_conflicting_timetables(client, auth_headers, sound):
+    timetable = client.post("/timetables", headers=auth_headers, json={
+        "name": "Arhiiv", "valid_from": "2031-01-01", "valid_until": "2031-06-30", "weekdays": 31,
+    }).json()
+    response = client.post(f"/timetables/{timetable['id']}/events", headers=auth_headers, json={
+        "event_name": "Tund", "event_time": "08:00:00", "sound_id": sound["id"],
+    })
+    assert response.status_code == 200, response.text
+    exported = client.get("/export", headers=auth_headers).content
+    before = _timetables(client, auth_headers)
+
+    response = _import(client, auth_headers, exported)
+
+    assert response.status_code == 400
+    assert "'Arhiiv': sama nimega tunniplaan on juba olemas" in response.json()["detail"]
+    assert "kattub sama prioriteediga tunniplaaniga 'Arhiiv'" in response.json()["detail"]
+    assert _timetables(client, auth_headers) == before
+
+    # Kustutatud tunniplaan taastatakse koos sündmustega
+    assert client.delete(f"/timetables/{timetable['id']}", headers=auth_headers).status_code == 200
+    response = _import(client, auth_headers, exported)
+    assert response.status_code == 200, response.text
+    restored = [t for t in _timetables(client, auth_headers) if t["name"] == "Arhiiv"]
+    assert len(restored) == 1
+    events = client.get(f"/timetables/{restored[0]['id']}/events", headers=auth_headers).json()
+    assert [event["event_name"] for event in events] == ["Tund"]
+
+def test_import_rejects_overlap_within_archive(client, auth_headers):
+    lines = [
+        '{"type": "lible-export", "version": 1}',
+        '{"type": "timetable", "id": 1, "name": "Kevad A", "valid_from": "2032-03-01", '
+        '"valid_until": "2032-05-31", "weekdays": 3}',
+        '{"type": "timetable", "id": 2, "name": "Kevad B", "valid_from": "2032-05-01", '
+        '"valid_until": "2032-06-30", "weekdays": 2}',
+    ]
+    response = _import(client, auth_headers, "\n".join(lines).encode())
+
+    assert response.status_code == 400
+    assert "'Kevad B': kattub sama prioriteediga tunniplaaniga 'Kevad A'" in response.json()["detail"]
+    assert not [t for t in _timetables(client, auth_headers) if t["name"].startswith("Kevad")]
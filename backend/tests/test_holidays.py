@@ -0,0 +1,31 @@
+from datetime import date, timedelta
+
+def _holidays(client, headers):
+    response = client.get("/holidays", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_large_calendar_import_merges_with_existing(client, auth_headers):
+    touched = client.post("/holidays", headers=auth_headers, json={
+        "valid_from": "2040-01-02", "valid_until": "2040-01-02",
+    }).json()
+    untouched = client.post("/holidays", headers=auth_headers, json={
+        "valid_from": "2049-06-01", "valid_until": "2049-06-05",
+    }).json()
+
+    # Üle 1000 eraldi vahemiku (SQLite'i avaldise sügavuse piir)
+    days = [date(2040, 1, 1) + timedelta(days=2 * i) for i in range(1500)] + [date(2050, 1, 1)]
+    text = "algus\n" + "\n".join(day.isoformat() for day in days)
+    response = client.post("/holidays/import", headers=auth_headers, files={
+        "calendar_file": ("pühad.csv", text.encode()),
+    })
+    assert response.status_code == 200, response.text
+
+    holidays = {(h["valid_from"], h["valid_until"]): h["id"] for h in _holidays(client, auth_headers)}
+    # Kõrvuti asetsev olemasolev püha liideti imporditud päevadega
+    assert ("2040-01-01", "2040-01-03") in holidays
+    assert touched["id"] not in holidays.values()
+    # Akna sees, kuid puutumata püha jäi muutmata
+    assert holidays[("2049-06-01", "2049-06-05")] == untouched["id"]
+    assert ("2050-01-01", "2050-01-01") in holidays
+    assert len([key for key in holidays if "2040" <= key[0] < "2050"]) == 1500
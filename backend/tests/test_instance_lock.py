@@ -0,0 +1,24 @@
+import os
+import pytest
+from app.instance_lock import InstanceLock, InstanceLocked, lock_path
+from conftest import WORK_DIRECTORY
+
+def test_lock_file_is_next_to_sqlite_database():
+    assert lock_path("sqlite:////srv/lible/schoolbell.db") == "/srv/lible/schoolbell.db.lock"
+    assert lock_path() == os.path.join(WORK_DIRECTORY, "test.db.lock")
+
+def test_second_process_cannot_start(client):
+    # Käivitatud rakendus hoiab lukku; teine protsess avaks oma lukufaili
+    with pytest.raises(InstanceLocked, match=str(os.getpid())):
+        InstanceLock().acquire()
+
+def test_lock_is_released(tmp_path):
+    path = str(tmp_path / "lible.db.lock")
+    first = InstanceLock(path)
+    first.acquire()
+    with pytest.raises(InstanceLocked):
+        InstanceLock(path).acquire()
+    first.release()
+    second = InstanceLock(path)
+    second.acquire()
+    second.release()
@@ -0,0 +1,16 @@
+from app import main
+
+def test_metrics_require_login(client, auth_headers):
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer vale"}).status_code == 401
+
+    response = client.get("/metrics", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert "lible_" in response.text
+
+def test_metrics_allowed_address_skips_login(client, monkeypatch):
+    # TestClient'i kliendi aadress on "testclient"
+    monkeypatch.setattr(main, "METRICS_ALLOW", {"testclient"})
+
+    assert client.get("/metrics").status_code == 200
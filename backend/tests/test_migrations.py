@@ -0,0 +1,119 @@
+import pytest
+from app import migrate
+from app.config import DatabaseSettings
+from app.database import create_db_engine
+
+# Skeem, mille lõi create_all() enne migratsioone (algne models.py)
+BASELINE_SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY, username VARCHAR, password_hash VARCHAR,
+    is_local_auth BOOLEAN, language VARCHAR
+);
+CREATE INDEX ix_users_id ON users (id);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE TABLE sounds (id INTEGER PRIMARY KEY, name VARCHAR, filename VARCHAR);
+CREATE INDEX ix_sounds_id ON sounds (id);
+CREATE TABLE timetables (
+    id INTEGER PRIMARY KEY, name VARCHAR, valid_from DATE, valid_until DATE,
+    weekdays INTEGER, user_id INTEGER REFERENCES users (id)
+);
+CREATE INDEX ix_timetables_id ON timetables (id);
+CREATE INDEX ix_timetables_name ON timetables (name);
+CREATE TABLE timetable_events (
+    id INTEGER PRIMARY KEY,
+    timetable_id INTEGER REFERENCES timetables (id) ON DELETE CASCADE,
+    event_name VARCHAR, event_time TIME, sound_id INTEGER REFERENCES sounds (id),
+    template_instance_id INTEGER, is_template_base BOOLEAN
+);
+CREATE INDEX ix_timetable_events_id ON timetable_events (id);
+CREATE TABLE event_templates (id INTEGER PRIMARY KEY, name VARCHAR, description VARCHAR);
+CREATE INDEX ix_event_templates_id ON event_templates (id);
+CREATE TABLE event_template_items (
+    id INTEGER PRIMARY KEY,
+    template_id INTEGER REFERENCES event_templates (id) ON DELETE CASCADE,
+    offset_minutes INTEGER, event_name VARCHAR, sound_id INTEGER REFERENCES sounds (id)
+);
+CREATE INDEX ix_event_template_items_id ON event_template_items (id);
+CREATE TABLE holidays (id INTEGER PRIMARY KEY, valid_from DATE, valid_until DATE);
+CREATE INDEX ix_holidays_id ON holidays (id);
+"""
+
+SEED = """
+INSERT INTO users (id, username, password_hash, is_local_auth, language) VALUES (1, 'admin', 'x', 1, 'et');
+INSERT INTO sounds (id, name, filename) VALUES (1, 'Kell', 'kell.mp3');
+INSERT INTO timetables (id, name, valid_from, valid_until, weekdays, user_id)
+    VALUES (1, 'Tavaline', '2024-09-01', NULL, 31, 1);
+INSERT INTO timetable_events (id, timetable_id, event_name, event_time, sound_id, template_instance_id, is_template_base)
+    VALUES (1, 1, 'Tund', '08:00:00.000000', 1, 5, 1);
+INSERT INTO event_templates (id, name, description) VALUES (1, 'Tund', NULL);
+INSERT INTO event_template_items (id, template_id, offset_minutes, event_name, sound_id)
+    VALUES (1, 1, 0, 'Algus', 1);
+INSERT INTO holidays (id, valid_from, valid_until) VALUES (1, '2024-12-23', '2025-01-05');
+"""
+
+TABLES = (
+    "users",
+    "sounds",
+    "timetables",
+    "timetable_events",
+    "event_templates",
+    "event_template_items",
+    "holidays",
+)
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_db_engine(DatabaseSettings(url=f"sqlite:///{tmp_path / 'lible.db'}"))
+    yield engine
+    engine.dispose()
+
+def _execute_script(engine, script: str) -> None:
+    with engine.begin() as connection:
+        for statement in script.split(";"):
+            if statement.strip():
+                connection.exec_driver_sql(statement)
+
+def _counts(engine):
+    with engine.connect() as connection:
+        return {
+            table: connection.exec_driver_sql(f"SELECT COUNT(*) FROM {table}").scalar()
+            for table in TABLES
+        }
+
+def _assert_consistent(engine) -> None:
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA foreign_key_check").fetchall() == []
+        # Kontroll lülitatakse pärast migratsiooni uuesti sisse
+        assert connection.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+        # Malli instantside loendur jätkab olemasolevate id-de järelt
+        assert connection.exec_driver_sql("SELECT next_template_instance_id FROM tenants").scalar() == 6
+
+def test_upgrade_populated_baseline_to_head(engine):
+    _execute_script(engine, BASELINE_SCHEMA)
+    _execute_script(engine, SEED)
+    before = _counts(engine)
+
+    migrate.upgrade_database(engine)
+
+    assert migrate.current_revision(engine) == migrate.HEAD_REVISION
+    assert _counts(engine) == before
+    _assert_consistent(engine)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT content_hash FROM sounds").scalar() is None
+
+def test_upgrade_populated_0001_to_head(engine):
+    migrate.upgrade_database(engine, "0001")
+    _execute_script(engine, SEED)
+    before = _counts(engine)
+
+    migrate.upgrade_database(engine)
+
+    assert migrate.current_revision(engine) == migrate.HEAD_REVISION
+    assert _counts(engine) == before
+    _assert_consistent(engine)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("SELECT id, slug FROM tenants").fetchall() == [(1, "default")]
+        # Olemasolevad read kuuluvad vaikimisi koolile
+        for table in TABLES:
+            tenant_ids = connection.exec_driver_sql(f"SELECT DISTINCT tenant_id FROM {table}").scalars().all()
+            assert tenant_ids == [1], table
@@ -0,0 +1,76 @@
+from datetime import time
+from app import models, telemetry
+from app.database import SessionLocal
+from app.response_cache import response_cache
+
+# Loendipäringute SQL-päringute arv ei tohi sõltuda ridade arvust (N+1).
+# Päringud loendab telemeetria vahevara count_queries() plokis.
+
+def _queries(client, headers, url: str, route: str):
+    # Vahemälust vastust ei mõõdeta
+    response_cache.clear()
+    histogram = telemetry.sql_queries.labels(route)
+    before = histogram.sum
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.text
+    return histogram.sum - before, response.json()
+
+def _add_templates(count: int, sound_id: int) -> None:
+    db = SessionLocal()
+    try:
+        for i in range(count):
+            template = models.EventTemplate(tenant_id=models.DEFAULT_TENANT_ID, name=f"Mall {i}")
+            template.items = [
+                models.EventTemplateItem(
+                    tenant_id=models.DEFAULT_TENANT_ID, offset_minutes=offset,
+                    event_name=f"Osa {offset}", sound_id=sound_id,
+                )
+                for offset in (0, 45, 90)
+            ]
+            db.add(template)
+        db.commit()
+    finally:
+        db.close()
+
+def _add_events(timetable_id: int, count: int, sound_id: int) -> None:
+    db = SessionLocal()
+    try:
+        db.add_all(
+            models.TimetableEvent(
+                tenant_id=models.DEFAULT_TENANT_ID, timetable_id=timetable_id,
+                event_name=f"Tund {i}", event_time=time(7 + i // 60, i % 60), sound_id=sound_id,
+            )
+            for i in range(count)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def test_templates_query_count_is_constant(client, auth_headers, sound):
+    _queries(client, auth_headers, "/templates", "/templates")
+
+    _add_templates(3, sound["id"])
+    small, templates = _queries(client, auth_headers, "/templates", "/templates")
+    _add_templates(40, sound["id"])
+    large, more_templates = _queries(client, auth_headers, "/templates", "/templates")
+
+    assert len(more_templates) == len(templates) + 40
+    assert all(len(template["items"]) == 3 for template in more_templates)
+    assert large == small
+
+def test_timetable_events_query_count_is_constant(client, auth_headers, sound):
+    timetable = client.post("/timetables", headers=auth_headers, json={
+        "name": "Päringud", "valid_from": "2033-01-01", "valid_until": "2033-06-30", "weekdays": 31,
+    }).json()
+    url = f"/timetables/{timetable['id']}/events"
+    route = "/timetables/{timetable_id}/events"
+    _queries(client, auth_headers, url, route)
+
+    _add_events(timetable["id"], 3, sound["id"])
+    small, events = _queries(client, auth_headers, url, route)
+    _add_events(timetable["id"], 60, sound["id"])
+    large, more_events = _queries(client, auth_headers, url, route)
+
+    assert len(events) == 3
+    assert len(more_events) == 63
+    assert large == small
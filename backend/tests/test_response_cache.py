@@ -0,0 +1,59 @@
+from app import changes
+from app.response_cache import response_cache, response_cache_hits
+from app.revisions import revisions
+from app.schedule import schedule_engines
+
+def test_cached_list_is_invalidated_by_write(client, auth_headers):
+    hits = response_cache_hits.labels(route="/timetables")
+    client.get("/timetables", headers=auth_headers)
+    before = hits.value
+    first = client.get("/timetables", headers=auth_headers)
+    assert hits.value == before + 1
+
+    response = client.post("/timetables", headers=auth_headers, json={
+        "name": "Vahemälu", "valid_from": "2036-01-01", "valid_until": "2036-06-30", "weekdays": 31,
+    })
+    assert response.status_code == 200, response.text
+    second = client.get("/timetables", headers=auth_headers)
+
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert "Vahemälu" in [t["name"] for t in second.json()]
+    assert "Vahemälu" not in [t["name"] for t in first.json()]
+
+def test_list_read_during_commit_never_pairs_new_etag_with_old_body(client, auth_headers):
+    # Nimekirja päring jookseb sündmustsüklis samal ajal, kui kirjutamise
+    # commit'i tellijad lõimede kogumis töötavad: iga etapi järel loetakse nimekiri
+    client.get("/timetables", headers=auth_headers)
+    reads = []
+
+    def spy(batch):
+        response = client.get("/timetables", headers=auth_headers)
+        reads.append((response.headers["ETag"], [t["name"] for t in response.json()]))
+
+    spies = []
+    for stage in (changes.DATA_CACHES, changes.RESPONSE_CACHE, changes.REVISIONS):
+        # Etapi viimane tellija
+        spies.append(lambda batch, stage=stage: spy(batch))
+        changes.subscribe(spies[-1], stage)
+    try:
+        response = client.post("/timetables", headers=auth_headers, json={
+            "name": "Vahepeal", "valid_from": "2037-01-01", "valid_until": "2037-06-30", "weekdays": 31,
+        })
+        assert response.status_code == 200, response.text
+    finally:
+        for listener in spies:
+            changes.unsubscribe(listener)
+
+    assert len(reads) == 3
+    for etag, names in reads:
+        revalidated = client.get("/timetables", headers={**auth_headers, "If-None-Match": etag})
+        if revalidated.status_code == 304:
+            # Kehtivaks jäänud ETag peab kuuluma uuele nimekirjale
+            assert "Vahepeal" in names
+        else:
+            assert "Vahepeal" in [t["name"] for t in revalidated.json()]
+
+def test_response_cache_is_invalidated_before_revision_bump():
+    order = [listener for _, listener in changes._listeners]
+    assert order.index(schedule_engines.apply_changes) < order.index(response_cache.apply_changes)
+    assert order.index(response_cache.apply_changes) < order.index(revisions.apply_changes)
@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+from conftest import BACKEND_DIRECTORY
+
+def _ring_callback(tmp_path, ring_in_process: bool) -> str:
+    # Seade loetakse importimisel, seega kontrollitakse eraldi protsessis
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(
+        "database:\n"
+        f"  url: sqlite:///{tmp_path / 'lible.db'}\n"
+        "scheduler:\n"
+        f"  ring_in_process: {'true' if ring_in_process else 'false'}\n",
+        encoding="utf-8",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", "from app.scheduler import bell_schedulers as b; print(b.ring.__qualname__)"],
+        cwd=BACKEND_DIRECTORY,
+        env={**os.environ, "LIBLE_CONFIG": str(config_path)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+def test_rings_in_process_by_default(tmp_path):
+    assert _ring_callback(tmp_path, True) == "SoundCache.ring"
+
+def test_external_player_disables_in_process_ringing(tmp_path):
+    assert _ring_callback(tmp_path, False) == "_log_ring"
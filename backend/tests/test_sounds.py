@@ -0,0 +1,37 @@
+def _get(client, headers, sound, byte_range: str):
+    return client.get(f"/sounds/{sound['id']}", headers={**headers, "Range": byte_range})
+
+def test_range_returns_partial_content(client, auth_headers, sound):
+    full = client.get(f"/sounds/{sound['id']}", headers=auth_headers).content
+
+    response = _get(client, auth_headers, sound, "bytes=10-19")
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(full)}"
+    assert response.content == full[10:20]
+
+def test_invalid_range_is_ignored(client, auth_headers, sound):
+    full = client.get(f"/sounds/{sound['id']}", headers=auth_headers).content
+
+    for byte_range in ("bytes=10-5", "bytes=--5", "bytes=-", "bytes=a-b"):
+        response = _get(client, auth_headers, sound, byte_range)
+        assert response.status_code == 200, byte_range
+        assert response.content == full
+
+def test_unsatisfiable_range_is_rejected(client, auth_headers, sound):
+    size = len(client.get(f"/sounds/{sound['id']}", headers=auth_headers).content)
+
+    response = _get(client, auth_headers, sound, f"bytes={size}-{size + 10}")
+
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{size}"
+
+def test_stale_if_range_sends_whole_file(client, auth_headers, sound):
+    full = client.get(f"/sounds/{sound['id']}", headers=auth_headers).content
+
+    response = client.get(
+        f"/sounds/{sound['id']}", headers={**auth_headers, "Range": "bytes=0-9", "If-Range": '"muu"'}
+    )
+
+    assert response.status_code == 200
+    assert response.content == full
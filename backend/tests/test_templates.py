@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+def _template(client, headers, sound_id: int, name: str):
+    response = client.post("/templates", headers=headers, json={
+        "name": name,
+        "items": [
+            {"offset_minutes": 0, "event_name": "Algus", "sound_id": sound_id},
+            {"offset_minutes": 45, "event_name": "Lõpp", "sound_id": sound_id},
+        ],
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def _timetable(client, headers, name: str, valid_from: str, valid_until: str):
+    response = client.post("/timetables", headers=headers, json={
+        "name": name, "valid_from": valid_from, "valid_until": valid_until, "weekdays": 31,
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_concurrent_apply_gets_distinct_instances(client, auth_headers, sound):
+    template = _template(client, auth_headers, sound["id"], "Paralleelne")
+    timetable = _timetable(client, auth_headers, "Paralleelne", "2034-01-01", "2034-06-30")
+
+    def apply(hour: int):
+        response = client.post(f"/timetables/{timetable['id']}/apply-template", headers=auth_headers, json={
+            "template_id": template["id"], "base_times": [f"{hour:02d}:00:00"],
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(apply, range(8, 16)))
+
+    instances = [{event["template_instance_id"] for event in events} for events in results]
+    assert all(len(ids) == 1 for ids in instances)
+    assert len(set.union(*instances)) == len(results)
+
+def test_import_allocates_new_instances(client, auth_headers, sound):
+    template = _template(client, auth_headers, sound["id"], "Imporditav")
+    timetable = _timetable(client, auth_headers, "Olemasolev", "2035-01-01", "2035-06-30")
+    applied = client.post(f"/timetables/{timetable['id']}/apply-template", headers=auth_headers, json={
+        "template_id": template["id"], "base_times": ["08:00:00"],
+    }).json()
+    existing = applied[0]["template_instance_id"]
+
+    # Arhiivis on sama instantsi id, mis juba kasutusel
+    lines = [
+        '{"type": "lible-export", "version": 1}',
+        f'{{"type": "sound", "id": 1, "name": "{sound["name"]}", "content_hash": null}}',
+        '{"type": "timetable", "id": 1, "name": "Imporditud", "valid_from": "2035-07-01", '
+        '"valid_until": "2035-12-31", "weekdays": 31}',
+    ] + [
+        f'{{"type": "event", "timetable_id": 1, "event_name": "{name}", "event_time": "{at}", '
+        f'"sound_id": 1, "template_instance_id": {existing}, "is_template_base": {base}}}'
+        for name, at, base in (("Algus", "08:00:00", "true"), ("Lõpp", "08:45:00", "false"))
+    ]
+    response = client.post("/import", headers=auth_headers, files={
+        "archive_file": ("lible-export.ndjson", "\n".join(lines).encode()),
+    })
+    assert response.status_code == 200, response.text
+
+    imported = next(t for t in client.get("/timetables", headers=auth_headers).json() if t["name"] == "Imporditud")
+    events = client.get(f"/timetables/{imported['id']}/events", headers=auth_headers).json()
+    instance_ids = {event["template_instance_id"] for event in events}
+    assert len(instance_ids) == 1
+    assert existing not in instance_ids
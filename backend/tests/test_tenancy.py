@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+from conftest import BACKEND_DIRECTORY
+from app import tenancy
+
+LOGIN_SCRIPT = """
+from fastapi.testclient import TestClient
+from app.main import app
+
+with TestClient(app) as client:
+    response = client.post(
+        "/token", data={"username": "opetaja", "password": "parool123"}, headers={"X-Lible-Tenant": "kool-c"}
+    )
+    assert response.status_code == 200, response.text
+    token = response.json()["access_token"]
+    me = client.get("/users/me", headers={"Authorization": f"Bearer {token}"}).json()
+    print(me["username"], me["tenant_id"])
+"""
+
+def _login(client, username: str, password: str, tenant=None):
+    headers = {tenancy.TENANT_HEADER: tenant} if tenant else {}
+    return client.post("/token", data={"username": username, "password": password}, headers=headers)
+
+def test_create_user_logs_in_through_tenant_header(client):
+    assert tenancy.main(["create", "kool-b"]) == 0
+    assert tenancy.main(["create-user", "kool-b", "opetaja", "parool123"]) == 0
+    assert tenancy.main(["create-user", "kool-b", "opetaja", "parool123"]) == 1
+    assert tenancy.main(["create-user", "puudub", "opetaja", "parool123"]) == 1
+
+    response = _login(client, "opetaja", "parool123", "kool-b")
+    assert response.status_code == 200, response.text
+    me = client.get("/users/me", headers={"Authorization": f"Bearer {response.json()['access_token']}"}).json()
+    assert me["username"] == "opetaja"
+    assert me["tenant_id"] != 1
+    # Kasutaja kuulub ainult oma koolile
+    assert _login(client, "opetaja", "parool123").status_code == 401
+
+def test_create_user_writes_to_tenant_database(tmp_path):
+    # Igal koolil oma SQLite fail; seaded loetakse importimisel, seega eraldi protsessis
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(
+        "database:\n"
+        f"  url: sqlite:///{tmp_path / 'lible.db'}\n"
+        "audio:\n"
+        f"  storage_path: {tmp_path / 'sounds'}\n"
+        "tenancy:\n"
+        "  mode: sqlite_per_tenant\n"
+        f"  directory: {tmp_path / 'tenants'}\n",
+        encoding="utf-8",
+    )
+    env = {**os.environ, "LIBLE_CONFIG": str(config_path)}
+
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, *args], cwd=BACKEND_DIRECTORY, env=env, capture_output=True, text=True, check=True
+        ).stdout
+
+    run("-m", "app.tenancy", "create", "kool-c")
+    run("-m", "app.tenancy", "create-user", "kool-c", "opetaja", "parool123")
+
+    assert (tmp_path / "tenants" / "kool-c" / "lible.db").exists()
+    assert run("-c", LOGIN_SCRIPT).split() == ["opetaja", "2"]
@@ -162,8 +162,8 @@ const TimetableDetailView: React.FC = () => {
     if (!timetable) return;
 
     try {
-      // TODO: Implement template application logic when backend supports it
-      console.log('Applying template:', templateId, 'with base time:', baseTime);
+      const createdEvents = await timetables.applyTemplate(timetable.id, templateId, [baseTime]);
+      setEvents([...events, ...createdEvents]);
     } catch (err) {
       console.error('Error applying template:', err);
       throw err;
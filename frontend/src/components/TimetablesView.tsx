@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Calendar, Plus, ChevronRight } from 'lucide-react';
-import { timetables } from '../services/api';
+import { timetables, updates } from '../services/api';
 import type { Timetable } from '../types/api';
 
 const WEEKDAYS = ['E', 'T', 'K', 'N', 'R', 'L', 'P'];
@@ -42,6 +42,12 @@ const TimetablesView: React.FC = () => {
     };
 
     loadTimetables();
+    // Laeme nimekirja uuesti, kui tunniplaane muudetakse (ka teises aknas)
+    return updates.connect((message) => {
+      if (message.type === 'changes' && message.changes.some(change => change.table === 'timetables')) {
+        loadTimetables();
+      }
+    });
   }, []);
 
   const handleCreateNew = () => {
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { AuthResponse, User, Timetable, EventTemplate, Sound, Holiday, TimetableEvent } from '../types/api';
+import { AuthResponse, User, Timetable, EventTemplate, Sound, Holiday, TimetableEvent, TimetableEventBatch, DaySchedule, CalendarDay, Bell, UpdateMessage, ListDelta } from '../types/api';
 
 const API_URL = 'http://localhost:8000';
 
@@ -30,7 +30,8 @@ const encodeFormData = (data: Record<string, string>) => {
 
 // Autentimisteenused
 export const auth = {
-  async login(username: string, password: string): Promise<AuthResponse> {
+  // tenant: kooli lühinimi; puudumisel logitakse sisse vaikimisi kooli
+  async login(username: string, password: string, tenant?: string): Promise<AuthResponse> {
     const formData = encodeFormData({
       username,
       password,
@@ -40,6 +41,7 @@ export const auth = {
     const response = await api.post<AuthResponse>('/token', formData, {
       headers: {
         'Content-Type': 'application/x-www-form-urlencoded',
+        ...(tenant ? { 'X-Lible-Tenant': tenant } : {}),
       },
     });
 
@@ -66,6 +68,17 @@ export const timetables = {
     return response.data;
   },
 
+  // Ainult revisjonist since alates muudetud ja kustutatud tunniplaanid
+  async getChanges(since: number): Promise<ListDelta<Timetable>> {
+    const response = await api.get<ListDelta<Timetable>>('/timetables', { params: { since } });
+    return response.data;
+  },
+
+  async getByDate(date: string): Promise<DaySchedule> {
+    const response = await api.get<DaySchedule>(`/timetables/by-date/${date}`);
+    return response.data;
+  },
+
   async getById(id: number): Promise<Timetable> {
     const response = await api.get<Timetable>(`/timetables/${id}`);
     return response.data;
@@ -102,6 +115,19 @@ export const timetables = {
 
   async deleteEvent(timetableId: number, eventId: number): Promise<void> {
     await api.delete(`/timetables/${timetableId}/events/${eventId}`);
+  },
+
+  async applyTemplate(timetableId: number, templateId: number, baseTimes: string[]): Promise<TimetableEvent[]> {
+    const response = await api.post<TimetableEvent[]>(`/timetables/${timetableId}/apply-template`, {
+      template_id: templateId,
+      base_times: baseTimes
+    });
+    return response.data;
+  },
+
+  async batchEvents(timetableId: number, batch: TimetableEventBatch): Promise<TimetableEvent[]> {
+    const response = await api.patch<TimetableEvent[]>(`/timetables/${timetableId}/events`, batch);
+    return response.data;
   }
 };
 
@@ -146,9 +172,85 @@ export const holidays = {
     return response.data;
   },
 
+  async getRange(from: string, to: string): Promise<Holiday[]> {
+    const response = await api.get<Holiday[]>('/holidays', { params: { from, to } });
+    return response.data;
+  },
+
   async create(data: Omit<Holiday, 'id'>): Promise<Holiday> {
     const response = await api.post<Holiday>('/holidays', data);
     return response.data;
+  },
+
+  async import(file: File): Promise<Holiday[]> {
+    const formData = new FormData();
+    formData.append('calendar_file', file);
+    const response = await api.post<Holiday[]>('/holidays/import', formData, {
+      headers: { 'Content-Type': 'multipart/form-data' }
+    });
+    return response.data;
+  }
+};
+
+// Kalendri teenused
+export const calendar = {
+  async getRange(from: string, to: string): Promise<CalendarDay[]> {
+    const response = await api.get<CalendarDay[]>('/calendar', { params: { from, to } });
+    return response.data;
+  }
+};
+
+// Kellade teenused
+export const bells = {
+  async getNext(count = 10, after?: string): Promise<Bell[]> {
+    const response = await api.get<Bell[]>('/bells/next', { params: { count, after } });
+    return response.data;
+  }
+};
+
+// Ekspordi ja impordi teenused
+export const archive = {
+  async export(format: 'json' | 'csv' | 'ics' = 'json'): Promise<Blob> {
+    const response = await api.get<Blob>('/export', { params: { format }, responseType: 'blob' });
+    return response.data;
+  },
+
+  async import(file: File): Promise<Record<string, number>> {
+    const formData = new FormData();
+    formData.append('archive_file', file);
+    const response = await api.post<Record<string, number>>('/import', formData, {
+      headers: { 'Content-Type': 'multipart/form-data' }
+    });
+    return response.data;
+  }
+};
+
+// Reaalajas teavitused (WebSocket)
+export const updates = {
+  connect(onMessage: (message: UpdateMessage) => void): () => void {
+    const token = localStorage.getItem('token') ?? '';
+    const url = `${API_URL.replace(/^http/, 'ws')}/ws?token=${encodeURIComponent(token)}`;
+    let socket: WebSocket | null = null;
+    let closed = false;
+    let retryTimer: ReturnType<typeof setTimeout> | undefined;
+
+    const open = () => {
+      socket = new WebSocket(url);
+      socket.onmessage = (event) => onMessage(JSON.parse(event.data) as UpdateMessage);
+      socket.onclose = () => {
+        // Ühenduse katkemisel proovime mõne aja pärast uuesti
+        if (!closed) {
+          retryTimer = setTimeout(open, 5000);
+        }
+      };
+    };
+
+    open();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      socket?.close();
+    };
   }
 };
 
@@ -1,5 +1,6 @@
 export interface User {
   id: number;
+  tenant_id: number;
   username: string;
   language: string;
   is_local_auth: boolean;
@@ -29,6 +30,12 @@ export interface TimetableEvent {
   is_template_base: boolean;
 }
 
+export interface TimetableEventBatch {
+  create?: Omit<TimetableEvent, 'id' | 'timetable_id'>[];
+  update?: Omit<TimetableEvent, 'timetable_id'>[];
+  delete?: number[];
+}
+
 export interface EventTemplate {
   id: number;
   name: string;
@@ -55,3 +62,45 @@ export interface Holiday {
   valid_from: string;
   valid_until: string;
 }
+
+export interface DaySchedule {
+  date: string;
+  is_holiday: boolean;
+  timetable: Timetable | null;
+  events: TimetableEvent[];
+}
+
+export interface CalendarDay {
+  date: string;
+  status: 'default' | 'special' | 'none';
+  is_holiday: boolean;
+  timetable_id: number | null;
+  events: TimetableEvent[];
+}
+
+export interface Bell {
+  at: string;
+  event_id: number;
+  timetable_id: number;
+  event_name: string;
+  sound_id: number;
+}
+
+export interface ChangeEvent {
+  table: string;
+  op: 'insert' | 'update' | 'delete';
+  id: number | null;
+  parent_id: number | null;
+}
+
+export type UpdateMessage =
+  | { type: 'hello'; next: Bell | null }
+  | { type: 'changes'; changes: ChangeEvent[] }
+  | { type: 'bell'; rang: Bell; next: Bell | null };
+
+export interface ListDelta<T> {
+  revision: number;
+  full: boolean;
+  changed: T[];
+  deleted: number[];
+}